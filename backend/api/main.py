@@ -6,8 +6,14 @@ logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(message)s",
 )
 from fastapi import FastAPI
-from backend.api.routers import image, prompt, kg, llm, agent, map as map_router
+from backend.api.routers import image, prompt, kg, llm, agent, rag, map as map_router
 from fastapi.middleware.cors import CORSMiddleware
+from backend.core.RAG.rag_manager import RAGManager
+from backend.core.RAG.ingestion_jobs import IngestionJobManager
+from backend.core.llm.llm_manager import LLMManager
+from backend.core.llm.session_cache import SessionCache
+from backend.config.settings import settings
+from backend.utils.logger import logger
 import uvicorn
 
 
@@ -35,6 +41,33 @@ app.include_router(llm.router, prefix="/api/llm", tags=["llm"])
 #app.include_router(llm.router, tags=["LLM Core"]) # *这一行修改了
 app.include_router(map_router.router, prefix="/api/map", tags=["map"])
 app.include_router(image.router, prefix="/api/image", tags=["image"])
+app.include_router(rag.router, prefix="/api/rag", tags=["rag"])
+
+
+
+@app.on_event("startup")
+async def startup_event():
+    # 打开会话日志（历史会话在首次访问时恢复）
+    try:
+        LLMManager.initialize()
+    except Exception as e:
+        logger.error(f"会话日志初始化失败: {e}", exc_info=True)
+    # 定期把空闲过期的 LLM 实例和 Agent 记忆写出并移出内存
+    SessionCache.start_sweeper(settings.SESSION_CACHE_SWEEP_INTERVAL)
+    # 启动时构建全局 RAG 引擎，后续请求直接复用
+    try:
+        RAGManager.initialize()
+    except Exception as e:
+        logger.error(f"RAG 引擎初始化失败: {e}", exc_info=True)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    IngestionJobManager.shutdown()
+    RAGManager.shutdown()
+    SessionCache.stop_sweeper()
+    LLMManager.shutdown()
+
 
 if __name__ == "__main__":
     uvicorn.run("backend.api.main:app",host="192.168.1.108", port=8000)
\ No newline at end of file
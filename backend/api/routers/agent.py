@@ -107,6 +107,12 @@ async def run_agent_task(request: AgentRunRequest):
             error=f"Agent failed to execute task: {str(e)}"
         )
 
+
+@router.get("/agent/memory/stats")
+async def get_agent_memory_cache_stats():
+    """常驻内存的 Agent 记忆数、估算常驻字节数与淘汰计数"""
+    return AgentManager.get_memory_cache_stats()
+
 # TODO: 如果需要实现intermediate_steps的捕获，可以考虑以下方案：
 # 1. 修改AgentStreamingCallbackHandler来捕获更多信息
 # 2. 在AgentManager中添加专门的方法来返回详细的执行步骤
@@ -5,6 +5,7 @@ from backend.core.llm.llm_manager import LLMManager
 from backend.utils.logger import logger
 from fastapi import Response
 from fastapi.responses import StreamingResponse, JSONResponse
+import asyncio
 import json
 import logging
 
@@ -29,6 +30,7 @@ class ChatRequest(BaseModel):
     temperature: Optional[float] = 0.7
     max_messages: Optional[int] = 50
     max_tokens: Optional[int] = 4000
+    rag_collections: Optional[List[str]] = None  # 检索的知识库集合，不传时使用默认集合
     # history_file_path: Optional[str] = None  # 移除
 
 
@@ -126,8 +128,8 @@ async def chat_with_llm(request: ChatRequest):
             target_instance_id = _create_instance_id(request.session_id, request.model_name)
 
             # 获取当前活跃的实例
-            current_active_instance_id = _get_active_instance_for_session(request.session_id)
-            current_instance = LLMManager.get_instance(current_active_instance_id) if current_active_instance_id else None
+            current_active_instance_id = await _get_active_instance_for_session(request.session_id)
+            current_instance = await LLMManager.aget_instance(current_active_instance_id) if current_active_instance_id else None
 
             # 发送开始标记
             yield f"data: {json.dumps({'type': 'start'})}\n\n"
@@ -137,15 +139,19 @@ async def chat_with_llm(request: ChatRequest):
                 previous_model = current_instance.model_name
                 yield f"data: {json.dumps({'type': 'model_switch', 'from': previous_model, 'to': request.model_name})}\n\n"
 
-                target_instance = LLMManager.get_instance(target_instance_id)
+                target_instance = await LLMManager.aget_instance(target_instance_id)
                 if not target_instance:
-                    target_instance = LLMManager.create_instance(
+                    target_instance = await LLMManager.acreate_instance(
                         instance_id=target_instance_id,
                         model_name=request.model_name,
                         temperature=request.temperature if request.temperature is not None else 0.7,
                         max_messages=request.max_messages if request.max_messages is not None else 50,
-                        max_tokens=request.max_tokens if request.max_tokens is not None else 4000
+                        max_tokens=request.max_tokens if request.max_tokens is not None else 4000,
+                        rag_collections=request.rag_collections if request.rag_collections is not None else current_instance.rag_collections,
+                        session_id=request.session_id
                     )
+                elif request.rag_collections is not None:
+                    target_instance.rag_collections = request.rag_collections
                 if current_instance:
                     target_instance.copy_memory_from(current_instance)
 
@@ -170,7 +176,8 @@ async def chat_with_llm(request: ChatRequest):
                         user_message=request.user_message,
                         model_name=request.model_name,
                         system_prompt_name=request.system_prompt_name or "default",
-                        create_if_not_exists=True
+                        create_if_not_exists=True,
+                        rag_collections=request.rag_collections
                     ):
                         if chunk and isinstance(chunk, str):
                             logging.debug(f"quick chunk (type={type(chunk)}): {repr(chunk)}")
@@ -182,9 +189,6 @@ async def chat_with_llm(request: ChatRequest):
 
             yield f"data: {json.dumps({'type': 'end'})}\n\n"
 
-            # 在对话结束后保存所有会话历史到json
-            LLMManager.save_all_sessions_to_json()
-
         except Exception as e:
             logging.error(f"LLM对话失败: {e}")
             yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
@@ -200,13 +204,61 @@ async def chat_with_llm(request: ChatRequest):
         }
     )
 
+@router.post("/qa/chat/complete", response_model=ChatResponse)
+async def chat_with_llm_complete(request: ChatRequest):
+    """非流式对话：与 /qa/chat 相同的模型切换、记忆、检索与持久化逻辑，完整回复一次性返回"""
+    model_name = request.model_name or "deepseek-chat"
+    if model_name not in LLMManager.get_available_models():
+        return ChatResponse(response_message="", model_name=model_name, status="fail",
+                            error=f"Invalid model_name: {model_name}")
+
+    try:
+        target_instance_id = _create_instance_id(request.session_id, model_name)
+        current_active_instance_id = await _get_active_instance_for_session(request.session_id)
+        current_instance = await LLMManager.aget_instance(current_active_instance_id) if current_active_instance_id else None
+
+        if current_instance and current_instance.model_name != model_name:
+            # 切换模型：目标实例继承当前实例的记忆
+            target_instance = await LLMManager.aget_instance(target_instance_id)
+            if not target_instance:
+                target_instance = await LLMManager.acreate_instance(
+                    instance_id=target_instance_id,
+                    model_name=model_name,
+                    temperature=request.temperature if request.temperature is not None else 0.7,
+                    max_messages=request.max_messages if request.max_messages is not None else 50,
+                    max_tokens=request.max_tokens if request.max_tokens is not None else 4000,
+                    rag_collections=request.rag_collections if request.rag_collections is not None else current_instance.rag_collections,
+                    session_id=request.session_id
+                )
+            elif request.rag_collections is not None:
+                target_instance.rag_collections = request.rag_collections
+            target_instance.copy_memory_from(current_instance)
+            reply = await target_instance.achat(request.user_message, request.system_prompt_name or "default")
+            return ChatResponse(response_message=reply, model_name=model_name, status="success",
+                                previous_model=current_instance.model_name, model_switched=True)
+
+        reply = await LLMManager.aquick_chat(
+            instance_id=target_instance_id,
+            user_message=request.user_message,
+            model_name=model_name,
+            system_prompt_name=request.system_prompt_name or "default",
+            create_if_not_exists=True,
+            rag_collections=request.rag_collections
+        )
+        return ChatResponse(response_message=reply, model_name=model_name, status="success")
+
+    except Exception as e:
+        logger.error(f"LLM对话失败: {e}")
+        return ChatResponse(response_message="", model_name=model_name, status="fail", error=str(e))
+
+
 @router.get("/qa/memory/{session_id}", response_model=HistoryResponse)
 async def get_conversation_history(session_id: str = Path(..., description="会话ID")):
     """获取指定会话的对话历史"""
     try:
         # 获取当前活跃的实例
-        current_active_instance_id = _get_active_instance_for_session(session_id)
-        current_instance = LLMManager.get_instance(current_active_instance_id) if current_active_instance_id else None
+        current_active_instance_id = await _get_active_instance_for_session(session_id)
+        current_instance = await LLMManager.aget_instance(current_active_instance_id) if current_active_instance_id else None
 
         if not current_instance:
             return HistoryResponse(
@@ -247,17 +299,11 @@ async def clear_conversation_history(session_id: str = Path(..., description="
     """清除指定会话的对话历史"""
     try:
         # 查找该会话相关的所有实例
-        all_instances = LLMManager.list_instances()
-
-        # 寻找匹配的实例（以session_id开头的实例）
-        matching_instances = [
-            instance_id for instance_id in all_instances.keys()
-            if instance_id.startswith(f"{session_id}_")
-        ]
+        matching_instances = await asyncio.to_thread(LLMManager.get_session_instances, session_id)
 
         cleared_count = 0
         for instance_id in matching_instances:
-            instance = LLMManager.get_instance(instance_id)
+            instance = await LLMManager.aget_instance(instance_id)
             if instance:
                 instance.clear_conversation()
                 cleared_count += 1
@@ -279,16 +325,15 @@ async def clear_conversation_history(session_id: str = Path(..., description="
 async def get_session_instances(session_id: str = Path(..., description="会话ID")):
     """获取指定会话的所有实例信息"""
     try:
-        all_instances = LLMManager.list_instances()
-
         # 查找该会话相关的所有实例
         session_instances = {}
-        for instance_id, instance_info in all_instances.items():
-            if instance_id.startswith(f"{session_id}_"):
-                session_instances[instance_id] = instance_info
+        for instance_id in await asyncio.to_thread(LLMManager.get_session_instances, session_id):
+            instance = await LLMManager.aget_instance(instance_id)
+            if instance:
+                session_instances[instance_id] = instance.get_stats()
 
         # 找到当前活跃的实例
-        current_active_instance_id = _get_active_instance_for_session(session_id)
+        current_active_instance_id = await _get_active_instance_for_session(session_id)
 
         return {
             "status": "success",
@@ -308,36 +353,33 @@ async def get_session_instances(session_id: str = Path(..., description="会话I
 
 @router.get("/qa/chat-history")
 async def get_chat_history():
-    """获取 chat_history.json 的全部内容"""
+    """获取全部已持久化的会话历史（session_id -> role/content 列表）"""
     try:
-        with open("chat_history.json", "r", encoding="utf-8") as f:
-            data = f.read()
-        # 直接返回原始内容（字符串），如果需要解析为json对象可用 json.loads(data)
-        return Response(content=data, media_type="application/json; charset=utf-8")
+        data = await asyncio.to_thread(LLMManager.export_sessions)
+        return JSONResponse(content=data, media_type="application/json; charset=utf-8")
     except Exception as e:
-        logger.error(f"读取 chat_history.json 失败: {e}")
-        raise HTTPException(status_code=500, detail="Failed to read chat_history.json")
+        logger.error(f"读取会话历史失败: {e}")
+        raise HTTPException(status_code=500, detail="Failed to read chat history")
 
 
-def _get_active_instance_for_session(session_id: str) -> Optional[str]:
-    """
-    获取会话的活跃实例ID
-    会话可能有多个不同模型的实例，我们需要找到最近使用的那个
-    """
-    all_instances = LLMManager.list_instances()
+@router.get("/qa/persistence/stats")
+async def get_persistence_stats():
+    """会话持久化写回队列的队列深度与刷盘耗时"""
+    return LLMManager.get_persistence_stats()
 
-    # 查找该会话相关的所有实例
-    matching_instances = []
-    for instance_id, instance_info in all_instances.items():
-        if instance_id.startswith(f"{session_id}_"):
-            matching_instances.append((instance_id, instance_info["updated_at"]))
 
-    if not matching_instances:
-        return None
+@router.get("/qa/cache/stats")
+async def get_session_cache_stats():
+    """常驻内存的 LLM 实例数、估算常驻字节数与淘汰计数"""
+    return LLMManager.get_cache_stats()
 
-    # 按照更新时间排序，返回最近使用的实例
-    matching_instances.sort(key=lambda x: x[1], reverse=True)
-    return matching_instances[0][0]
+
+async def _get_active_instance_for_session(session_id: str) -> Optional[str]:
+    """
+    获取会话的活跃实例ID
+    会话可能有多个不同模型的实例，由 LLMManager 的会话索引记录最近使用的那个
+    """
+    return await LLMManager.aget_active_instance_id(session_id)
 
 
 def _create_instance_id(session_id: str, model_name: str) -> str:
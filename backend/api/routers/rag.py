@@ -0,0 +1,145 @@
+from fastapi import APIRouter, HTTPException, UploadFile, File, Query
+from pydantic import BaseModel
+from typing import Optional, List, Dict, Any
+from backend.config.settings import settings
+from backend.core.RAG.rag_manager import RAGManager
+from backend.core.RAG.rag_engine import SUPPORTED_EXTENSIONS
+from backend.core.RAG.ingestion_jobs import IngestionJobManager
+from backend.utils.logger import logger
+import asyncio
+import os
+
+router = APIRouter()
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+class IngestionJobResponse(BaseModel):
+    job_id: str
+    collection: str
+    status: str  # queued / running / succeeded / failed
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    progress: Dict[str, int]  # files_total / files_done / chunks / new_chunks / embedded_chunks
+    stats: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+
+class UploadResponse(BaseModel):
+    collection: str
+    saved_files: List[str]
+    job: Optional[IngestionJobResponse] = None
+
+
+class SourceInfo(BaseModel):
+    source: str
+    size: int
+    modified_at: float
+    chunks: int
+    status: str  # indexed / pending / stale
+
+
+class DeleteSourceResponse(BaseModel):
+    collection: str
+    source: str
+    deleted_chunks: int
+
+
+def _get_doc_dir(collection: str) -> str:
+    try:
+        return RAGManager.get_doc_dir(collection)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+def _safe_source_name(filename: str) -> str:
+    """只保留文件名部分，拒绝不支持的格式"""
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    if not name or name.startswith("."):
+        raise HTTPException(status_code=400, detail=f"非法文件名: {filename}")
+    if not name.endswith(SUPPORTED_EXTENSIONS):
+        raise HTTPException(status_code=400, detail=f"不支持的文件格式: {name}，仅支持 {', '.join(SUPPORTED_EXTENSIONS)}")
+    return name
+
+
+@router.get("/collections")
+async def list_collections():
+    """列出已配置的知识库集合及加载状态"""
+    return RAGManager.list_collections()
+
+
+@router.post("/collections/{collection}/documents", response_model=UploadResponse)
+async def upload_documents(collection: str,
+                           files: List[UploadFile] = File(...),
+                           ingest: bool = Query(True, description="上传后是否立即启动入库任务")):
+    """上传文档到集合的文档目录（同名文件覆盖），可选立即启动后台入库"""
+    doc_dir = _get_doc_dir(collection)
+    os.makedirs(doc_dir, exist_ok=True)
+    names = [_safe_source_name(file.filename) for file in files]
+
+    saved = []
+    for file, name in zip(files, names):
+        target = os.path.join(doc_dir, name)
+        tmp_path = f"{target}.uploading"
+        size = 0
+        try:
+            # 先写临时文件再替换，入库任务不会读到写了一半的文件
+            with open(tmp_path, "wb") as f:
+                while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                    size += len(chunk)
+                    if size > settings.RAG_UPLOAD_MAX_BYTES:
+                        raise HTTPException(status_code=413, detail=f"文件 {name} 超过大小上限 {settings.RAG_UPLOAD_MAX_BYTES} 字节")
+                    await asyncio.to_thread(f.write, chunk)
+            os.replace(tmp_path, target)
+        finally:
+            await file.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        saved.append(name)
+        logger.info(f"已上传文档 {name} 到集合 {collection}（{size} 字节）")
+
+    job = IngestionJobManager.submit(collection).to_dict() if ingest and saved else None
+    return UploadResponse(collection=collection, saved_files=saved, job=job)
+
+
+@router.post("/collections/{collection}/jobs", response_model=IngestionJobResponse, status_code=202)
+async def start_ingestion(collection: str):
+    """启动集合的后台增量入库任务（已有排队中的任务时返回该任务）"""
+    _get_doc_dir(collection)
+    return IngestionJobManager.submit(collection).to_dict()
+
+
+@router.get("/jobs", response_model=List[IngestionJobResponse])
+async def list_jobs(collection: Optional[str] = None):
+    """列出最近的入库任务"""
+    return [job.to_dict() for job in IngestionJobManager.list_jobs(collection)]
+
+
+@router.get("/jobs/{job_id}", response_model=IngestionJobResponse)
+async def get_job(job_id: str):
+    """查询入库任务的状态与进度"""
+    job = IngestionJobManager.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"入库任务 {job_id} 不存在")
+    return job.to_dict()
+
+
+@router.get("/collections/{collection}/sources", response_model=List[SourceInfo])
+async def list_sources(collection: str):
+    """列出集合中的源文件及入库状态"""
+    _get_doc_dir(collection)
+    engine = await RAGManager.aget_engine(collection, auto_ingest=False)
+    return await asyncio.to_thread(engine.list_sources)
+
+
+@router.delete("/collections/{collection}/sources/{source}", response_model=DeleteSourceResponse)
+async def delete_source(collection: str, source: str):
+    """删除源文件并从索引中移除其全部分块"""
+    name = _safe_source_name(source)
+    _get_doc_dir(collection)
+    engine = await RAGManager.aget_engine(collection, auto_ingest=False)
+    deleted = await asyncio.to_thread(engine.remove_source, name)
+    if deleted < 0:
+        raise HTTPException(status_code=404, detail=f"来源 {name} 不存在")
+    return DeleteSourceResponse(collection=collection, source=name, deleted_chunks=deleted)
@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -16,17 +17,105 @@ class Settings:
     OPENWEATHERMAP_API_KEY = os.getenv("OPENWEATHERMAP_API_KEY")
 
 
-    # 会话历史json文件保存路径，写死为相对路径
-    CHAT_HISTORY_JSON_PATH = "chat_history.json"
+    # 会话历史日志（SQLite WAL）路径，以及后台压缩、落盘的间隔秒数（0 表示不启动后台压缩）
+    CHAT_JOURNAL_PATH = os.getenv("CHAT_JOURNAL_PATH", "chat_history.db")
+    CHAT_JOURNAL_COMPACT_INTERVAL = float(os.getenv("CHAT_JOURNAL_COMPACT_INTERVAL", 300))
+    # 会话写回队列：刷盘间隔秒数、待写实例数达到该值时提前刷盘
+    CHAT_PERSIST_FLUSH_INTERVAL = float(os.getenv("CHAT_PERSIST_FLUSH_INTERVAL", 1.0))
+    CHAT_PERSIST_MAX_PENDING = int(os.getenv("CHAT_PERSIST_MAX_PENDING", 256))
+    # 常驻内存的 LLM 实例上限：实例数、估算字节数、空闲秒数（0 表示不按空闲时间淘汰），超出时写入会话日志后移出内存
+    LLM_SESSION_CACHE_MAX_ENTRIES = int(os.getenv("LLM_SESSION_CACHE_MAX_ENTRIES", 1000))
+    LLM_SESSION_CACHE_MAX_BYTES = int(os.getenv("LLM_SESSION_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+    LLM_SESSION_IDLE_TTL = float(os.getenv("LLM_SESSION_IDLE_TTL", 1800))
+    # 常驻内存的 Agent 记忆上限，含义同上
+    AGENT_MEMORY_CACHE_MAX_ENTRIES = int(os.getenv("AGENT_MEMORY_CACHE_MAX_ENTRIES", 1000))
+    AGENT_MEMORY_CACHE_MAX_BYTES = int(os.getenv("AGENT_MEMORY_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    AGENT_MEMORY_IDLE_TTL = float(os.getenv("AGENT_MEMORY_IDLE_TTL", 1800))
+    # 后台清理空闲过期的 LLM 实例和 Agent 记忆的间隔秒数（0 表示只在访问时检查）
+    SESSION_CACHE_SWEEP_INTERVAL = float(os.getenv("SESSION_CACHE_SWEEP_INTERVAL", 60))
+
+    # RAG 向量索引持久化目录，重启后直接加载已有向量
+    RAG_INDEX_DIR = os.getenv(
+        "RAG_INDEX_DIR",
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "core", "RAG", "index")
+    )
+    # 分块向量的磁盘缓存目录，按嵌入模型和分块内容哈希复用已编码的向量
+    RAG_EMBEDDING_CACHE_DIR = os.getenv("RAG_EMBEDDING_CACHE_DIR", os.path.join(RAG_INDEX_DIR, "embedding_cache"))
+    # 嵌入后端："huggingface"（sentence-transformers，依赖 torch）、"onnx"（ONNX Runtime CPU）或 "hashing"（测试用）
+    RAG_EMBEDDING_BACKEND = os.getenv("RAG_EMBEDDING_BACKEND", "huggingface")
+    # onnx 后端是否使用 int8 动态量化模型，以及推理线程数（0 表示由 onnxruntime 决定）
+    RAG_EMBEDDING_ONNX_QUANTIZED = os.getenv("RAG_EMBEDDING_ONNX_QUANTIZED", "false").lower() == "true"
+    RAG_EMBEDDING_THREADS = int(os.getenv("RAG_EMBEDDING_THREADS", 0))
+    # 向量存储后端："qdrant" 或 "numpy"（进程内暴力精确检索，适合二十万分块以内）
+    RAG_VECTOR_BACKEND = os.getenv("RAG_VECTOR_BACKEND", "qdrant")
+    # 向量存储精度："float32"、"float16" 或 "int8"（每向量缩放系数的标量量化）
+    RAG_VECTOR_DTYPE = os.getenv("RAG_VECTOR_DTYPE", "float32")
+    # 量化精度下是否用 float32 原始向量对候选重新打分
+    RAG_VECTOR_RESCORE = os.getenv("RAG_VECTOR_RESCORE", "true").lower() == "true"
+    # 检索方式："dense"（向量）、"lexical"（BM25）或 "hybrid"（两路 RRF 融合）
+    RAG_RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "hybrid")
+    # 入库流水线：文档解析的并行进程数、每批编码的分块数
+    RAG_INGEST_WORKERS = int(os.getenv("RAG_INGEST_WORKERS", 2))
+    RAG_EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", 64))
+    # 超过该字节数的文件逐页流式入库（0 表示关闭）
+    RAG_STREAMING_THRESHOLD_BYTES = int(os.getenv("RAG_STREAMING_THRESHOLD_BYTES", 20 * 1024 * 1024))
+    # 异步检索线程池大小
+    RAG_QUERY_WORKERS = int(os.getenv("RAG_QUERY_WORKERS", 4))
+    # 查询向量与检索结果缓存：最大条目数、过期秒数
+    RAG_QUERY_CACHE_SIZE = int(os.getenv("RAG_QUERY_CACHE_SIZE", 1024))
+    RAG_QUERY_CACHE_TTL = float(os.getenv("RAG_QUERY_CACHE_TTL", 600))
+    # 后台入库任务：并行任务数、保留的任务记录数、单个上传文件大小上限（字节）
+    RAG_JOB_WORKERS = int(os.getenv("RAG_JOB_WORKERS", 1))
+    RAG_JOB_HISTORY = int(os.getenv("RAG_JOB_HISTORY", 100))
+    RAG_UPLOAD_MAX_BYTES = int(os.getenv("RAG_UPLOAD_MAX_BYTES", 200 * 1024 * 1024))
+    # 检索门控：寒暄/追问或与语料簇中心相似度低于阈值的查询不做检索
+    RAG_GATE_ENABLED = os.getenv("RAG_GATE_ENABLED", "true").lower() == "true"
+    RAG_GATE_THRESHOLD = float(os.getenv("RAG_GATE_THRESHOLD", 0.6))
+    RAG_GATE_CLUSTERS = int(os.getenv("RAG_GATE_CLUSTERS", 16))
+    # 混合/BM25 检索下，查询词在倒排索引中的命中比例不低于该值时直接通过门控（精确词匹配不依赖向量相似度）
+    RAG_GATE_LEXICAL_MIN_MATCH = float(os.getenv("RAG_GATE_LEXICAL_MIN_MATCH", 0.5))
+    # 交叉编码器重排序：先召回 RAG_RERANK_CANDIDATES 个候选再重排，超出时间预算（毫秒）时退回原检索顺序
+    RAG_RERANK_ENABLED = os.getenv("RAG_RERANK_ENABLED", "false").lower() == "true"
+    RAG_RERANK_BACKEND = os.getenv("RAG_RERANK_BACKEND", "onnx")
+    RAG_RERANK_MODEL_DIR = os.getenv(
+        "RAG_RERANK_MODEL_DIR",
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "core", "RAG", "rerank_models", "bge-reranker-base")
+    )
+    RAG_RERANK_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", 20))
+    RAG_RERANK_BUDGET_MS = float(os.getenv("RAG_RERANK_BUDGET_MS", 150))
+    # 注入系统提示词的知识库上下文默认 token 预算（模型可在 AVAILABLE_LLMS 中用 rag_context_tokens 覆盖）
+    RAG_CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", 1500))
+    # 知识库集合：集合名 -> 文档目录，可通过 RAG_COLLECTIONS（JSON，如 {"beijing": "/data/beijing"}）覆盖
+    RAG_COLLECTIONS = json.loads(os.getenv("RAG_COLLECTIONS", "null")) or {
+        "my_documents": os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "core", "RAG", "documents")
+    }
+    # 启动时预加载、且会话未指定集合时检索的默认集合（逗号分隔）
+    RAG_DEFAULT_COLLECTIONS = [
+        name.strip() for name in os.getenv("RAG_DEFAULT_COLLECTIONS", "my_documents").split(",") if name.strip()
+    ]
+
+    # 本地分词器词表目录：存在 <模型名>/tokenizer.json 时优先使用（如 deepseek-chat/tokenizer.json，
+    # 取自模型在 HuggingFace 发布的仓库），AVAILABLE_LLMS 中 tokenizer 为 "local:<目录名>" 时也从这里读取
+    LLM_TOKENIZER_DIR = os.getenv(
+        "LLM_TOKENIZER_DIR",
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "core", "llm", "tokenizers")
+    )
+
     # 定义可用的 LLM 模型及其描述
+    # tokenizer：对话历史 token 计数所用的分词器，"tiktoken:<编码名>"、"local:<目录名>" 或 "estimate"（按字符数估算），
+    # LLM_TOKENIZER_DIR 下放有该模型的词表时忽略此项
     AVAILABLE_LLMS = {
         "gpt-4o-mini": {
             "description": "OpenAI GPT-4o-mini，擅长复杂推理和多模态。",
-            "provider": "GPT"
+            "provider": "GPT",
+            "rag_context_tokens": 2000,
+            "tokenizer": "tiktoken:o200k_base"
         },
         "deepseek-chat": {
             "description": "DeepSeek Chat 模型，擅长多轮对话和复杂推理。",
-            "provider": "Deepseek"
+            "provider": "Deepseek",
+            "rag_context_tokens": 2000,
+            "tokenizer": "estimate"
         },
         # "ERNIE-3.5-8K-0701": {
         #     "description": "百度千帆 ERNIE-3.5-8K-0701，中文能力强，适合企业应用。",
@@ -34,15 +123,21 @@ class Settings:
         # },
         "glm-4-air": {
             "description": "智谱 AI GLM-4-Air，国产大模型，适合各类中文场景。",
-            "provider": "Zhipu"
+            "provider": "Zhipu",
+            "rag_context_tokens": 1500,
+            "tokenizer": "estimate"
         },
         "qwen-max": {
             "description": "阿里 Qwen-Max，通用大模型，支持多语言和多任务。",
-            "provider": "Qwen"
+            "provider": "Qwen",
+            "rag_context_tokens": 1500,
+            "tokenizer": "estimate"
         },
         "Spark X1": {
             "description": "讯飞星火 Spark X1，国产多模态大模型，适合中文问答和知识推理。",
-            "provider": "Spark"
+            "provider": "Spark",
+            "rag_context_tokens": 1000,
+            "tokenizer": "estimate"
         }
     }
 
@@ -0,0 +1,125 @@
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from backend.core.RAG.lexical_index import tokenize
+from backend.core.RAG.vector_store import SearchHit
+from backend.core.llm.token_counter import estimate_tokens
+
+_SENTENCE_PATTERN = re.compile(r"[^。！？!?；;\n]+[。！？!?；;]*\n?|\n")
+
+
+def split_sentences(text: str) -> List[str]:
+    """按中英文句末标点和换行切句，保留标点"""
+    return [s for s in _SENTENCE_PATTERN.findall(text) if s.strip()]
+
+
+def _merge_overlap(left: str, right: str, max_overlap: int = 200) -> str:
+    """拼接相邻分块，去掉切分时产生的重叠部分"""
+    for size in range(min(len(left), len(right), max_overlap), 0, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return left + right
+
+
+class ContextPacker:
+    """
+    RAG 上下文组装
+
+    1. 去重：丢弃重复或被其他分块完整包含的分块；
+    2. 合并：同一来源中相邻的分块（chunk_index 连续）拼接为一段并去掉重叠；
+    3. 句子排序：段落超出预算时按与查询的词法重合度挑选句子，保持原文顺序；
+    4. 按 token 预算依检索排名装箱。
+    """
+
+    def __init__(self, count_tokens: Optional[Callable[[str], int]] = None, separator: str = "\n\n"):
+        self.count_tokens = count_tokens or estimate_tokens
+        self.separator = separator
+
+    @staticmethod
+    def dedupe(hits: List[SearchHit]) -> List[SearchHit]:
+        """去掉重复或被更长分块包含的分块，保持排名顺序"""
+        kept: List[SearchHit] = []
+        for hit in hits:
+            text = hit.text.strip()
+            if not text or any(text in other.text for other in kept):
+                continue
+            kept = [other for other in kept if other.text.strip() not in text]
+            kept.append(hit)
+        order = {hit.id: i for i, hit in enumerate(hits)}
+        return sorted(kept, key=lambda hit: order[hit.id])
+
+    @staticmethod
+    def merge_adjacent(hits: List[SearchHit]) -> List[Tuple[int, str]]:
+        """
+        合并同一来源的相邻分块
+
+        Returns:
+            List[Tuple[int, str]]: (组内最佳排名, 合并后的文本)，按排名排序
+        """
+        groups: Dict[Tuple[Optional[str], str], List[Tuple[int, int, str]]] = {}
+        passages: List[Tuple[int, str]] = []
+        for rank, hit in enumerate(hits):
+            source = hit.metadata.get("source")
+            index = hit.metadata.get("chunk_index")
+            if source is None or index is None:
+                passages.append((rank, hit.text))
+            else:
+                # 多集合检索时不同集合可能有同名文件，按 (集合, 来源) 分组
+                groups.setdefault((hit.metadata.get("collection"), source), []).append((index, rank, hit.text))
+
+        for members in groups.values():
+            members.sort()
+            run_index, run_rank, run_text = members[0]
+            for index, rank, text in members[1:]:
+                if index == run_index + 1:
+                    run_text = _merge_overlap(run_text, text)
+                    run_rank = min(run_rank, rank)
+                else:
+                    passages.append((run_rank, run_text))
+                    run_rank, run_text = rank, text
+                run_index = index
+            passages.append((run_rank, run_text))
+        passages.sort(key=lambda item: item[0])
+        return passages
+
+    def compress(self, query_text: str, text: str, budget: int) -> str:
+        """按与查询的词重合度挑选句子，在预算内保留得分最高的句子（保持原文顺序）"""
+        query_terms = set(tokenize(query_text))
+        sentences = split_sentences(text)
+        scored = []
+        for i, sentence in enumerate(sentences):
+            terms = tokenize(sentence)
+            overlap = sum(1 for term in terms if term in query_terms)
+            scored.append((overlap / (len(terms) ** 0.5 or 1), i))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+
+        chosen, used = [], 0
+        for score, i in scored:
+            if score <= 0 and chosen:
+                break
+            cost = self.count_tokens(sentences[i])
+            if used + cost > budget:
+                continue
+            chosen.append(i)
+            used += cost
+        return "".join(sentences[i] for i in sorted(chosen)).strip()
+
+    def pack(self, query_text: str, hits: List[SearchHit], token_budget: int) -> str:
+        """将检索结果组装为不超过 token_budget 的上下文文本"""
+        if not hits or token_budget <= 0:
+            return ""
+        parts: List[str] = []
+        used = 0
+        separator_cost = self.count_tokens(self.separator)
+        for _, text in self.merge_adjacent(self.dedupe(hits)):
+            remaining = token_budget - used - (separator_cost if parts else 0)
+            if remaining <= 0:
+                break
+            text = text.strip()
+            if self.count_tokens(text) > remaining:
+                text = self.compress(query_text, text, remaining)
+            if not text:
+                continue
+            used += self.count_tokens(text) + (separator_cost if parts else 0)
+            parts.append(text)
+        return self.separator.join(parts)
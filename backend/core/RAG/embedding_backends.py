@@ -0,0 +1,158 @@
+import hashlib
+import os
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from backend.core.RAG.lexical_index import tokenize
+from backend.utils.logger import logger
+
+EMBEDDING_BACKENDS = ("huggingface", "onnx", "hashing")
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    ONNX Runtime CPU 嵌入模型
+
+    模型目录需包含 tokenizer.json 与导出的 model.onnx（输出 last_hidden_state，
+    可用 `optimum-cli export onnx --model <模型目录> <输出目录>` 导出），按 attention_mask 做均值池化。
+    quantized=True 时使用 int8 动态量化模型 model_quantized.onnx，不存在时从 model.onnx 生成一次。
+    只依赖 onnxruntime 和 tokenizers，不加载 torch，进程启动快、占用内存小。
+    """
+
+    MODEL_FILE = "model.onnx"
+    QUANTIZED_MODEL_FILE = "model_quantized.onnx"
+
+    def __init__(self,
+                 model_dir: str,
+                 quantized: bool = False,
+                 normalize: bool = True,
+                 batch_size: int = 32,
+                 max_length: int = 512,
+                 num_threads: int = 0):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("ONNX 嵌入后端需要安装 onnxruntime 和 tokenizers") from e
+
+        self.model_dir = model_dir
+        self.normalize = normalize
+        self.batch_size = max(1, batch_size)
+        model_path = self._quantized_model_path() if quantized else os.path.join(model_dir, self.MODEL_FILE)
+
+        options = onnxruntime.SessionOptions()
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {item.name for item in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        logger.info(f"ONNX 嵌入模型已加载: {model_path}")
+
+    def _quantized_model_path(self) -> str:
+        path = os.path.join(self.model_dir, self.QUANTIZED_MODEL_FILE)
+        if not os.path.exists(path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            logger.info(f"生成 int8 量化模型: {path}")
+            quantize_dynamic(os.path.join(self.model_dir, self.MODEL_FILE), path, weight_type=QuantType.QInt8)
+        return path
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.asarray([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.asarray([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.asarray([e.type_ids for e in encodings], dtype=np.int64)
+
+        hidden = self.session.run(None, feeds)[0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        vectors = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.normalize:
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        return vectors.astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        # 按长度排序后分批，减少同一批内的 padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = np.empty((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            rows = order[start:start + self.batch_size]
+            batch = self._encode([texts[i] for i in rows])
+            if vectors.shape[1] == 0:
+                vectors = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+            vectors[rows] = batch
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    确定性哈希嵌入（用于测试与基准）
+
+    把 tokenize 得到的词（中文单字与相邻双字、英文单词）按哈希映射到 dim 维并带符号累加，
+    结果只由文本决定，不需要模型文件。词重合多的文本相似度高，但不具备语义能力。
+    """
+
+    def __init__(self, dim: int = 768, normalize: bool = True):
+        self.dim = dim
+        self.normalize = normalize
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for term in tokenize(text, unigrams=True):
+            digest = hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.dim] += 1.0 if (value >> 63) & 1 else -1.0
+        if self.normalize:
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def create_embeddings(backend: str,
+                      model_dir: str,
+                      normalize: bool = True,
+                      onnx_quantized: bool = False,
+                      num_threads: int = 0,
+                      dim: Optional[int] = None) -> Embeddings:
+    """
+    按名称创建嵌入模型
+
+    Args:
+        backend: "huggingface"（sentence-transformers，依赖 torch）、"onnx" 或 "hashing"
+        model_dir: 模型目录（hashing 后端不使用）
+        normalize: 是否做 L2 归一化
+        onnx_quantized: onnx 后端是否使用 int8 量化模型
+        num_threads: onnx 后端的推理线程数，0 表示由 onnxruntime 决定
+        dim: hashing 后端的向量维度
+    """
+    if backend == "huggingface":
+        # 延迟导入，选择其他后端时不会加载 torch
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(
+            model_name=model_dir,
+            model_kwargs={"device": "cpu"},
+            encode_kwargs={"normalize_embeddings": normalize}
+        )
+    if backend == "onnx":
+        return OnnxEmbeddings(model_dir, quantized=onnx_quantized, normalize=normalize, num_threads=num_threads)
+    if backend == "hashing":
+        return HashingEmbeddings(dim=dim or 768, normalize=normalize)
+    raise ValueError(f"不支持的嵌入后端: {backend}")
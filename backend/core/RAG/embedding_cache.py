@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+import portalocker
+from langchain_core.embeddings import Embeddings
+
+from backend.utils.logger import logger
+
+DIGEST_SIZE = 32  # sha256
+
+
+class EmbeddingCache:
+    """
+    磁盘向量缓存
+
+    以 (嵌入模型目录, 是否归一化, 嵌入后端变体, 分块文本哈希) 为键缓存向量。
+    同一模型配置的全部向量顺序追加在一个 float32 文件中并以内存映射方式读取，
+    另有一个只存放 sha256 摘要的索引文件，第 i 条摘要对应向量文件的第 i 行。
+    多个 worker 进程共享同一缓存目录时通过文件锁串行追加。
+    """
+
+    def __init__(self, cache_dir: str, model_dir: str, normalize: bool = True, variant: str = ""):
+        self.cache_dir = cache_dir
+        self.model_dir = os.path.abspath(model_dir)
+        self.normalize = normalize
+        self.variant = variant
+        key = f"{self.model_dir}\n{int(normalize)}" + (f"\n{variant}" if variant else "")
+        namespace = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+        os.makedirs(cache_dir, exist_ok=True)
+        self.vectors_path = os.path.join(cache_dir, f"{namespace}.f32")
+        self.index_path = os.path.join(cache_dir, f"{namespace}.idx")
+        self.meta_path = os.path.join(cache_dir, f"{namespace}.json")
+        self.lock_path = os.path.join(cache_dir, f"{namespace}.lock")
+
+        self.dim: Optional[int] = None
+        self._rows: Dict[bytes, int] = {}
+        self._row_count = 0
+        self._vectors: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._load_meta()
+        self._refresh_index()
+
+    def _load_meta(self):
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+
+    def _committed_rows(self) -> int:
+        """索引与向量文件中都已完整写入的行数"""
+        if self.dim is None or not os.path.exists(self.index_path) or not os.path.exists(self.vectors_path):
+            return 0
+        index_rows = os.path.getsize(self.index_path) // DIGEST_SIZE
+        vector_rows = os.path.getsize(self.vectors_path) // (self.dim * 4)
+        return min(index_rows, vector_rows)
+
+    def _refresh_index(self):
+        """读取其他进程追加的新索引记录"""
+        rows = self._committed_rows()
+        known = self._row_count
+        if rows <= known:
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(known * DIGEST_SIZE)
+            data = f.read((rows - known) * DIGEST_SIZE)
+        for i in range(rows - known):
+            self._rows.setdefault(data[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE], known + i)
+        self._row_count = rows
+        self._vectors = None
+
+    def _get_vectors(self) -> Optional[np.memmap]:
+        if not self._row_count:
+            return None
+        if self._vectors is None or self._vectors.shape[0] < self._row_count:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self._row_count, self.dim))
+        return self._vectors
+
+    @staticmethod
+    def _digest(text: str) -> bytes:
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """批量查询缓存，未命中的位置返回 None"""
+        with self._lock:
+            self._refresh_index()
+            digests = [self._digest(text) for text in texts]
+            vectors = self._get_vectors()
+            results: List[Optional[List[float]]] = []
+            for digest in digests:
+                row = self._rows.get(digest)
+                if row is None or vectors is None:
+                    results.append(None)
+                    self.misses += 1
+                else:
+                    results.append(vectors[row].tolist())
+                    self.hits += 1
+            return results
+
+    def put_many(self, texts: List[str], vectors: List[List[float]]):
+        """批量写入缓存（已存在的键会被跳过）"""
+        if not texts:
+            return
+        array = np.asarray(vectors, dtype=np.float32)
+        with self._lock, portalocker.Lock(self.lock_path, mode="a", timeout=30):
+            if self.dim is None:
+                self._load_meta()
+            if self.dim is None:
+                self.dim = int(array.shape[1])
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"model_dir": self.model_dir, "normalize": self.normalize, "dim": self.dim}, f)
+            elif array.shape[1] != self.dim:
+                raise ValueError(f"向量维度 {array.shape[1]} 与缓存维度 {self.dim} 不一致")
+
+            self._refresh_index()
+            rows = self._committed_rows()
+            # 截断崩溃时写了一半的尾部，保证两个文件行数一致
+            for path, row_size in ((self.index_path, DIGEST_SIZE), (self.vectors_path, self.dim * 4)):
+                if os.path.exists(path) and os.path.getsize(path) != rows * row_size:
+                    with open(path, "r+b") as f:
+                        f.truncate(rows * row_size)
+
+            new_digests, new_rows = [], []
+            for text, vector in zip(texts, array):
+                digest = self._digest(text)
+                if digest in self._rows:
+                    continue
+                self._rows[digest] = rows + len(new_digests)
+                new_digests.append(digest)
+                new_rows.append(vector)
+            if not new_digests:
+                return
+
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.ascontiguousarray(new_rows, dtype=np.float32).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.index_path, "ab") as f:
+                f.write(b"".join(new_digests))
+                f.flush()
+                os.fsync(f.fileno())
+            self._row_count = rows + len(new_digests)
+            self._vectors = None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"entries": len(self._rows), "hits": self.hits, "misses": self.misses}
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    带磁盘缓存的嵌入模型包装
+
+    文档分块先查缓存，只把未命中的文本交给底层模型编码；查询向量不走此缓存。
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        results = self.cache.get_many(texts)
+        missing = [i for i, vector in enumerate(results) if vector is None]
+        if missing:
+            missing_texts = list(dict.fromkeys(texts[i] for i in missing))
+            new_vectors = self.embeddings.embed_documents(missing_texts)
+            self.cache.put_many(missing_texts, new_vectors)
+            encoded = {text: list(vector) for text, vector in zip(missing_texts, new_vectors)}
+            for i in missing:
+                results[i] = encoded[texts[i]]
+            logger.debug(f"向量缓存命中 {len(texts) - len(missing)}/{len(texts)}")
+        return results
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
@@ -0,0 +1,117 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from backend.config.settings import settings
+from backend.core.RAG.rag_manager import RAGManager
+from backend.utils.logger import logger
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed")
+
+
+class IngestionJob:
+    """一次后台入库任务的状态与进度"""
+
+    def __init__(self, collection: str):
+        self.job_id = uuid.uuid4().hex
+        self.collection = collection
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.progress: Dict[str, int] = {
+            "files_total": 0, "files_done": 0, "chunks": 0, "new_chunks": 0, "embedded_chunks": 0
+        }
+        self.stats: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "collection": self.collection,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": dict(self.progress),
+            "stats": self.stats,
+            "error": self.error
+        }
+
+
+class IngestionJobManager:
+    """
+    后台入库任务管理 - 进程级单例
+
+    入库（解析、编码、写索引）在独立的后台线程池中执行，不占用处理对话请求的事件循环。
+    同一集合已有排队中的任务时直接返回该任务（它开始后会扫描到新文件）；
+    已有执行中的任务时另外排队一个后续任务，执行中的扫描可能已经越过新上传的文件。
+    只保留最近 settings.RAG_JOB_HISTORY 个任务的记录。
+    """
+
+    _jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+    _lock = threading.Lock()
+    _executor: Optional[ThreadPoolExecutor] = None
+
+    @classmethod
+    def _get_executor(cls) -> ThreadPoolExecutor:
+        if cls._executor is None:
+            cls._executor = ThreadPoolExecutor(max_workers=settings.RAG_JOB_WORKERS, thread_name_prefix="rag-ingest-job")
+        return cls._executor
+
+    @classmethod
+    def submit(cls, collection: str) -> IngestionJob:
+        """提交集合的入库任务"""
+        RAGManager.get_doc_dir(collection)  # 集合未配置时抛出 ValueError
+        with cls._lock:
+            for job in cls._jobs.values():
+                if job.collection == collection and job.status == "queued":
+                    return job
+            job = IngestionJob(collection)
+            cls._jobs[job.job_id] = job
+            while len(cls._jobs) > settings.RAG_JOB_HISTORY:
+                oldest_id, oldest = next(iter(cls._jobs.items()))
+                if oldest.status in ("queued", "running"):
+                    break
+                del cls._jobs[oldest_id]
+            cls._get_executor().submit(cls._run, job)
+        logger.info(f"已提交 RAG 入库任务 {job.job_id}（集合 {collection}）")
+        return job
+
+    @classmethod
+    def _run(cls, job: IngestionJob):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            # 集合尚未加载时在后台加载，入库统一由本任务执行以便汇报进度
+            engine = RAGManager.load_collection(job.collection, auto_ingest=False)
+            job.stats = engine.ingest(on_progress=job.progress.update)
+            job.status = "succeeded"
+        except Exception as e:
+            logger.error(f"RAG 入库任务 {job.job_id} 失败: {e}", exc_info=True)
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+
+    @classmethod
+    def get_job(cls, job_id: str) -> Optional[IngestionJob]:
+        return cls._jobs.get(job_id)
+
+    @classmethod
+    def list_jobs(cls, collection: Optional[str] = None) -> List[IngestionJob]:
+        """按提交时间倒序列出任务"""
+        with cls._lock:
+            jobs = list(cls._jobs.values())
+        return [job for job in reversed(jobs) if collection is None or job.collection == collection]
+
+    @classmethod
+    def shutdown(cls):
+        """停止接收新任务，已开始的任务在后台线程中结束"""
+        with cls._lock:
+            if cls._executor is not None:
+                cls._executor.shutdown(wait=False, cancel_futures=True)
+                cls._executor = None
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import uuid
+from typing import Dict, Any, List, Optional
+
+from backend.utils.logger import logger
+
+
+def content_hash(data) -> str:
+    """计算内容的 sha256 哈希（str 按 utf-8 编码）"""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(file_path: str, block_size: int = 1 << 20) -> str:
+    """分块计算文件内容的 sha256 哈希"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(source: str, chunk_hash: str, occurrence: int = 0) -> str:
+    """
+    生成稳定的分块ID
+
+    同一文件中内容相同的分块用 occurrence 区分，保证文件内ID唯一。
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{source}\n{occurrence}\n{chunk_hash}"))
+
+
+class IngestionManifest:
+    """
+    RAG 入库清单
+
+    记录每个源文件的内容哈希以及其每个分块的哈希和向量ID，
+    重新入库时只对新增或变化的分块进行编码，并删除已移除文件的向量。
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.settings: Dict[str, Any] = {}
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.load()
+
+    def load(self):
+        """从磁盘加载清单"""
+        if not os.path.exists(self.file_path):
+            return
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.settings = data.get("settings", {})
+            self.files = data.get("files", {})
+        except Exception as e:
+            logger.error(f"加载入库清单失败，将重新入库: {e}")
+            self.settings = {}
+            self.files = {}
+
+    def save(self):
+        """原子写入清单文件"""
+        os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+        tmp_path = f"{self.file_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"settings": self.settings, "files": self.files}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.file_path)
+
+    def reset(self, settings: Optional[Dict[str, Any]] = None):
+        """清空清单（索引被重建时调用）"""
+        self.settings = dict(settings or {})
+        self.files = {}
+
+    def get_file(self, source: str) -> Optional[Dict[str, Any]]:
+        return self.files.get(source)
+
+    def set_file(self, source: str, file_hash_value: str, size: int, mtime: float, chunks: List[Dict[str, str]]):
+        """记录文件及其分块（chunks 为 [{"id": ..., "hash": ...}]）"""
+        self.files[source] = {
+            "file_hash": file_hash_value,
+            "size": size,
+            "mtime": mtime,
+            "chunks": chunks
+        }
+
+    def remove_file(self, source: str) -> List[str]:
+        """移除文件记录，返回其全部分块ID"""
+        entry = self.files.pop(source, None)
+        if not entry:
+            return []
+        return [chunk["id"] for chunk in entry["chunks"]]
+
+    def chunk_ids(self, source: str) -> List[str]:
+        entry = self.files.get(source)
+        return [chunk["id"] for chunk in entry["chunks"]] if entry else []
+
+    def total_chunks(self) -> int:
+        return sum(len(entry["chunks"]) for entry in self.files.values())
@@ -0,0 +1,272 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List, Tuple, Callable, Optional, Set
+
+from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.embeddings import Embeddings
+
+from backend.utils.logger import logger
+from backend.core.RAG.ingestion_manifest import content_hash, chunk_id
+from backend.core.RAG.vector_store import BaseVectorStore
+from backend.core.RAG.lexical_index import BM25Index
+from backend.core.RAG.streaming_loader import iter_chunks
+
+# 解析开销大的格式放到进程池中执行
+PROCESS_POOL_EXTENSIONS = (".pdf", ".docx")
+
+SplitResult = Tuple[List[str], List[Dict[str, Any]], List[Dict[str, str]]]
+
+
+def load_file(file_path: str) -> List:
+    """加载单个源文件"""
+    if file_path.endswith(".txt"):
+        loader = TextLoader(file_path, encoding="utf-8")
+    elif file_path.endswith(".pdf"):
+        loader = PyPDFLoader(file_path)
+    elif file_path.endswith(".docx"):
+        loader = Docx2txtLoader(file_path)
+    else:
+        return []
+    return loader.load()
+
+
+def load_and_split(file_path: str, source: str, chunk_size: int, chunk_overlap: int) -> SplitResult:
+    """
+    加载并切分单个文件（模块级函数，可在子进程中执行）
+
+    Returns:
+        SplitResult: 分块文本、元数据及清单记录 [{"id": ..., "hash": ...}]
+    """
+    documents = load_file(file_path)
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunked_documents = text_splitter.split_documents(documents)
+
+    texts, metadatas, chunks = [], [], []
+    occurrences: Dict[str, int] = {}
+    for index, doc in enumerate(chunked_documents):
+        hash_value = content_hash(doc.page_content)
+        occurrence = occurrences.get(hash_value, 0)
+        occurrences[hash_value] = occurrence + 1
+        texts.append(doc.page_content)
+        metadatas.append({**doc.metadata, "source": source, "chunk_hash": hash_value, "chunk_index": index})
+        chunks.append({"id": chunk_id(source, hash_value, occurrence), "hash": hash_value})
+    return texts, metadatas, chunks
+
+
+class IngestionPipeline:
+    """
+    分阶段的 RAG 入库流水线
+
+    load / split：PDF、DOCX 在进程池中解析切分，TXT 在线程池中处理；
+    embed：待编码分块按 embed_batch_size 攒批编码；
+    upsert：每批编码完成后立即写入向量存储和 BM25 索引。
+    一个文件的全部新分块写入后才回调 on_file_done，中途失败不会把文件记为已入库。
+
+    超过 streaming_threshold 字节的文件走流式路径：逐页读取、增量切分，
+    每攒满 embed_batch_size 个分块就编码写入，峰值内存只与批大小有关，不随文档大小增长。
+    """
+
+    def __init__(self,
+                 embedding_model: Embeddings,
+                 vectorstore: BaseVectorStore,
+                 lexical_index: BM25Index,
+                 chunk_size: int,
+                 chunk_overlap: int,
+                 max_workers: int = 2,
+                 embed_batch_size: int = 64,
+                 streaming_threshold: int = 20 * 1024 * 1024):
+        self.embedding_model = embedding_model
+        self.vectorstore = vectorstore
+        self.lexical_index = lexical_index
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.max_workers = max(1, max_workers)
+        self.embed_batch_size = max(1, embed_batch_size)
+        self.streaming_threshold = streaming_threshold
+
+    def run(self,
+            doc_dir: str,
+            sources: List[str],
+            on_split: Callable[[str, SplitResult], List[int]],
+            on_file_done: Callable[[str, List[Dict[str, str]]], None],
+            known_ids: Optional[Callable[[str], Set[str]]] = None,
+            on_progress: Optional[Callable[[Dict[str, int]], None]] = None) -> Dict[str, Any]:
+        """
+        执行入库
+
+        Args:
+            doc_dir: 文档目录
+            sources: 需要（重新）入库的文件（相对路径）
+            on_split: 文件切分完成回调，返回需要编码写入的分块下标
+            on_file_done: 文件全部新分块写入完成回调
+            known_ids: 返回文件已入库的分块 id，流式路径据此边读边跳过未变化的分块；
+                未提供时大文件也走常规路径
+            on_progress: 进度回调，每处理完一个文件或写入一批分块时调用
+
+        Returns:
+            Dict[str, Any]: 吞吐统计
+        """
+        stats = {
+            "files": 0, "streamed_files": 0, "chunks": 0, "new_chunks": 0, "embedded_chunks": 0,
+            "load_wait_seconds": 0.0, "embed_seconds": 0.0, "upsert_seconds": 0.0
+        }
+        started_at = time.perf_counter()
+
+        pending: List[Tuple[str, str, str, Dict[str, Any]]] = []  # (source, id, text, metadata)
+        remaining: Dict[str, int] = {}
+        file_chunks: Dict[str, List[Dict[str, str]]] = {}
+
+        def report():
+            if on_progress is not None:
+                on_progress({
+                    "files_total": len(sources),
+                    "files_done": stats["files"],
+                    "chunks": stats["chunks"],
+                    "new_chunks": stats["new_chunks"],
+                    "embedded_chunks": stats["embedded_chunks"]
+                })
+
+        def flush(force: bool = False):
+            while pending and (force or len(pending) >= self.embed_batch_size):
+                batch = pending[:self.embed_batch_size]
+                del pending[:self.embed_batch_size]
+                self._embed_and_upsert(batch, stats)
+                report()
+                for source, _, _, _ in batch:
+                    remaining[source] -= 1
+                    if remaining[source] == 0:
+                        on_file_done(source, file_chunks.pop(source))
+
+        streamed = [s for s in sources if known_ids is not None and self._should_stream(os.path.join(doc_dir, s))]
+        regular = [s for s in sources if s not in streamed]
+
+        for source, result in self._load_and_split_all(doc_dir, regular, stats):
+            texts, metadatas, chunks = result
+            stats["files"] += 1
+            stats["chunks"] += len(chunks)
+            added = on_split(source, result)
+            stats["new_chunks"] += len(added)
+            report()
+            if not added:
+                on_file_done(source, chunks)
+                continue
+            remaining[source] = len(added)
+            file_chunks[source] = chunks
+            pending.extend((source, chunks[i]["id"], texts[i], metadatas[i]) for i in added)
+            flush()
+        flush(force=True)
+
+        for source in streamed:
+            try:
+                chunks = self._stream_file(os.path.join(doc_dir, source), source, known_ids(source), stats, report)
+            except Exception as e:
+                logger.error(f"流式加载文档 {source} 失败: {e}")
+                continue
+            stats["files"] += 1
+            stats["streamed_files"] += 1
+            stats["chunks"] += len(chunks)
+            # 新分块已写入，这里只让调用方删除失效分块并更新统计
+            on_split(source, ([], [], chunks))
+            on_file_done(source, chunks)
+            report()
+
+        elapsed = time.perf_counter() - started_at
+        stats["elapsed_seconds"] = round(elapsed, 3)
+        stats["docs_per_second"] = round(stats["files"] / elapsed, 2) if elapsed else 0.0
+        stats["chunks_per_second"] = round(stats["embedded_chunks"] / elapsed, 2) if elapsed else 0.0
+        for key in ("load_wait_seconds", "embed_seconds", "upsert_seconds"):
+            stats[key] = round(stats[key], 3)
+        return stats
+
+    def _should_stream(self, file_path: str) -> bool:
+        try:
+            return 0 < self.streaming_threshold <= os.path.getsize(file_path)
+        except OSError:
+            return False
+
+    def _stream_file(self, file_path: str, source: str, old_ids: Set[str], stats: Dict[str, Any],
+                     report: Callable[[], None]) -> List[Dict[str, str]]:
+        """
+        流式入库单个大文件
+
+        边读边切分，新分块攒满一批即编码写入；只保留分块的清单记录（id 与哈希），
+        分块文本写入后即释放。
+        中途失败时删除本文件已写入的新分块再抛出，文件没有清单记录，这些分块之后无法清理。
+
+        Returns:
+            List[Dict[str, str]]: 文件全部分块的清单记录
+        """
+        chunks: List[Dict[str, str]] = []
+        batch: List[Tuple[str, str, str, Dict[str, Any]]] = []
+        written_ids: List[str] = []
+        try:
+            for text, metadata, chunk in iter_chunks(file_path, source, self.chunk_size, self.chunk_overlap):
+                chunks.append(chunk)
+                if chunk["id"] in old_ids:
+                    continue
+                batch.append((source, chunk["id"], text, metadata))
+                stats["new_chunks"] += 1
+                if len(batch) >= self.embed_batch_size:
+                    # 先登记再写入：向量写入成功、词法索引写入失败时也要回滚（删除未写入的 id 无副作用）
+                    written_ids.extend(item[1] for item in batch)
+                    self._embed_and_upsert(batch, stats)
+                    report()
+                    batch = []
+            if batch:
+                written_ids.extend(item[1] for item in batch)
+                self._embed_and_upsert(batch, stats)
+        except Exception:
+            if written_ids:
+                self.vectorstore.delete(written_ids)
+                self.lexical_index.delete(written_ids)
+                logger.info(f"已回滚文档 {source} 写入的 {len(written_ids)} 个分块")
+            raise
+        return chunks
+
+    def _load_and_split_all(self, doc_dir: str, sources: List[str], stats: Dict[str, Any]):
+        """并行加载切分，按完成顺序产出 (source, SplitResult)"""
+        heavy = [s for s in sources if s.endswith(PROCESS_POOL_EXTENSIONS)]
+        light = [s for s in sources if not s.endswith(PROCESS_POOL_EXTENSIONS)]
+        process_pool = ProcessPoolExecutor(max_workers=self.max_workers) if heavy else None
+        thread_pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="rag-load") if light else None
+        try:
+            futures = {}
+            for pool, group in ((process_pool, heavy), (thread_pool, light)):
+                for source in group:
+                    future = pool.submit(load_and_split, os.path.join(doc_dir, source), source,
+                                         self.chunk_size, self.chunk_overlap)
+                    futures[future] = source
+
+            wait_started = time.perf_counter()
+            for future in as_completed(futures):
+                source = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"加载文档 {source} 失败: {e}")
+                    continue
+                stats["load_wait_seconds"] += time.perf_counter() - wait_started
+                yield source, result
+                wait_started = time.perf_counter()
+        finally:
+            for pool in (process_pool, thread_pool):
+                if pool is not None:
+                    pool.shutdown(wait=True, cancel_futures=True)
+
+    def _embed_and_upsert(self, batch: List[Tuple[str, str, str, Dict[str, Any]]], stats: Dict[str, Any]):
+        ids = [item[1] for item in batch]
+        texts = [item[2] for item in batch]
+        metadatas = [item[3] for item in batch]
+
+        embed_started = time.perf_counter()
+        vectors = self.embedding_model.embed_documents(texts)
+        upsert_started = time.perf_counter()
+        self.vectorstore.add(ids=ids, vectors=vectors, texts=texts, metadatas=metadatas)
+        self.lexical_index.add(ids, texts)
+        finished = time.perf_counter()
+
+        stats["embed_seconds"] += upsert_started - embed_started
+        stats["upsert_seconds"] += finished - upsert_started
+        stats["embedded_chunks"] += len(batch)
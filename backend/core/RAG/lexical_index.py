@@ -0,0 +1,186 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from backend.utils.logger import logger
+
+# 连续的中日韩字符，或连续的字母数字
+_TOKEN_PATTERN = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]+|[0-9a-zA-Z]+")
+_CJK_PATTERN = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]")
+# 问句中的疑问词、虚词和客套词，计算命中比例前从查询中断开，避免"天坛在哪里"切出"坛在""在哪"这类语料中不会出现的二元组
+_QUERY_FILLER_PATTERN = re.compile(
+    r"为什么|什么|怎么样|怎么|怎样|如何|哪里|哪儿|哪些|多少|是否|有没有|能不能|可不可以|可以|"
+    r"请问|介绍|一下|告诉|知道|关于|一些|这个|那个|"
+    r"[的了在是吗呢吧啊呀与或把被给请要我你您]"
+)
+
+
+# 分词规则版本，变化时已有索引需要重建（见 RAGEngine._index_settings）
+TOKENIZER_VERSION = 2
+
+
+def tokenize(text: str, unigrams: bool = False) -> List[str]:
+    """
+    面向中文的轻量分词
+
+    中文连续片段切成相邻二元组（"北京南站" -> 北京, 京南, 南站），只有单个汉字的片段才保留单字；
+    常用单字几乎出现在每个分块中，倒排表覆盖整个语料，既拖慢打分又稀释二元组的匹配。
+    unigrams=True 时额外输出片段中的每个单字（哈希嵌入使用）。
+    字母数字按词切分并转小写。无需额外的分词词典即可精确匹配地名等专有名词。
+    """
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text):
+        segment = match.group()
+        if _CJK_PATTERN.match(segment):
+            if unigrams or len(segment) == 1:
+                tokens.extend(segment)
+            if len(segment) > 1:
+                tokens.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+        else:
+            tokens.append(segment.lower())
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    倒数排名融合（RRF）
+
+    Args:
+        rankings: 多路检索结果的ID列表，各自按相关度降序
+        k: 平滑常数
+
+    Returns:
+        List[Tuple[str, float]]: 按融合得分降序排列的 (ID, 得分)
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking):
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """
+    BM25 倒排索引
+
+    支持按分块ID增量添加和删除，与向量存储同步更新。
+    落盘时只保存每个分块的词频表，加载时重建倒排表。
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._doc_terms: Dict[str, Dict[str, int]] = {}
+        self._doc_lengths: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_length = 0
+        self._dirty = False
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                doc_terms = json.load(f)
+        except Exception as e:
+            logger.error(f"加载 BM25 索引失败: {e}")
+            return
+        for id_, terms in doc_terms.items():
+            self._add_terms(id_, terms)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def _add_terms(self, id_: str, terms: Dict[str, int]):
+        self._doc_terms[id_] = terms
+        length = sum(terms.values())
+        self._doc_lengths[id_] = length
+        self._total_length += length
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[id_] = tf
+
+    def reset(self):
+        with self._lock:
+            self._doc_terms, self._doc_lengths, self._postings = {}, {}, {}
+            self._total_length = 0
+            self._dirty = True
+            self.persist()
+
+    def add(self, ids: List[str], texts: List[str]):
+        with self._lock:
+            self.delete([id_ for id_ in ids if id_ in self._doc_terms])
+            for id_, text in zip(ids, texts):
+                self._add_terms(id_, dict(Counter(tokenize(text))))
+            self._dirty = True
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            for id_ in ids:
+                terms = self._doc_terms.pop(id_, None)
+                if terms is None:
+                    continue
+                self._total_length -= self._doc_lengths.pop(id_)
+                for term in terms:
+                    posting = self._postings.get(term)
+                    if posting is not None:
+                        posting.pop(id_, None)
+                        if not posting:
+                            del self._postings[term]
+                self._dirty = True
+
+    def match_ratio(self, query_text: str) -> float:
+        """
+        查询的不同词中在索引里出现过的比例，不计算得分
+
+        先去掉疑问词、虚词等问句成分再切词，只统计"天坛""历史"这类实词，
+        自然语言问句与只含关键词的查询得到相近的比例。
+        """
+        query_terms = set(tokenize(_QUERY_FILLER_PATTERN.sub(" ", query_text)))
+        # 断开后落单的汉字多为"去""有"之类的虚词，有其他词时不计入
+        words = {term for term in query_terms if not (len(term) == 1 and _CJK_PATTERN.match(term))}
+        query_terms = words or query_terms
+        if not query_terms:
+            return 0.0
+        with self._lock:
+            return sum(1 for term in query_terms if term in self._postings) / len(query_terms)
+
+    def search(self, query_text: str, top_k: int) -> List[Tuple[str, float]]:
+        """返回按 BM25 得分降序的 (分块ID, 得分)"""
+        query_terms = set(tokenize(query_text))
+        with self._lock:
+            doc_count = len(self._doc_terms)
+            if not doc_count or not query_terms:
+                return []
+            avg_length = self._total_length / doc_count
+            scores: Dict[str, float] = {}
+            for term in query_terms:
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (doc_count - len(posting) + 0.5) / (len(posting) + 0.5))
+                for id_, tf in posting.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[id_] / avg_length)
+                    scores[id_] = scores.get(id_, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def persist(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._doc_terms, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
@@ -0,0 +1,71 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """查询文本归一化：全角转半角、合并空白、转小写"""
+    text = unicodedata.normalize("NFKC", text)
+    return _WHITESPACE_PATTERN.sub(" ", text).strip().lower()
+
+
+class TTLCache:
+    """
+    带过期时间的 LRU 缓存（线程安全）
+
+    超过 max_size 时淘汰最久未使用的条目，超过 ttl 秒的条目在读取时视为未命中。
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
@@ -1,70 +1,579 @@
+import asyncio
 import os
-from typing import List, Optional
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Qdrant
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Any, Tuple, Callable
+from langchain_core.embeddings import Embeddings
+
+from backend.config.settings import settings
+from backend.utils.logger import logger
+from backend.core.RAG.ingestion_manifest import IngestionManifest, file_hash
+from backend.core.RAG.ingestion_pipeline import IngestionPipeline, SplitResult, load_file
+from backend.core.RAG.embedding_cache import EmbeddingCache, CachedEmbeddings
+from backend.core.RAG.embedding_backends import EMBEDDING_BACKENDS, create_embeddings
+from backend.core.RAG.vector_store import BaseVectorStore, QdrantVectorStore, NumpyVectorStore, SearchHit
+from backend.core.RAG.lexical_index import BM25Index, reciprocal_rank_fusion, TOKENIZER_VERSION as LEXICAL_TOKENIZER_VERSION
+from backend.core.RAG.query_cache import TTLCache, normalize_query
+from backend.core.RAG.retrieval_gate import RetrievalGate
+from backend.core.RAG.context_packer import ContextPacker
+from backend.core.RAG.reranker import Reranker, create_cross_encoder
+
+SUPPORTED_EXTENSIONS = (".txt", ".pdf", ".docx")
+RETRIEVAL_MODES = ("dense", "lexical", "hybrid")
+
 
 class RAGEngine:
+    """
+    RAG 知识库引擎
+
+    向量索引默认持久化到 settings.RAG_INDEX_DIR，进程重启后直接加载已有向量，
+    并通过入库清单只对新增或变化的文档分块做编码。
+    向量后端由 vector_backend 选择："qdrant"（默认）或 "numpy"（进程内暴力精确检索）。
+    嵌入模型由 embedding_backend 选择："huggingface"（默认）、"onnx"（ONNX Runtime CPU，可选 int8 量化）
+    或 "hashing"（确定性哈希，仅用于测试）。
+    向量精度由 vector_dtype 选择："float32"、"float16" 或 "int8"，量化精度下可用 vector_rescore
+    开启 float32 重打分。
+    使用 Qdrant 时传入 qdrant_location（如 ":memory:" 或远程 URL）可改用对应的 Qdrant 实例。
+    检索方式由 retrieval_mode 选择："dense"、"lexical"（BM25）或 "hybrid"（两路结果按 RRF 融合）。
+    """
+
+    # 混合检索时每一路召回 top_k 的倍数，再融合截断
+    HYBRID_CANDIDATE_FACTOR = 4
+
     def __init__(self,
                  doc_dir: Optional[str] = None,
                  embedding_model_dir: Optional[str] = None,
                  collection_name: str = "my_documents",
-                 qdrant_location: str = ":memory:",
+                 qdrant_location: Optional[str] = None,
+                 index_dir: Optional[str] = None,
                  chunk_size: int = 200,
-                 chunk_overlap: int = 10):
+                 chunk_overlap: int = 10,
+                 embedding_cache_dir: Optional[str] = None,
+                 use_embedding_cache: bool = True,
+                 vector_backend: Optional[str] = None,
+                 vector_dtype: Optional[str] = None,
+                 vector_rescore: Optional[bool] = None,
+                 retrieval_mode: Optional[str] = None,
+                 ingest_workers: Optional[int] = None,
+                 embed_batch_size: Optional[int] = None,
+                 query_workers: Optional[int] = None,
+                 embedding_model: Optional[Embeddings] = None,
+                 embedding_backend: Optional[str] = None,
+                 reranker: Optional[Reranker] = None,
+                 auto_ingest: bool = True):
         base_path = os.path.dirname(os.path.abspath(__file__))
         self.doc_dir = doc_dir if doc_dir is not None else os.path.join(base_path, "documents")
         self.embedding_model_dir = embedding_model_dir if embedding_model_dir is not None else os.path.join(base_path, "embedding_models", "m3e-base")
         self.collection_name = collection_name
         self.qdrant_location = qdrant_location
+        self.index_dir = index_dir if index_dir is not None else settings.RAG_INDEX_DIR
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        self.vectorstore = None
-        self._init_vectorstore()
+        self.embedding_cache_dir = embedding_cache_dir if embedding_cache_dir is not None else settings.RAG_EMBEDDING_CACHE_DIR
+        self.use_embedding_cache = use_embedding_cache
+        self.embedding_backend = embedding_backend if embedding_backend is not None else settings.RAG_EMBEDDING_BACKEND
+        if self.embedding_backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"不支持的嵌入后端: {self.embedding_backend}")
+        self.onnx_quantized = settings.RAG_EMBEDDING_ONNX_QUANTIZED
+        self.vector_backend = vector_backend if vector_backend is not None else settings.RAG_VECTOR_BACKEND
+        self.vector_dtype = vector_dtype if vector_dtype is not None else settings.RAG_VECTOR_DTYPE
+        self.vector_rescore = vector_rescore if vector_rescore is not None else settings.RAG_VECTOR_RESCORE
+        self.retrieval_mode = retrieval_mode if retrieval_mode is not None else settings.RAG_RETRIEVAL_MODE
+        if self.retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"不支持的检索方式: {self.retrieval_mode}")
+        self.ingest_workers = ingest_workers if ingest_workers is not None else settings.RAG_INGEST_WORKERS
+        self.embed_batch_size = embed_batch_size if embed_batch_size is not None else settings.RAG_EMBED_BATCH_SIZE
+        self.streaming_threshold = settings.RAG_STREAMING_THRESHOLD_BYTES
+        # 多个集合可共用同一个已加载的嵌入模型
+        self.embedding_model = embedding_model
+        self.vectorstore: Optional[BaseVectorStore] = None
+        self.manifest = IngestionManifest(os.path.join(self.index_dir, f"{collection_name}_manifest.json"))
+        self.lexical_index = BM25Index(os.path.join(self.index_dir, "lexical", f"{collection_name}.json"))
+        self._ingest_lock = threading.RLock()
+        # 进行中的检索数，close() 等待其归零后再关闭向量存储
+        self._closed = False
+        self._active_searches = 0
+        self._search_cond = threading.Condition()
+        self.corpus_version = 0
+        self._query_embedding_cache = TTLCache(settings.RAG_QUERY_CACHE_SIZE, settings.RAG_QUERY_CACHE_TTL)
+        self._result_cache = TTLCache(settings.RAG_QUERY_CACHE_SIZE, settings.RAG_QUERY_CACHE_TTL)
+        self.gate = RetrievalGate(settings.RAG_GATE_THRESHOLD, settings.RAG_GATE_CLUSTERS,
+                                  lexical_min_match=settings.RAG_GATE_LEXICAL_MIN_MATCH)
+        # 可选的交叉编码器重排序，多个集合可共用同一个
+        self.rerank_enabled = settings.RAG_RERANK_ENABLED
+        self.reranker = reranker
+        # 异步检索使用的有界线程池，查询编码与检索不占用事件循环
+        self._query_executor = ThreadPoolExecutor(
+            max_workers=query_workers if query_workers is not None else settings.RAG_QUERY_WORKERS,
+            thread_name_prefix=f"rag-query-{collection_name}"
+        )
+        self._init_vectorstore(auto_ingest)
+
+    def _list_source_files(self) -> List[str]:
+        """列出文档目录下支持的源文件（相对路径）"""
+        if not os.path.isdir(self.doc_dir):
+            return []
+        return sorted(
+            file for file in os.listdir(self.doc_dir)
+            if file.endswith(SUPPORTED_EXTENSIONS) and os.path.isfile(os.path.join(self.doc_dir, file))
+        )
 
     def _load_documents(self) -> List:
         documents = []
-        for file in os.listdir(self.doc_dir):
-            file_path = os.path.join(self.doc_dir, file)
-            if file.endswith(".txt"):
-                loader = TextLoader(file_path, encoding="utf-8")
-                documents.extend(loader.load())
-            elif file.endswith(".pdf"):
-                loader = PyPDFLoader(file_path)
-                documents.extend(loader.load())
-            elif file.endswith(".docx"):
-                loader = Docx2txtLoader(file_path)
-                documents.extend(loader.load())
+        for file in self._list_source_files():
+            documents.extend(load_file(os.path.join(self.doc_dir, file)))
         return documents
 
-    def _init_vectorstore(self):
-        documents = self._load_documents()
-        if not documents:
-            self.vectorstore = None
-            return
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
-        chunked_documents = text_splitter.split_documents(documents)
-        embedding_model = HuggingFaceEmbeddings(
-            model_name=self.embedding_model_dir,
-            model_kwargs={"device": "cpu"},
-            encode_kwargs={"normalize_embeddings": True}
+    def _get_embedding_model(self) -> Embeddings:
+        """获取嵌入模型（每个引擎只加载一次），默认套上磁盘向量缓存"""
+        if self.embedding_model is None:
+            normalize = True
+            embedding_model = create_embeddings(
+                self.embedding_backend,
+                self.embedding_model_dir,
+                normalize=normalize,
+                onnx_quantized=self.onnx_quantized,
+                num_threads=settings.RAG_EMBEDDING_THREADS
+            )
+            if self.use_embedding_cache:
+                cache = EmbeddingCache(self.embedding_cache_dir, self.embedding_model_dir, normalize,
+                                       variant=self._embedding_variant())
+                embedding_model = CachedEmbeddings(embedding_model, cache)
+            self.embedding_model = embedding_model
+        return self.embedding_model
+
+    def _get_reranker(self) -> Optional[Reranker]:
+        """获取重排序器（首次使用时加载），加载失败时关闭重排序，退回原检索顺序"""
+        if self.reranker is None and self.rerank_enabled:
+            try:
+                cross_encoder = create_cross_encoder(
+                    settings.RAG_RERANK_BACKEND, settings.RAG_RERANK_MODEL_DIR, num_threads=settings.RAG_EMBEDDING_THREADS
+                )
+                self.reranker = Reranker(cross_encoder, budget_ms=settings.RAG_RERANK_BUDGET_MS)
+            except Exception as e:
+                logger.error(f"加载重排序模型失败，关闭重排序: {e}")
+                self.rerank_enabled = False
+        return self.reranker
+
+    def _embedding_variant(self) -> str:
+        """不同嵌入后端产出的向量不可混用，用于区分缓存与索引（huggingface 为空，兼容已有缓存）"""
+        if self.embedding_backend == "huggingface":
+            return ""
+        if self.embedding_backend == "onnx" and self.onnx_quantized:
+            return "onnx-int8"
+        return self.embedding_backend
+
+    def _create_vector_store(self) -> BaseVectorStore:
+        """根据配置创建向量存储后端（qdrant / numpy）"""
+        if self.vector_backend == "numpy":
+            return NumpyVectorStore(self.collection_name, os.path.join(self.index_dir, "numpy"),
+                                    dtype=self.vector_dtype, rescore=self.vector_rescore)
+        if self.vector_backend == "qdrant":
+            return QdrantVectorStore(
+                self.collection_name,
+                location=self.qdrant_location,
+                # 本地 Qdrant 的存储目录同一时间只能被一个客户端打开，每个集合单独一个目录
+                path=os.path.join(self.index_dir, "qdrant", self.collection_name),
+                dtype=self.vector_dtype,
+                rescore=self.vector_rescore
+            )
+        raise ValueError(f"不支持的向量存储后端: {self.vector_backend}")
+
+    def _index_settings(self) -> Dict[str, Any]:
+        index_settings = {
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "vector_backend": self.vector_backend,
+            "vector_dtype": self.vector_dtype,
+            # 量化精度下是否保留 float32 原始向量用于重新打分，存储布局随之变化
+            "vector_rescore": bool(self.vector_rescore) and self.vector_dtype != "float32",
+            "lexical_tokenizer": LEXICAL_TOKENIZER_VERSION
+        }
+        if self._embedding_variant():
+            index_settings["embedding"] = self._embedding_variant()
+        return index_settings
+
+    def _init_vectorstore(self, auto_ingest: bool = True):
+        self.vectorstore = self._create_vector_store()
+        if (not self.vectorstore.exists() or self.vectorstore.count() == 0
+                or not self.lexical_index.exists()
+                or self.manifest.settings != self._index_settings()):
+            # 集合与清单不一致（旧版本索引、切分参数或后端变化）时重建
+            self._create_collection()
+        if auto_ingest:
+            self.ingest()
+
+    def _create_collection(self):
+        """（重新）创建空的向量集合并清空入库清单"""
+        vector_size = len(self._get_embedding_model().embed_query("test"))
+        self.vectorstore.reset(vector_size)
+        self.lexical_index.reset()
+        self._bump_corpus_version()
+        self.manifest.reset(self._index_settings())
+        self.manifest.save()
+
+    def _create_pipeline(self) -> IngestionPipeline:
+        return IngestionPipeline(
+            embedding_model=self._get_embedding_model(),
+            vectorstore=self.vectorstore,
+            lexical_index=self.lexical_index,
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap,
+            max_workers=self.ingest_workers,
+            embed_batch_size=self.embed_batch_size,
+            streaming_threshold=self.streaming_threshold
         )
-        self.vectorstore = Qdrant.from_documents(
-            documents=chunked_documents,
-            embedding=embedding_model,
-            location=self.qdrant_location,
-            collection_name=self.collection_name
+
+    def ingest(self, on_progress: Optional[Callable[[Dict[str, int]], None]] = None) -> Dict[str, Any]:
+        """
+        增量入库
+
+        对比入库清单与文档目录：未变化的文件直接跳过，变化文件只编码新增分块并删除失效分块，
+        已删除文件的向量一并移除。需要处理的文件交给 IngestionPipeline 并行解析、分批编码写入。
+
+        Args:
+            on_progress: 进度回调（需处理的文件数、已完成文件数、分块数、待编码分块数、已编码分块数）
+
+        Returns:
+            Dict[str, Any]: 本次入库统计（含吞吐量）
+        """
+        with self._ingest_lock:
+            stats = {
+                "added_files": 0, "updated_files": 0, "removed_files": 0, "unchanged_files": 0,
+                "added_chunks": 0, "deleted_chunks": 0
+            }
+            sources = self._list_source_files()
+
+            for source in set(self.manifest.files) - set(sources):
+                stale_ids = self.manifest.remove_file(source)
+                self.vectorstore.delete(stale_ids)
+                self.lexical_index.delete(stale_ids)
+                stats["removed_files"] += 1
+                stats["deleted_chunks"] += len(stale_ids)
+
+            changed: Dict[str, Tuple[str, os.stat_result, bool]] = {}
+            for source in sources:
+                file_path = os.path.join(self.doc_dir, source)
+                stat = os.stat(file_path)
+                entry = self.manifest.get_file(source)
+                if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                    stats["unchanged_files"] += 1
+                    continue
+
+                hash_value = file_hash(file_path)
+                if entry and entry["file_hash"] == hash_value:
+                    # 内容未变，仅刷新文件时间戳
+                    self.manifest.set_file(source, hash_value, stat.st_size, stat.st_mtime, entry["chunks"])
+                    stats["unchanged_files"] += 1
+                    continue
+                changed[source] = (hash_value, stat, entry is not None)
+
+            def on_split(source: str, result: SplitResult) -> List[int]:
+                _, _, chunks = result
+                old_ids = set(self.manifest.chunk_ids(source))
+                new_ids = [chunk["id"] for chunk in chunks]
+                stale_ids = list(old_ids - set(new_ids))
+                self.vectorstore.delete(stale_ids)
+                self.lexical_index.delete(stale_ids)
+                added = [i for i, id_ in enumerate(new_ids) if id_ not in old_ids]
+                stats["deleted_chunks"] += len(stale_ids)
+                stats["added_chunks"] += len(added)
+                return added
+
+            def on_file_done(source: str, chunks: List[Dict[str, str]]):
+                hash_value, stat, existed = changed[source]
+                self.manifest.set_file(source, hash_value, stat.st_size, stat.st_mtime, chunks)
+                self.manifest.save()
+                stats["updated_files" if existed else "added_files"] += 1
+
+            if changed:
+                stats["throughput"] = self._create_pipeline().run(
+                    self.doc_dir, list(changed), on_split, on_file_done,
+                    known_ids=lambda source: set(self.manifest.chunk_ids(source)),
+                    on_progress=on_progress
+                )
+
+            self.vectorstore.persist()
+            self.lexical_index.persist()
+            self.manifest.save()
+            if stats["added_chunks"] or stats["deleted_chunks"]:
+                self._bump_corpus_version()
+            logger.info(f"RAG 集合 {self.collection_name} 增量入库完成: {stats}")
+            return stats
+
+    def list_sources(self) -> List[Dict[str, Any]]:
+        """列出文档目录中的源文件及入库状态（indexed / pending / stale）"""
+        sources = []
+        for source in self._list_source_files():
+            stat = os.stat(os.path.join(self.doc_dir, source))
+            entry = self.manifest.get_file(source)
+            if entry is None:
+                status = "pending"
+            elif entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                status = "indexed"
+            else:
+                status = "stale"
+            sources.append({
+                "source": source,
+                "size": stat.st_size,
+                "modified_at": stat.st_mtime,
+                "chunks": len(entry["chunks"]) if entry else 0,
+                "status": status
+            })
+        return sources
+
+    def remove_source(self, source: str) -> int:
+        """
+        删除源文件及其全部分块
+
+        Returns:
+            int: 删除的分块数，文件不存在且未入库时返回 -1
+        """
+        file_path = os.path.join(self.doc_dir, source)
+        with self._ingest_lock:
+            existed = os.path.isfile(file_path)
+            if existed:
+                os.remove(file_path)
+            if self.manifest.get_file(source) is None:
+                return 0 if existed else -1
+            stale_ids = self.manifest.remove_file(source)
+            self.vectorstore.delete(stale_ids)
+            self.lexical_index.delete(stale_ids)
+            self.vectorstore.persist()
+            self.lexical_index.persist()
+            self.manifest.save()
+            self._bump_corpus_version()
+        logger.info(f"RAG 集合 {self.collection_name} 已删除来源 {source}（{len(stale_ids)} 个分块）")
+        return len(stale_ids)
+
+    def rebuild(self):
+        """丢弃已有索引并根据文档目录重新构建"""
+        with self._ingest_lock:
+            self._create_collection()
+        self.ingest()
+
+    def close(self):
+        """
+        关闭向量存储（本地 Qdrant 会释放索引文件锁，NumPy 后端会落盘）
+
+        等待进行中的入库与检索结束后再关闭；关闭后的检索直接返回空结果，排队中的异步检索不会被取消。
+        """
+        with self._ingest_lock:
+            with self._search_cond:
+                self._closed = True
+                self._search_cond.wait_for(lambda: self._active_searches == 0)
+            self._query_executor.shutdown(wait=False)
+            if self.vectorstore is not None:
+                self.vectorstore.close()
+                self.vectorstore = None
+
+    @contextmanager
+    def _searching(self):
+        """登记一次进行中的检索，引擎已关闭时返回 False"""
+        with self._search_cond:
+            if self._closed or self.vectorstore is None:
+                yield False
+                return
+            self._active_searches += 1
+        try:
+            yield True
+        finally:
+            with self._search_cond:
+                self._active_searches -= 1
+                self._search_cond.notify_all()
+
+    async def _run_in_executor(self, default, func, *args):
+        """在检索线程池中执行，引擎关闭后返回 default"""
+        if self._closed:
+            return default
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._query_executor, func, *args)
+        except RuntimeError:
+            if self._closed:
+                return default
+            raise
+
+    def _fuse(self, dense_hits: List[SearchHit], lexical_hits: List[Tuple[str, float]], top_k: int) -> List[SearchHit]:
+        """按 RRF 融合稠密与词法两路结果，得分替换为融合得分"""
+        fused = reciprocal_rank_fusion([[hit.id for hit in dense_hits], [id_ for id_, _ in lexical_hits]])[:top_k]
+        return self._hits_by_ids(fused, {hit.id: hit for hit in dense_hits})
+
+    def _hits_by_ids(self, scored_ids: List[Tuple[str, float]], known: Optional[Dict[str, SearchHit]] = None) -> List[SearchHit]:
+        """按给定顺序组装检索结果，缺失的分块从向量存储取回"""
+        known = dict(known or {})
+        missing = [id_ for id_, _ in scored_ids if id_ not in known]
+        known.update((hit.id, hit) for hit in self.vectorstore.get(missing))
+        return [
+            SearchHit(id=id_, score=score, text=known[id_].text, metadata=known[id_].metadata)
+            for id_, score in scored_ids
+            if id_ in known
+        ]
+
+    def search(self, query_text: str, top_k: int = 3, mode: Optional[str] = None, gated: bool = False) -> List[SearchHit]:
+        """
+        检索与查询最相关的分块（含得分和元数据）
+
+        Args:
+            query_text: 查询文本
+            top_k: 返回的分块数
+            mode: 检索方式，默认使用引擎配置的 retrieval_mode
+            gated: 是否先经过检索门控，未通过时返回空列表
+        """
+        with self._searching() as open_:
+            if not open_:
+                return []
+            if gated and settings.RAG_GATE_ENABLED and not self.should_retrieve(query_text):
+                return []
+            reranker = self._get_reranker() if self.rerank_enabled else None
+            if reranker is None:
+                return self.search_batch([query_text], top_k, mode)[0]
+            # 先廉价地召回更宽的候选集，再由交叉编码器挑出最好的 top_k
+            candidates = self.search_batch([query_text], max(top_k, settings.RAG_RERANK_CANDIDATES), mode)[0]
+            return reranker.rerank(query_text, candidates, top_k)
+
+    def search_batch(self, query_texts: List[str], top_k: int = 3, mode: Optional[str] = None) -> List[List[SearchHit]]:
+        """
+        批量检索
+
+        结果按 (归一化查询, top_k, 检索方式, 语料版本) 缓存，入库后语料版本递增，旧结果自动失效；
+        未命中的查询一次性编码并批量检索。
+        """
+        mode = mode or self.retrieval_mode
+        with self._searching() as open_:
+            if not open_ or not query_texts:
+                return [[] for _ in query_texts]
+
+            corpus_version = self.corpus_version
+            keys = [(normalize_query(text), top_k, mode, corpus_version) for text in query_texts]
+            results: List[Optional[List[SearchHit]]] = [self._result_cache.get(key) for key in keys]
+            missing = [i for i, hits in enumerate(results) if hits is None]
+            if missing:
+                computed = self._search_uncached([query_texts[i] for i in missing], top_k, mode)
+                for i, hits in zip(missing, computed):
+                    self._result_cache.put(keys[i], hits)
+                    results[i] = hits
+            return [list(hits) for hits in results]
+
+    def _embed_queries(self, query_texts: List[str]) -> List[List[float]]:
+        """编码查询，按归一化文本缓存查询向量"""
+        embedding_model = self._get_embedding_model()
+        vectors = []
+        for text in query_texts:
+            key = normalize_query(text)
+            vector = self._query_embedding_cache.get(key)
+            if vector is None:
+                vector = embedding_model.embed_query(text)
+                self._query_embedding_cache.put(key, vector)
+            vectors.append(vector)
+        return vectors
+
+    def _search_uncached(self, query_texts: List[str], top_k: int, mode: str) -> List[List[SearchHit]]:
+        if mode == "lexical":
+            return [self._hits_by_ids(self.lexical_index.search(text, top_k)) for text in query_texts]
+
+        candidate_k = top_k * self.HYBRID_CANDIDATE_FACTOR if mode == "hybrid" else top_k
+        dense_results = self.vectorstore.search_batch(self._embed_queries(query_texts), candidate_k)
+        if mode == "dense":
+            return dense_results
+        return [
+            self._fuse(dense_hits, self.lexical_index.search(text, candidate_k), top_k)
+            for text, dense_hits in zip(query_texts, dense_results)
+        ]
+
+    def _bump_corpus_version(self):
+        """语料变化后递增版本号，依赖旧语料的检索结果全部失效"""
+        self.corpus_version += 1
+        self._result_cache.clear()
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """查询向量缓存与检索结果缓存的命中统计"""
+        return {
+            "corpus_version": self.corpus_version,
+            "query_embedding": self._query_embedding_cache.get_stats(),
+            "query_result": self._result_cache.get_stats(),
+            "gate": self.gate.get_stats(),
+            "rerank": self.reranker.get_stats() if self.reranker is not None else None
+        }
+
+    def should_retrieve(self, query_text: str) -> bool:
+        """
+        检索门控：判断知识库是否可能对该查询有帮助
+
+        寒暄、简短追问直接跳过；混合检索下查询词在 BM25 索引中的命中比例达到 lexical_min_match 时通过，
+        否则比较查询向量与语料簇中心的最大相似度与阈值。
+        查询向量会进入查询向量缓存，随后的稠密检索不再重复编码。
+        """
+        if self.gate.is_small_talk(query_text):
+            return self.gate.record(False)
+        if self.vectorstore is None or self.vectorstore.count() == 0:
+            return self.gate.record(False)
+        if self.retrieval_mode == "lexical":
+            return self.gate.record(True)
+        if self.retrieval_mode == "hybrid" and self.lexical_index.match_ratio(query_text) >= self.gate.lexical_min_match:
+            return self.gate.record(True)
+        self.gate.refresh(self.vectorstore, self.corpus_version)
+        score = self.gate.score(self._embed_queries([query_text])[0])
+        return self.gate.record(score is None or score >= self.gate.threshold)
+
+    def query(self, query_text: str, top_k: int = 3, gated: bool = False) -> List[str]:
+        """
+        检索分块文本
+
+        Args:
+            query_text: 查询文本
+            top_k: 返回的分块数
+            gated: 是否先经过检索门控，未通过时返回空列表
+        """
+        return [hit.text for hit in self.search(query_text, top_k, gated=gated)]
+
+    def build_context(self,
+                      query_text: str,
+                      top_k: int = 3,
+                      token_budget: Optional[int] = None,
+                      gated: bool = False,
+                      count_tokens: Optional[Callable[[str], int]] = None) -> str:
+        """
+        检索并组装知识库上下文
+
+        检索结果经过去重、相邻分块合并、句子级抽取压缩，按 token 预算装箱。
+
+        Args:
+            query_text: 查询文本
+            top_k: 检索的分块数
+            token_budget: 上下文 token 预算，默认 settings.RAG_CONTEXT_TOKEN_BUDGET
+            gated: 是否先经过检索门控
+            count_tokens: token 计数函数，默认按字符数估算
+
+        Returns:
+            str: 组装后的上下文，无可用内容时为空字符串
+        """
+        hits = self.search(query_text, top_k, gated=gated)
+        budget = token_budget if token_budget is not None else settings.RAG_CONTEXT_TOKEN_BUDGET
+        return ContextPacker(count_tokens).pack(query_text, hits, budget)
+
+    async def abuild_context(self,
+                             query_text: str,
+                             top_k: int = 3,
+                             token_budget: Optional[int] = None,
+                             gated: bool = False,
+                             count_tokens: Optional[Callable[[str], int]] = None) -> str:
+        """异步版本的 build_context，在线程池中执行"""
+        return await self._run_in_executor(
+            "", self.build_context, query_text, top_k, token_budget, gated, count_tokens
         )
 
-    def get_retriever(self):
-        if self.vectorstore is None:
-            self._init_vectorstore()
-        if self.vectorstore is None:
-            raise RuntimeError("No documents loaded for RAG knowledge base.")
-        return self.vectorstore.as_retriever()
-
-    def query(self, query_text: str, top_k: int = 3) -> List[str]:
-        retriever = self.get_retriever()
-        docs = retriever.get_relevant_documents(query_text)
-        return [doc.page_content for doc in docs] 
\ No newline at end of file
+    async def asearch(self, query_text: str, top_k: int = 3, mode: Optional[str] = None, gated: bool = False) -> List[SearchHit]:
+        """
+        异步检索
+
+        查询编码和检索在引擎的有界线程池中执行，不阻塞事件循环。
+        调用方任务被取消（如客户端断开）时立即返回；尚未开始执行的检索会被一并取消。
+        引擎关闭后返回空列表。
+        """
+        return await self._run_in_executor([], self.search, query_text, top_k, mode, gated)
+
+    async def aquery(self, query_text: str, top_k: int = 3, gated: bool = False) -> List[str]:
+        """异步版本的 query，门控与检索都在线程池中执行"""
+        return await self._run_in_executor([], self.query, query_text, top_k, gated)
@@ -0,0 +1,239 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from backend.config.settings import settings
+from backend.core.RAG.context_packer import ContextPacker
+from backend.core.RAG.lexical_index import reciprocal_rank_fusion
+from backend.core.RAG.rag_engine import RAGEngine
+from backend.core.RAG.vector_store import SearchHit
+from backend.utils.logger import logger
+
+
+class RAGManager:
+    """
+    RAG 引擎管理器 - 进程级单例
+
+    每个命名集合（城市、合作机构等）对应一个独立的 RAGEngine，拥有自己的文档目录和索引，
+    按需加载、卸载；所有集合共用同一个嵌入模型和重排序模型。
+    应用启动时预加载默认集合，之后所有请求复用，避免每条消息都重新加载文档、加载嵌入模型和重新编码语料。
+    一次查询可以并行分发到多个集合，按得分合并 top-k。
+    """
+
+    _engines: Dict[str, RAGEngine] = {}
+    # 运行时注册的集合（集合名 -> 文档目录），与 settings.RAG_COLLECTIONS 合并使用
+    _collections: Dict[str, str] = {}
+    _lock = threading.RLock()
+    # 每个集合的加载锁，同一集合只构建一次
+    _load_locks: Dict[str, threading.Lock] = {}
+    _executor: Optional[ThreadPoolExecutor] = None
+
+    @classmethod
+    def _collection_dirs(cls) -> Dict[str, str]:
+        return {**settings.RAG_COLLECTIONS, **cls._collections}
+
+    @classmethod
+    def _default_collection(cls) -> str:
+        return settings.RAG_DEFAULT_COLLECTIONS[0] if settings.RAG_DEFAULT_COLLECTIONS else "my_documents"
+
+    @classmethod
+    def initialize(cls) -> RAGEngine:
+        """初始化默认集合（重复调用不会重复构建），返回第一个默认集合的引擎"""
+        for name in settings.RAG_DEFAULT_COLLECTIONS:
+            cls.load_collection(name)
+        return cls.load_collection(cls._default_collection())
+
+    @classmethod
+    def register_collection(cls, name: str, doc_dir: str):
+        """注册（或修改）集合的文档目录，修改已加载集合的目录需先卸载"""
+        with cls._lock:
+            if name in cls._engines and cls._engines[name].doc_dir != doc_dir:
+                raise ValueError(f"集合 '{name}' 已加载，修改文档目录前请先卸载")
+            cls._collections[name] = doc_dir
+
+    @classmethod
+    def get_doc_dir(cls, name: str) -> str:
+        """集合的文档目录（不会加载集合）"""
+        doc_dirs = cls._collection_dirs()
+        if name not in doc_dirs:
+            raise ValueError(f"RAG 集合 '{name}' 未配置")
+        return doc_dirs[name]
+
+    @classmethod
+    def load_collection(cls, name: str, auto_ingest: bool = True) -> RAGEngine:
+        """
+        加载集合（已加载时直接返回），auto_ingest 为 False 时加载后不做增量入库
+
+        引擎在集合自己的锁内构建（包括重建索引和增量入库），同一集合不会重复构建；
+        全局锁只在挑选共用模型和发布引擎时持有，加载大集合时不影响其他集合。
+        """
+        engine = cls._engines.get(name)
+        if engine is not None:
+            return engine
+
+        doc_dir = cls.get_doc_dir(name)
+        with cls._lock:
+            load_lock = cls._load_locks.setdefault(name, threading.Lock())
+        with load_lock:
+            engine = cls._engines.get(name)
+            if engine is not None:
+                return engine
+            with cls._lock:
+                shared_model = next((e.embedding_model for e in cls._engines.values() if e.embedding_model), None)
+                shared_reranker = next((e.reranker for e in cls._engines.values() if e.reranker), None)
+            logger.info(f"开始加载 RAG 集合 {name}...")
+            engine = RAGEngine(
+                doc_dir=doc_dir,
+                collection_name=name,
+                embedding_model=shared_model,
+                reranker=shared_reranker,
+                auto_ingest=auto_ingest
+            )
+            with cls._lock:
+                cls._engines[name] = engine
+            logger.info(f"RAG 集合 {name} 加载完成。")
+            return engine
+
+    @classmethod
+    def unload_collection(cls, name: str) -> bool:
+        """卸载集合，释放内存中的索引（磁盘上的索引保留，下次加载时直接复用）"""
+        with cls._lock:
+            engine = cls._engines.pop(name, None)
+        if engine is None:
+            return False
+        engine.close()
+        logger.info(f"RAG 集合 {name} 已卸载。")
+        return True
+
+    @classmethod
+    def list_collections(cls) -> Dict[str, Dict[str, Any]]:
+        """列出已配置的集合及加载状态"""
+        return {
+            name: {
+                "doc_dir": doc_dir,
+                "loaded": name in cls._engines,
+                "chunks": cls._engines[name].vectorstore.count() if name in cls._engines and cls._engines[name].vectorstore else None
+            }
+            for name, doc_dir in cls._collection_dirs().items()
+        }
+
+    @classmethod
+    def get_engine(cls, name: Optional[str] = None) -> RAGEngine:
+        """获取集合的引擎，未加载时自动加载；不指定集合时返回默认集合"""
+        return cls.load_collection(name or cls._default_collection())
+
+    @classmethod
+    async def aget_engine(cls, name: Optional[str] = None, auto_ingest: bool = True) -> RAGEngine:
+        """异步获取集合的引擎，需要加载时在线程中执行，不阻塞事件循环；auto_ingest 含义同 load_collection"""
+        name = name or cls._default_collection()
+        engine = cls._engines.get(name)
+        if engine is not None:
+            return engine
+        return await asyncio.to_thread(cls.load_collection, name, auto_ingest)
+
+    @classmethod
+    def _get_executor(cls) -> ThreadPoolExecutor:
+        if cls._executor is None:
+            with cls._lock:
+                if cls._executor is None:
+                    cls._executor = ThreadPoolExecutor(max_workers=settings.RAG_QUERY_WORKERS, thread_name_prefix="rag-fanout")
+        return cls._executor
+
+    @staticmethod
+    def _merge(name_hits: List[tuple], top_k: int) -> List[SearchHit]:
+        """
+        合并各集合的结果取 top_k，元数据中标注来源集合
+
+        各集合的得分含义不同（RRF 融合分、余弦相似度或交叉编码器 logit），不能直接比较，
+        因此按各集合内的名次做倒数排名融合，命中保留原得分。
+        """
+        merged: Dict[str, SearchHit] = {}
+        rankings = []
+        for name, hits in name_hits:
+            keys = []
+            for hit in hits:
+                key = f"{name}\x00{hit.id}"
+                merged[key] = SearchHit(id=hit.id, score=hit.score, text=hit.text,
+                                        metadata={**hit.metadata, "collection": name})
+                keys.append(key)
+            rankings.append(keys)
+        return [merged[key] for key, _ in reciprocal_rank_fusion(rankings)[:top_k]]
+
+    @classmethod
+    def search(cls,
+               query_text: str,
+               collections: Optional[List[str]] = None,
+               top_k: int = 3,
+               gated: bool = False) -> List[SearchHit]:
+        """
+        在多个集合中并行检索并合并 top-k
+
+        Args:
+            query_text: 查询文本
+            collections: 要检索的集合，默认 settings.RAG_DEFAULT_COLLECTIONS
+            top_k: 返回的分块数
+            gated: 是否先经过各集合的检索门控
+        """
+        names = collections or settings.RAG_DEFAULT_COLLECTIONS
+        engines = [(name, cls.get_engine(name)) for name in names]
+        if len(engines) == 1:
+            name, engine = engines[0]
+            return cls._merge([(name, engine.search(query_text, top_k, gated=gated))], top_k)
+        futures = [
+            (name, cls._get_executor().submit(engine.search, query_text, top_k, None, gated))
+            for name, engine in engines
+        ]
+        return cls._merge([(name, future.result()) for name, future in futures], top_k)
+
+    @classmethod
+    async def asearch(cls,
+                      query_text: str,
+                      collections: Optional[List[str]] = None,
+                      top_k: int = 3,
+                      gated: bool = False) -> List[SearchHit]:
+        """异步版本的 search，各集合在自己的检索线程池中并行执行"""
+        names = collections or settings.RAG_DEFAULT_COLLECTIONS
+        engines = [await cls.aget_engine(name) for name in names]
+        results = await asyncio.gather(*(engine.asearch(query_text, top_k, gated=gated) for engine in engines))
+        return cls._merge(list(zip(names, results)), top_k)
+
+    @classmethod
+    def build_context(cls,
+                      query_text: str,
+                      collections: Optional[List[str]] = None,
+                      top_k: int = 3,
+                      token_budget: Optional[int] = None,
+                      gated: bool = False,
+                      count_tokens: Optional[Callable[[str], int]] = None) -> str:
+        """在指定集合中检索并按 token 预算组装知识库上下文"""
+        hits = cls.search(query_text, collections, top_k, gated)
+        budget = token_budget if token_budget is not None else settings.RAG_CONTEXT_TOKEN_BUDGET
+        return ContextPacker(count_tokens).pack(query_text, hits, budget)
+
+    @classmethod
+    async def abuild_context(cls,
+                             query_text: str,
+                             collections: Optional[List[str]] = None,
+                             top_k: int = 3,
+                             token_budget: Optional[int] = None,
+                             gated: bool = False,
+                             count_tokens: Optional[Callable[[str], int]] = None) -> str:
+        """异步版本的 build_context"""
+        hits = await cls.asearch(query_text, collections, top_k, gated)
+        budget = token_budget if token_budget is not None else settings.RAG_CONTEXT_TOKEN_BUDGET
+        return ContextPacker(count_tokens).pack(query_text, hits, budget)
+
+    @classmethod
+    def shutdown(cls):
+        """关闭所有已加载的集合，以及集合共用的重排序器"""
+        rerankers = {id(e.reranker): e.reranker for e in list(cls._engines.values()) if e.reranker is not None}
+        for name in list(cls._engines):
+            cls.unload_collection(name)
+        for reranker in rerankers.values():
+            reranker.close()
+        with cls._lock:
+            if cls._executor is not None:
+                cls._executor.shutdown(wait=False, cancel_futures=True)
+                cls._executor = None
+        logger.info("RAG 引擎已关闭。")
@@ -0,0 +1,189 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from backend.core.RAG.ingestion_manifest import content_hash
+from backend.core.RAG.query_cache import TTLCache, normalize_query
+from backend.core.RAG.vector_store import SearchHit
+from backend.utils.logger import logger
+
+RERANK_BACKENDS = ("onnx", "huggingface")
+
+
+class OnnxCrossEncoder:
+    """
+    ONNX Runtime CPU 交叉编码器
+
+    模型目录需包含 tokenizer.json 与导出的 model.onnx（序列分类模型，输出 logits），
+    (查询, 分块) 成对编码后一次前向计算得分。
+    """
+
+    MODEL_FILE = "model.onnx"
+
+    def __init__(self, model_dir: str, max_length: int = 512, num_threads: int = 0):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("ONNX 重排序后端需要安装 onnxruntime 和 tokenizers") from e
+
+        options = onnxruntime.SessionOptions()
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        model_path = os.path.join(model_dir, self.MODEL_FILE)
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {item.name for item in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        logger.info(f"ONNX 重排序模型已加载: {model_path}")
+
+    def predict(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        encodings = self.tokenizer.encode_batch(list(pairs))
+        feeds = {
+            "input_ids": np.asarray([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.asarray([e.attention_mask for e in encodings], dtype=np.int64)
+        }
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.asarray([e.type_ids for e in encodings], dtype=np.int64)
+        logits = self.session.run(None, feeds)[0]
+        # 单输出为相关性得分；二分类取"相关"一类的 logit
+        return (logits[:, 0] if logits.shape[1] == 1 else logits[:, 1]).astype(float).tolist()
+
+
+class HuggingFaceCrossEncoder:
+    """sentence-transformers 交叉编码器（依赖 torch）"""
+
+    def __init__(self, model_dir: str):
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_dir, device="cpu")
+
+    def predict(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        return [float(score) for score in self.model.predict(list(pairs), batch_size=len(pairs))]
+
+
+def create_cross_encoder(backend: str, model_dir: str, num_threads: int = 0):
+    """按名称创建交叉编码器"""
+    if backend == "onnx":
+        return OnnxCrossEncoder(model_dir, num_threads=num_threads)
+    if backend == "huggingface":
+        return HuggingFaceCrossEncoder(model_dir)
+    raise ValueError(f"不支持的重排序后端: {backend}")
+
+
+class Reranker:
+    """
+    检索结果重排序
+
+    对 (查询, 分块) 打分并按得分重排：
+    1. 得分按 (查询哈希, 分块哈希) 缓存，只有未命中的分块进入模型；
+    2. 未命中的分块在一次前向计算中批量打分；
+    3. 打分有硬性时间预算，超时直接返回原有（稠密/融合）顺序，尚未开始的打分任务随之取消，
+       已在计算的任务算完后得分仍写入缓存。
+    前向计算在单线程中串行执行，并发请求排队等待的时间同样计入预算；
+    排队的任务超过 max_pending 时不再提交，直接返回原顺序，避免积压拖垮后续请求。
+    """
+
+    def __init__(self, cross_encoder, budget_ms: float = 150, cache_size: int = 8192, cache_ttl: float = 3600,
+                 max_pending: int = 2):
+        self.cross_encoder = cross_encoder
+        self.budget_ms = budget_ms
+        self.max_pending = max_pending
+        self._cache = TTLCache(cache_size, cache_ttl)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-rerank")
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self.reranked = 0
+        self.fallbacks = 0
+        self.rejected = 0
+
+    @staticmethod
+    def _chunk_hash(hit: SearchHit) -> str:
+        return hit.metadata.get("chunk_hash") or content_hash(hit.text)
+
+    def _score_missing(self, query_text: str, query_hash: str, hits: List[SearchHit]) -> List[float]:
+        scores = self.cross_encoder.predict([(query_text, hit.text) for hit in hits])
+        for hit, score in zip(hits, scores):
+            self._cache.put((query_hash, self._chunk_hash(hit)), score)
+        return scores
+
+    def _submit(self, query_text: str, query_hash: str, hits: List[SearchHit]):
+        """提交打分任务，未完成的任务已达上限时返回 None"""
+        with self._pending_lock:
+            if self._pending >= self.max_pending:
+                return None
+            self._pending += 1
+        future = self._executor.submit(self._score_missing, query_text, query_hash, hits)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future):
+        with self._pending_lock:
+            self._pending -= 1
+
+    def rerank(self, query_text: str, hits: List[SearchHit], top_k: int) -> List[SearchHit]:
+        """
+        重排序检索结果
+
+        Args:
+            query_text: 查询文本
+            hits: 按原有顺序排列的候选分块
+            top_k: 返回的分块数
+
+        Returns:
+            List[SearchHit]: 得分替换为交叉编码器得分的前 top_k 个分块；超时时为原顺序的前 top_k 个
+        """
+        if len(hits) <= 1:
+            return hits[:top_k]
+        started = time.perf_counter()
+        query_hash = hashlib.sha256(normalize_query(query_text).encode("utf-8")).hexdigest()
+        scores: List[Any] = [self._cache.get((query_hash, self._chunk_hash(hit))) for hit in hits]
+        missing = [i for i, score in enumerate(scores) if score is None]
+
+        if missing:
+            future = self._submit(query_text, query_hash, [hits[i] for i in missing])
+            if future is None:
+                self.rejected += 1
+                self.fallbacks += 1
+                logger.warning("重排序任务积压，使用原检索顺序")
+                return hits[:top_k]
+            remaining = self.budget_ms / 1000 - (time.perf_counter() - started)
+            try:
+                computed = future.result(timeout=max(remaining, 0))
+            except FutureTimeoutError:
+                future.cancel()
+                self.fallbacks += 1
+                logger.warning(f"重排序超出时间预算 {self.budget_ms}ms，使用原检索顺序")
+                return hits[:top_k]
+            except Exception as e:
+                self.fallbacks += 1
+                logger.error(f"重排序失败，使用原检索顺序: {e}")
+                return hits[:top_k]
+            for i, score in zip(missing, computed):
+                scores[i] = score
+
+        self.reranked += 1
+        order = sorted(range(len(hits)), key=lambda i: scores[i], reverse=True)[:top_k]
+        return [
+            SearchHit(id=hits[i].id, score=float(scores[i]), text=hits[i].text, metadata=hits[i].metadata)
+            for i in order
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "budget_ms": self.budget_ms,
+            "reranked": self.reranked,
+            "fallbacks": self.fallbacks,
+            "rejected": self.rejected,
+            "score_cache": self._cache.get_stats()
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,104 @@
+import re
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+from backend.core.RAG.query_cache import normalize_query
+from backend.core.RAG.vector_store import BaseVectorStore
+from backend.utils.logger import logger
+
+# 寒暄、致谢和"再详细一点"之类的追问，知识库帮不上忙
+SMALL_TALK_PATTERN = re.compile(
+    r"^(你好|您好|嗨|哈喽|hi|hello|hey|早上好|晚上好|谢谢|多谢|感谢|谢了|thanks|thank you|好的|好|嗯|嗯嗯|哦|ok|okay|"
+    r"再见|拜拜|bye|继续|接着说|再详细一点|详细一点|详细点|再详细点|展开说说|具体点|还有吗|还有呢|然后呢|为什么|"
+    r"是吗|是的|对|对的|不对|没问题|明白了|知道了|收到)$"
+)
+_PUNCTUATION_PATTERN = re.compile(r"[\s\W_]+")
+
+
+def spherical_kmeans(vectors: np.ndarray, n_clusters: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """对已归一化的向量做球面 k-means，返回归一化后的簇中心"""
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        empty = ~sums.any(axis=1)
+        sums[empty] = centroids[empty]
+        centroids = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-12)
+    return centroids
+
+
+class RetrievalGate:
+    """
+    检索门控
+
+    在真正检索之前判断知识库是否可能有帮助：
+    1. 寒暄、致谢、简短追问等直接跳过；
+    2. 使用 BM25 的检索方式下，查询词大多能在倒排索引中找到时直接通过（地名等精确词匹配）；
+    3. 否则查询向量与语料簇中心的最大余弦相似度低于阈值时跳过。
+    簇中心从向量存储采样后用球面 k-means 计算，语料版本变化时重新计算。
+    """
+
+    def __init__(self, threshold: float = 0.6, n_clusters: int = 16, sample_size: int = 4096,
+                 lexical_min_match: float = 0.5):
+        self.threshold = threshold
+        self.lexical_min_match = lexical_min_match
+        self.n_clusters = n_clusters
+        self.sample_size = sample_size
+        self._centroids: Optional[np.ndarray] = None
+        self._centroid_version: Optional[int] = None
+        self._lock = threading.Lock()
+        self.passed = 0
+        self.skipped = 0
+
+    @staticmethod
+    def is_small_talk(query_text: str) -> bool:
+        """寒暄或无实际信息的追问"""
+        text = _PUNCTUATION_PATTERN.sub("", normalize_query(query_text))
+        return len(text) <= 1 or bool(SMALL_TALK_PATTERN.match(text))
+
+    def refresh(self, vectorstore: BaseVectorStore, corpus_version: int):
+        """语料版本变化时重新计算簇中心"""
+        if self._centroid_version == corpus_version:
+            return
+        with self._lock:
+            if self._centroid_version == corpus_version:
+                return
+            vectors = vectorstore.sample_vectors(self.sample_size)
+            if len(vectors):
+                vectors = vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+                self._centroids = spherical_kmeans(vectors, self.n_clusters)
+            else:
+                self._centroids = None
+            self._centroid_version = corpus_version
+            logger.info(f"检索门控簇中心已更新，语料版本 {corpus_version}，"
+                        f"簇数 {0 if self._centroids is None else len(self._centroids)}")
+
+    def score(self, query_vector: List[float]) -> Optional[float]:
+        """查询与最近簇中心的余弦相似度，没有簇中心时返回 None"""
+        centroids = self._centroids
+        if centroids is None:
+            return None
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) + 1e-12)
+        return float(np.max(centroids @ query))
+
+    def record(self, passed: bool) -> bool:
+        if passed:
+            self.passed += 1
+        else:
+            self.skipped += 1
+        return passed
+
+    def get_stats(self):
+        return {
+            "threshold": self.threshold,
+            "lexical_min_match": self.lexical_min_match,
+            "clusters": 0 if self._centroids is None else len(self._centroids),
+            "passed": self.passed,
+            "skipped": self.skipped
+        }
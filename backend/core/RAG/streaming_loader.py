@@ -0,0 +1,96 @@
+import zipfile
+from typing import Any, Dict, Iterator, Tuple
+from xml.etree import ElementTree
+
+from langchain_community.document_loaders import PyPDFLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from backend.core.RAG.ingestion_manifest import content_hash, chunk_id
+
+_WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+# TXT / DOCX 每次产出的文本片段大小（字符）
+SEGMENT_CHARS = 64 * 1024
+
+
+def _iter_txt_segments(file_path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    buffer, size = [], 0
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            buffer.append(line)
+            size += len(line)
+            if size >= SEGMENT_CHARS:
+                yield "".join(buffer), {}
+                buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer), {}
+
+
+def _iter_docx_segments(file_path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """流式解析 word/document.xml，逐段落读取，解析过的元素立即释放"""
+    buffer, size = [], 0
+    with zipfile.ZipFile(file_path) as archive, archive.open("word/document.xml") as document:
+        for _, element in ElementTree.iterparse(document, events=("end",)):
+            if element.tag != f"{_WORD_NAMESPACE}p":
+                continue
+            paragraph = "".join(node.text or "" for node in element.iter(f"{_WORD_NAMESPACE}t"))
+            element.clear()
+            buffer.append(paragraph + "\n")
+            size += len(paragraph) + 1
+            if size >= SEGMENT_CHARS:
+                yield "".join(buffer), {}
+                buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer), {}
+
+
+def _iter_pdf_segments(file_path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    for page in PyPDFLoader(file_path).lazy_load():
+        yield page.page_content, dict(page.metadata)
+
+
+def iter_segments(file_path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """逐页（PDF）或逐片段（TXT / DOCX）读取文件，产出 (文本, 元数据)"""
+    if file_path.endswith(".pdf"):
+        return _iter_pdf_segments(file_path)
+    if file_path.endswith(".docx"):
+        return _iter_docx_segments(file_path)
+    if file_path.endswith(".txt"):
+        return _iter_txt_segments(file_path)
+    return iter(())
+
+
+def iter_chunks(file_path: str, source: str, chunk_size: int, chunk_overlap: int) -> Iterator[Tuple[str, Dict[str, Any], Dict[str, str]]]:
+    """
+    增量切分大文件
+
+    每个片段与上一片段未完结的尾部拼接后切分，最后一个分块留到下一轮，
+    避免在片段边界处硬切。内存占用只与片段大小有关，与文档大小无关。
+
+    Yields:
+        Tuple: (分块文本, 元数据, 清单记录 {"id": ..., "hash": ...})
+    """
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    occurrences: Dict[str, int] = {}
+    index = 0
+    carry, carry_metadata = "", {}
+
+    def make_chunk(text: str, metadata: Dict[str, Any]):
+        nonlocal index
+        hash_value = content_hash(text)
+        occurrence = occurrences.get(hash_value, 0)
+        occurrences[hash_value] = occurrence + 1
+        chunk_metadata = {**metadata, "source": source, "chunk_hash": hash_value, "chunk_index": index}
+        index += 1
+        return text, chunk_metadata, {"id": chunk_id(source, hash_value, occurrence), "hash": hash_value}
+
+    for segment, metadata in iter_segments(file_path):
+        pieces = text_splitter.split_text(carry + segment)
+        if not pieces:
+            continue
+        for i, piece in enumerate(pieces[:-1]):
+            # 第一个分块以上一片段的尾部开头，沿用上一片段的元数据（如页码）
+            yield make_chunk(piece, carry_metadata if i == 0 and carry else metadata)
+        carry, carry_metadata = pieces[-1], metadata
+    if carry:
+        yield make_chunk(carry, carry_metadata)
@@ -0,0 +1,507 @@
+import json
+import os
+import threading
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+from pydantic import BaseModel, Field
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as qdrant_models
+
+from backend.utils.logger import logger
+
+
+class SearchHit(BaseModel):
+    """向量检索结果"""
+    id: str = Field(..., description="分块ID")
+    score: float = Field(..., description="相似度得分（余弦/内积）")
+    text: str = Field(..., description="分块文本")
+    metadata: Dict[str, Any] = Field(default_factory=dict, description="分块元数据")
+
+
+class BaseVectorStore:
+    """
+    向量存储后端接口
+
+    RAGEngine 只通过这些方法读写向量，具体存储由子类实现。
+    """
+
+    def reset(self, dim: int):
+        """清空并按给定维度重新创建存储"""
+        raise NotImplementedError
+
+    def exists(self) -> bool:
+        """存储是否已创建"""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def add(self, ids: List[str], vectors: List[List[float]], texts: List[str], metadatas: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]):
+        raise NotImplementedError
+
+    def get(self, ids: List[str]) -> List[SearchHit]:
+        """按ID取回分块（得分为 0，不存在的ID被忽略）"""
+        raise NotImplementedError
+
+    def sample_vectors(self, limit: int) -> np.ndarray:
+        """取最多 limit 条向量（float32），用于估计语料分布"""
+        raise NotImplementedError
+
+    def search(self, query_vector: List[float], top_k: int) -> List[SearchHit]:
+        return self.search_batch([query_vector], top_k)[0]
+
+    def search_batch(self, query_vectors: List[List[float]], top_k: int) -> List[List[SearchHit]]:
+        raise NotImplementedError
+
+    def persist(self):
+        """将内存中的改动落盘（自带持久化的后端无需实现）"""
+
+    def close(self):
+        """释放底层资源"""
+
+
+class QdrantVectorStore(BaseVectorStore):
+    """
+    Qdrant 向量存储（本地磁盘模式、内存模式或远程服务）
+
+    dtype 为 "float16" 时以半精度存储向量；为 "int8" 时启用 Qdrant 标量量化，
+    量化向量常驻内存，rescore 为 True 时用原始向量对过采样的候选重新打分。
+    """
+
+    # 与 langchain Qdrant 的 payload 结构保持一致，兼容已有索引
+    CONTENT_KEY = "page_content"
+    METADATA_KEY = "metadata"
+
+    # int8 量化检索时候选过采样倍数
+    RESCORE_FACTOR = 4
+
+    def __init__(self, collection_name: str, location: Optional[str] = None, path: Optional[str] = None,
+                 batch_size: int = 256, dtype: str = "float32", rescore: bool = True):
+        if dtype not in NumpyVectorStore.DTYPES:
+            raise ValueError(f"不支持的向量精度: {dtype}")
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.dtype = dtype
+        self.rescore = rescore
+        if location:
+            self.client = QdrantClient(location=location)
+        else:
+            os.makedirs(path, exist_ok=True)
+            self.client = QdrantClient(path=path)
+
+    def exists(self) -> bool:
+        return any(c.name == self.collection_name for c in self.client.get_collections().collections)
+
+    def count(self) -> int:
+        if not self.exists():
+            return 0
+        return self.client.count(collection_name=self.collection_name, exact=True).count
+
+    def reset(self, dim: int):
+        if self.exists():
+            self.client.delete_collection(collection_name=self.collection_name)
+        datatype = qdrant_models.Datatype.FLOAT16 if self.dtype == "float16" else None
+        quantization = None
+        if self.dtype == "int8":
+            quantization = qdrant_models.ScalarQuantization(
+                scalar=qdrant_models.ScalarQuantizationConfig(type=qdrant_models.ScalarType.INT8, always_ram=True)
+            )
+        self.client.create_collection(
+            collection_name=self.collection_name,
+            vectors_config=qdrant_models.VectorParams(size=dim, distance=qdrant_models.Distance.COSINE, datatype=datatype),
+            quantization_config=quantization
+        )
+
+    def add(self, ids: List[str], vectors: List[List[float]], texts: List[str], metadatas: List[Dict[str, Any]]):
+        for start in range(0, len(ids), self.batch_size):
+            end = start + self.batch_size
+            points = [
+                qdrant_models.PointStruct(
+                    id=id_,
+                    vector=list(map(float, vector)),
+                    payload={self.CONTENT_KEY: text, self.METADATA_KEY: metadata}
+                )
+                for id_, vector, text, metadata in zip(ids[start:end], vectors[start:end], texts[start:end], metadatas[start:end])
+            ]
+            self.client.upsert(collection_name=self.collection_name, points=points)
+
+    def delete(self, ids: List[str]):
+        if ids:
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=qdrant_models.PointIdsList(points=list(ids))
+            )
+
+    def get(self, ids: List[str]) -> List[SearchHit]:
+        if not ids:
+            return []
+        points = self.client.retrieve(collection_name=self.collection_name, ids=list(ids), with_payload=True)
+        return [self._to_hit(point) for point in points]
+
+    def sample_vectors(self, limit: int) -> np.ndarray:
+        if not self.exists():
+            return np.zeros((0, 0), dtype=np.float32)
+        points, _ = self.client.scroll(
+            collection_name=self.collection_name, limit=limit, with_payload=False, with_vectors=True
+        )
+        return np.asarray([point.vector for point in points], dtype=np.float32)
+
+    def _to_hit(self, point) -> SearchHit:
+        payload = point.payload or {}
+        return SearchHit(
+            id=str(point.id),
+            score=float(getattr(point, "score", 0.0) or 0.0),
+            text=payload.get(self.CONTENT_KEY, ""),
+            metadata=payload.get(self.METADATA_KEY) or {}
+        )
+
+    def search_batch(self, query_vectors: List[List[float]], top_k: int) -> List[List[SearchHit]]:
+        params = None
+        if self.dtype == "int8":
+            params = qdrant_models.SearchParams(
+                quantization=qdrant_models.QuantizationSearchParams(
+                    rescore=self.rescore, oversampling=float(self.RESCORE_FACTOR) if self.rescore else None
+                )
+            )
+        requests = [
+            qdrant_models.QueryRequest(query=list(map(float, vector)), limit=top_k, params=params, with_payload=True)
+            for vector in query_vectors
+        ]
+        responses = self.client.query_batch_points(collection_name=self.collection_name, requests=requests)
+        return [[self._to_hit(point) for point in response.points] for response in responses]
+
+    def close(self):
+        self.client.close()
+
+
+class FullPrecisionVectors:
+    """
+    磁盘上的 float32 原始向量
+
+    追加写入、memmap 读取，量化存储时用于对候选结果重打分，原始向量不占常驻内存。
+    删除或覆盖只留下无人引用的旧行，由 compact 统一回收。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dim: Optional[int] = None
+        self.rows = 0
+        self._mmap: Optional[np.memmap] = None
+
+    def open(self, dim: int):
+        self.dim = dim
+        self.rows = os.path.getsize(self.path) // (4 * dim) if os.path.exists(self.path) else 0
+        self._mmap = None
+
+    def reset(self, dim: int):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        open(self.path, "wb").close()
+        self.open(dim)
+
+    def append(self, array: np.ndarray) -> np.ndarray:
+        """追加向量，返回其行号"""
+        with open(self.path, "ab") as f:
+            f.write(np.ascontiguousarray(array, dtype=np.float32).tobytes())
+        slots = np.arange(self.rows, self.rows + len(array), dtype=np.int64)
+        self.rows += len(array)
+        self._mmap = None
+        return slots
+
+    def read(self, slots: np.ndarray) -> np.ndarray:
+        if self._mmap is None:
+            self._mmap = np.memmap(self.path, dtype=np.float32, mode="r", shape=(self.rows, self.dim))
+        return np.asarray(self._mmap[slots])
+
+    def compact(self, slots: np.ndarray) -> np.ndarray:
+        """只保留 slots 引用的行（按给定顺序重写），返回新行号"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            for start in range(0, len(slots), 65536):
+                f.write(self.read(slots[start:start + 65536]).tobytes())
+        self._mmap = None
+        os.replace(tmp_path, self.path)
+        self.rows = len(slots)
+        return np.arange(len(slots), dtype=np.int64)
+
+    def close(self):
+        self._mmap = None
+
+
+class NumpyVectorStore(BaseVectorStore):
+    """
+    NumPy 暴力精确检索
+
+    所有向量保存在一块连续矩阵中，向量已做 L2 归一化，
+    查询只需一次矩阵-向量乘法加 argpartition，适合进程内检索。
+    矩阵和 payload 分别落盘为 .npy 与 .json，重启后直接加载。
+
+    dtype 控制常驻内存的向量精度：
+    - "float32"：原始精度（768 维约 3 KB / 分块）；
+    - "float16"：内存减半；
+    - "int8"：每个向量单独一个缩放系数（max|x| / 127），内存约为 float32 的 1/4。
+    量化精度下直接在压缩矩阵上打分；rescore 为 True 时先取 top_k * RESCORE_FACTOR 个候选，
+    再用磁盘上 memmap 的 float32 原始向量重新打分排序。
+    """
+
+    DTYPES = ("float32", "float16", "int8")
+    # 压缩矩阵分块转换为 float32 后再做乘法，避免一次性复制整个矩阵
+    SCORE_BLOCK_ROWS = 65536
+    # 量化检索时先召回的候选倍数
+    RESCORE_FACTOR = 4
+
+    def __init__(self, collection_name: str, path: str, dtype: str = "float32", rescore: bool = True):
+        if dtype not in self.DTYPES:
+            raise ValueError(f"不支持的向量精度: {dtype}")
+        self.collection_name = collection_name
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.quantized = dtype == "int8"
+        self.rescore = rescore and dtype != "float32"
+        self.matrix_path = os.path.join(path, f"{collection_name}.npy")
+        self.scales_path = os.path.join(path, f"{collection_name}_scales.npy")
+        self.slots_path = os.path.join(path, f"{collection_name}_slots.npy")
+        self.payload_path = os.path.join(path, f"{collection_name}_payload.json")
+        self._full = FullPrecisionVectors(os.path.join(path, f"{collection_name}_full.f32")) if self.rescore else None
+
+        self._matrix: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._slots: Optional[np.ndarray] = None
+        self._size = 0
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        self._dirty = False
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        if not (os.path.exists(self.matrix_path) and os.path.exists(self.payload_path)):
+            return
+        try:
+            matrix = np.load(self.matrix_path)
+            with open(self.payload_path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            scales = np.load(self.scales_path) if self.quantized else None
+            slots = np.load(self.slots_path) if self.rescore else None
+        except Exception as e:
+            logger.error(f"加载 NumPy 向量索引 {self.collection_name} 失败: {e}")
+            return
+        if matrix.dtype != self.dtype:
+            # 精度配置变化，交给上层按设置不一致重建
+            logger.warning(f"NumPy 向量索引 {self.collection_name} 精度为 {matrix.dtype}，与配置 {self.dtype} 不一致")
+            return
+        self._matrix = np.ascontiguousarray(matrix)
+        self._scales = scales
+        self._slots = slots
+        self._size = matrix.shape[0]
+        self._ids = payload["ids"]
+        self._texts = payload["texts"]
+        self._metadatas = payload["metadatas"]
+        self._rows = {id_: i for i, id_ in enumerate(self._ids)}
+        if self._full is not None:
+            self._full.open(matrix.shape[1])
+
+    def exists(self) -> bool:
+        return self._matrix is not None
+
+    def count(self) -> int:
+        return self._size
+
+    @property
+    def dim(self) -> Optional[int]:
+        return None if self._matrix is None else self._matrix.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        """常驻内存中向量相关数组占用的字节数"""
+        return sum(a[:self._size].nbytes for a in (self._matrix, self._scales, self._slots) if a is not None)
+
+    def reset(self, dim: int):
+        with self._lock:
+            self._matrix = np.zeros((0, dim), dtype=self.dtype)
+            self._scales = np.zeros(0, dtype=np.float32) if self.quantized else None
+            self._slots = np.zeros(0, dtype=np.int64) if self.rescore else None
+            if self._full is not None:
+                self._full.reset(dim)
+            self._size = 0
+            self._ids, self._texts, self._metadatas = [], [], []
+            self._rows = {}
+            self._dirty = True
+            self.persist()
+
+    def _reserve(self, rows: int):
+        """按倍数扩容，保证追加的均摊开销为 O(1)"""
+        capacity = self._matrix.shape[0]
+        if rows <= capacity:
+            return
+        new_capacity = max(rows, capacity * 2, 1024)
+        matrix = np.zeros((new_capacity, self._matrix.shape[1]), dtype=self.dtype)
+        matrix[:self._size] = self._matrix[:self._size]
+        self._matrix = matrix
+        if self._scales is not None:
+            self._scales = np.resize(self._scales, new_capacity)
+        if self._slots is not None:
+            self._slots = np.resize(self._slots, new_capacity)
+
+    def _encode(self, array: np.ndarray):
+        """float32 向量转为存储精度，int8 时同时返回每个向量的缩放系数"""
+        if not self.quantized:
+            return array.astype(self.dtype), None
+        scales = np.abs(array).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(array / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def _decode(self, rows) -> np.ndarray:
+        vectors = self._matrix[rows].astype(np.float32)
+        if self._scales is not None:
+            vectors *= self._scales[rows][:, None]
+        return vectors
+
+    def add(self, ids: List[str], vectors: List[List[float]], texts: List[str], metadatas: List[Dict[str, Any]]):
+        if not ids:
+            return
+        array = np.asarray(vectors, dtype=np.float32)
+        encoded, scales = self._encode(array)
+        with self._lock:
+            if self._matrix is None:
+                self.reset(array.shape[1])
+            self._reserve(self._size + len(ids))
+            slots = self._full.append(array) if self._full is not None else None
+            for i, (id_, text, metadata) in enumerate(zip(ids, texts, metadatas)):
+                row = self._rows.get(id_)
+                if row is None:
+                    row = self._size
+                    self._size += 1
+                    self._rows[id_] = row
+                    self._ids.append(id_)
+                    self._texts.append(text)
+                    self._metadatas.append(metadata)
+                else:
+                    self._texts[row] = text
+                    self._metadatas[row] = metadata
+                self._matrix[row] = encoded[i]
+                if scales is not None:
+                    self._scales[row] = scales[i]
+                if slots is not None:
+                    self._slots[row] = slots[i]
+            self._dirty = True
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            for id_ in ids:
+                row = self._rows.pop(id_, None)
+                if row is None:
+                    continue
+                # 用最后一行填补空位，删除为 O(1)
+                last = self._size - 1
+                if row != last:
+                    self._matrix[row] = self._matrix[last]
+                    if self._scales is not None:
+                        self._scales[row] = self._scales[last]
+                    if self._slots is not None:
+                        self._slots[row] = self._slots[last]
+                    self._ids[row] = self._ids[last]
+                    self._texts[row] = self._texts[last]
+                    self._metadatas[row] = self._metadatas[last]
+                    self._rows[self._ids[row]] = row
+                self._ids.pop()
+                self._texts.pop()
+                self._metadatas.pop()
+                self._size = last
+                self._dirty = True
+
+    def get(self, ids: List[str]) -> List[SearchHit]:
+        with self._lock:
+            return [
+                SearchHit(id=id_, score=0.0, text=self._texts[row], metadata=self._metadatas[row])
+                for id_, row in ((id_, self._rows.get(id_)) for id_ in ids)
+                if row is not None
+            ]
+
+    def sample_vectors(self, limit: int) -> np.ndarray:
+        with self._lock:
+            if not self._size:
+                return np.zeros((0, 0), dtype=np.float32)
+            if self._size <= limit:
+                return self._decode(slice(0, self._size))
+            rows = np.random.default_rng(0).choice(self._size, limit, replace=False)
+            return self._decode(np.sort(rows))
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        """在存储精度的矩阵上计算 (分块数, 查询数) 的内积得分矩阵"""
+        matrix = self._matrix[:self._size]
+        if self.dtype == np.float32:
+            return matrix @ queries.T
+        scores = np.empty((self._size, queries.shape[0]), dtype=np.float32)
+        for start in range(0, self._size, self.SCORE_BLOCK_ROWS):
+            end = min(start + self.SCORE_BLOCK_ROWS, self._size)
+            scores[start:end] = matrix[start:end].astype(np.float32) @ queries.T
+            if self._scales is not None:
+                scores[start:end] *= self._scales[start:end, None]
+        return scores
+
+    def search_batch(self, query_vectors: List[List[float]], top_k: int) -> List[List[SearchHit]]:
+        queries = np.asarray(query_vectors, dtype=np.float32).reshape(len(query_vectors), -1)
+        with self._lock:
+            if not self._size or top_k <= 0:
+                return [[] for _ in range(queries.shape[0])]
+            k = min(top_k, self._size)
+            n_candidates = min(k * self.RESCORE_FACTOR, self._size) if self.rescore else k
+            scores = self._scores(queries)
+            if n_candidates < self._size:
+                candidates = np.argpartition(-scores, n_candidates - 1, axis=0)[:n_candidates]
+            else:
+                candidates = np.broadcast_to(np.arange(self._size)[:, None], scores.shape)
+
+            results = []
+            for column in range(queries.shape[0]):
+                rows = candidates[:, column]
+                row_scores = scores[rows, column]
+                if self.rescore:
+                    # 候选行用 float32 原始向量重新打分
+                    row_scores = self._full.read(self._slots[rows]) @ queries[column]
+                order = np.argsort(-row_scores, kind="stable")[:k]
+                results.append([
+                    SearchHit(
+                        id=self._ids[rows[i]],
+                        score=float(row_scores[i]),
+                        text=self._texts[rows[i]],
+                        metadata=self._metadatas[rows[i]]
+                    )
+                    for i in order
+                ])
+            return results
+
+    def persist(self):
+        with self._lock:
+            if not self._dirty or self._matrix is None:
+                return
+            os.makedirs(self.path, exist_ok=True)
+            if self._full is not None and self._full.rows > 2 * self._size + 1024:
+                # 被覆盖或删除的原始向量过多时压缩磁盘文件
+                self._slots[:self._size] = self._full.compact(self._slots[:self._size])
+            arrays = [(self.matrix_path, self._matrix)]
+            if self._scales is not None:
+                arrays.append((self.scales_path, self._scales))
+            if self._slots is not None:
+                arrays.append((self.slots_path, self._slots))
+            for path, array in arrays:
+                tmp_path = f"{path}.tmp.npy"
+                np.save(tmp_path, array[:self._size])
+                os.replace(tmp_path, path)
+            tmp_payload = f"{self.payload_path}.tmp"
+            with open(tmp_payload, "w", encoding="utf-8") as f:
+                json.dump({"ids": self._ids, "texts": self._texts, "metadatas": self._metadatas}, f, ensure_ascii=False)
+            os.replace(tmp_payload, self.payload_path)
+            self._dirty = False
+
+    def close(self):
+        self.persist()
+        if self._full is not None:
+            self._full.close()
@@ -3,12 +3,15 @@ from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.messages import SystemMessage, BaseMessage
 from typing import Dict, Any, Optional, Generator, Callable, List
 from langchain import hub
+import threading
 import time
 
 from typing import List
 
 from backend.config.settings import settings
 from backend.core.llm.llm_manager import LLMManager
+from backend.core.llm.session_cache import SessionCache
+from backend.core.llm.session_journal import AgentMemoryRecord
 from backend.core.tool_manager import ToolManager
 from backend.core.prompt_manager import PromptManager
 from backend.utils.logger import logger
@@ -22,7 +25,16 @@ class AgentManager:
     支持动态更新系统提示词、流式输出和记忆功能。
     """
     _agent_instances: Dict[str, AgentExecutor] = {}
-    _agent_memories: Dict[str, AgentMemory] = {}  # 新增：记忆存储 {session_id-agent_name: AgentMemory}
+    # 记忆存储 {session_id-agent_name: AgentMemory} 的有界缓存，淘汰的记忆经写回队列写入会话日志，下次访问时恢复
+    _agent_memories = SessionCache(
+        max_entries=settings.AGENT_MEMORY_CACHE_MAX_ENTRIES,
+        max_bytes=settings.AGENT_MEMORY_CACHE_MAX_BYTES,
+        idle_ttl=settings.AGENT_MEMORY_IDLE_TTL,
+        size_of=lambda memory: memory.resident_bytes,
+        on_evict=lambda memory_key, memory: AgentManager._spill_memory(memory_key, memory)
+    )
+    # 恢复、创建记忆时加锁，同一记忆在内存中只有一份
+    _memory_lock = threading.Lock()
 
     @classmethod
     def get_agent(cls,
@@ -124,18 +136,71 @@ class AgentManager:
         return f"{session_id}-{agent_name}"
 
     @classmethod
-    def _get_or_create_memory(cls, session_id: str, agent_name: str, memory_window: int = 10) -> AgentMemory:
-        """获取或创建 Agent 记忆"""
+    def _spill_memory(cls, memory_key: str, memory: AgentMemory):
+        """把被淘汰的记忆快照放入写回队列，由后台线程写入会话日志"""
+        try:
+            LLMManager.get_persist_queue().enqueue_agent_memory(AgentMemoryRecord(
+                memory_key, memory.session_id, memory.agent_name, memory.memory.k, memory.to_records()
+            ))
+        except Exception as e:
+            logger.error(f"写出 Agent 记忆 {memory_key} 失败: {e}", exc_info=True)
+
+    @classmethod
+    def _get_memory(cls, session_id: str, agent_name: str, pin: bool = False) -> Optional[AgentMemory]:
+        """
+        获取 Agent 记忆，不在内存中时从写回队列中尚未写入的快照或会话日志恢复，都不存在时返回 None
+
+        pin 为 True 时记忆在 _release_memory 之前不会被淘汰，执行期间不会有第二份从日志恢复的副本。
+        """
         memory_key = cls._get_memory_key(session_id, agent_name)
+        memory = cls._agent_memories.get(memory_key, pin=pin)
+        if memory is not None:
+            return memory
+
+        with cls._memory_lock:
+            memory = cls._agent_memories.get(memory_key, pin=pin)
+            if memory is not None:
+                return memory
+            pending = LLMManager.get_persist_queue().pending_agent_memory(memory_key)
+            if pending is not None:
+                memory_window, records = pending.memory_window, pending.messages
+            else:
+                stored = LLMManager.get_journal().load_agent_memory(memory_key)
+                if stored is None:
+                    return None
+                memory_window, records = stored
+            memory = AgentMemory(session_id=session_id, agent_name=agent_name, memory_window=memory_window)
+            memory.restore(records)
+            cls._agent_memories.put(memory_key, memory, pin=pin)
+        logger.info(f"已从会话日志恢复 Agent 记忆: {memory_key}")
+        return memory
 
-        if memory_key not in cls._agent_memories:
-            cls._agent_memories[memory_key] = AgentMemory(
-                session_id=session_id,
-                agent_name=agent_name,
-                memory_window=memory_window
-            )
+    @classmethod
+    def _get_or_create_memory(cls, session_id: str, agent_name: str, memory_window: int = 10,
+                              pin: bool = False) -> AgentMemory:
+        """获取或创建 Agent 记忆，pin 含义同 _get_memory"""
+        memory = cls._get_memory(session_id, agent_name, pin=pin)
+        if memory is not None:
+            return memory
+
+        with cls._memory_lock:
+            memory = cls._agent_memories.get(cls._get_memory_key(session_id, agent_name), pin=pin)
+            if memory is None:
+                memory = AgentMemory(
+                    session_id=session_id,
+                    agent_name=agent_name,
+                    memory_window=memory_window
+                )
+                cls._agent_memories.put(cls._get_memory_key(session_id, agent_name), memory, pin=pin)
 
-        return cls._agent_memories[memory_key]
+        return memory
+
+    @classmethod
+    def _release_memory(cls, session_id: str, agent_name: str):
+        """执行结束：更新记忆大小并释放 pin"""
+        memory_key = cls._get_memory_key(session_id, agent_name)
+        cls._agent_memories.touch(memory_key)
+        cls._agent_memories.unpin(memory_key)
 
     @classmethod
     def _build_prompt_with_memory(cls, system_prompt_name: str, agent_memory: AgentMemory):
@@ -190,9 +255,10 @@ class AgentManager:
         Returns:
             str: Agent 执行结果
         """
+        agent_memory = None
         try:
-            # 获取或创建记忆
-            agent_memory = cls._get_or_create_memory(session_id, agent_name, memory_window)
+            # 获取或创建记忆，执行期间不会被淘汰
+            agent_memory = cls._get_or_create_memory(session_id, agent_name, memory_window, pin=True)
 
             # 获取 Agent 实例
             agent = cls.get_agent(
@@ -234,6 +300,9 @@ class AgentManager:
         except Exception as e:
             logger.error(f"带记忆的 Agent 执行失败: {e}", exc_info=True)
             raise RuntimeError(f"Agent 执行失败: {e}")
+        finally:
+            if agent_memory is not None:
+                cls._release_memory(session_id, agent_name)
 
     @classmethod
     def run_agent_with_memory_stream(cls,
@@ -260,9 +329,10 @@ class AgentManager:
         Returns:
             str: 完整的执行结果
         """
+        agent_memory = None
         try:
-            # 获取或创建记忆
-            agent_memory = cls._get_or_create_memory(session_id, agent_name, memory_window)
+            # 获取或创建记忆，执行期间不会被淘汰
+            agent_memory = cls._get_or_create_memory(session_id, agent_name, memory_window, pin=True)
 
             # 构建包含记忆的 prompt
             memory_prompt = cls._build_prompt_with_memory(system_prompt_name, agent_memory)
@@ -328,45 +398,49 @@ class AgentManager:
         except Exception as e:
             logger.error(f"带记忆的 Agent 流式执行失败: {e}", exc_info=True)
             raise RuntimeError(f"Agent 流式执行失败: {e}")
+        finally:
+            if agent_memory is not None:
+                cls._release_memory(session_id, agent_name)
 
     # =============== 记忆管理方法 ===============
 
     @classmethod
     def get_agent_memory_history(cls, session_id: str, agent_name: str) -> List[BaseMessage]:
         """获取 Agent 的记忆历史"""
-        memory_key = cls._get_memory_key(session_id, agent_name)
-        if memory_key in cls._agent_memories:
-            return cls._agent_memories[memory_key].get_history()
+        memory = cls._get_memory(session_id, agent_name)
+        if memory is not None:
+            return memory.get_history()
         return []
 
     @classmethod
     def clear_agent_memory(cls, session_id: str, agent_name: str = None):
         """清除 Agent 记忆"""
+        # 已写出（含队列中尚未写入）的记忆直接删除，恢复后即为空记忆
+        LLMManager.get_persist_queue().delete_agent_memories(session_id, agent_name)
         if agent_name:
-            memory_key = cls._get_memory_key(session_id, agent_name)
-            if memory_key in cls._agent_memories:
-                cls._agent_memories[memory_key].clear()
-                logger.info(f"已清除会话 {session_id} 中 Agent {agent_name} 的记忆")
+            memory = cls._agent_memories.get(cls._get_memory_key(session_id, agent_name))
+            if memory is not None:
+                memory.clear()
+            logger.info(f"已清除会话 {session_id} 中 Agent {agent_name} 的记忆")
         else:
             # 清除该会话的所有 Agent 记忆
-            keys_to_clear = [key for key in cls._agent_memories.keys() if key.startswith(f"{session_id}-")]
-            for key in keys_to_clear:
-                cls._agent_memories[key].clear()
+            for key, memory in cls._agent_memories.items():
+                if key.startswith(f"{session_id}-"):
+                    memory.clear()
             logger.info(f"已清除会话 {session_id} 的所有 Agent 记忆")
 
     @classmethod
     def delete_agent_memory(cls, session_id: str, agent_name: str = None):
         """删除 Agent 记忆"""
+        LLMManager.get_persist_queue().delete_agent_memories(session_id, agent_name)
         if agent_name:
-            memory_key = cls._get_memory_key(session_id, agent_name)
-            if memory_key in cls._agent_memories:
-                del cls._agent_memories[memory_key]
-                logger.info(f"已删除会话 {session_id} 中 Agent {agent_name} 的记忆")
+            cls._agent_memories.pop(cls._get_memory_key(session_id, agent_name))
+            logger.info(f"已删除会话 {session_id} 中 Agent {agent_name} 的记忆")
         else:
             # 删除该会话的所有 Agent 记忆
             keys_to_delete = [key for key in cls._agent_memories.keys() if key.startswith(f"{session_id}-")]
             for key in keys_to_delete:
-                del cls._agent_memories[key]
+                cls._agent_memories.pop(key)
             logger.info(f"已删除会话 {session_id} 的所有 Agent 记忆")
 
     @classmethod
@@ -384,6 +458,11 @@ class AgentManager:
             }
         return stats
 
+    @classmethod
+    def get_memory_cache_stats(cls) -> Dict[str, Any]:
+        """记忆缓存的常驻条目数、估算常驻字节数、命中与淘汰计数"""
+        return cls._agent_memories.get_stats()
+
     @classmethod
     def list_active_sessions(cls) -> List[str]:
         """列出所有活跃的会话ID"""
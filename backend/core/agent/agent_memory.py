@@ -1,7 +1,9 @@
 from langchain.memory import ConversationBufferWindowMemory
-from langchain_core.messages import SystemMessage, BaseMessage
-from typing import List
+from langchain_core.messages import SystemMessage, BaseMessage, HumanMessage, AIMessage
+from typing import List, Tuple
+import sys
 from backend.utils.logger import logger
+from backend.core.llm.llm_conversation_history import MESSAGE_OBJECT_BYTES
 
 
 class AgentMemory:
@@ -31,6 +33,24 @@ class AgentMemory:
         """获取记忆中的历史消息"""
         return self.memory.chat_memory.messages
 
+    def to_records(self) -> List[Tuple[str, str]]:
+        """记忆窗口内的消息转为 (role, content) 列表，用于写出到会话日志"""
+        messages = self.get_history()[-2 * self.memory.k:] if self.memory.k > 0 else []
+        return [("user" if msg.type == "human" else "assistant", msg.content)
+                for msg in messages if msg.type in ("human", "ai")]
+
+    def restore(self, records: List[Tuple[str, str]]):
+        """从 (role, content) 列表恢复记忆"""
+        self.memory.chat_memory.add_messages([
+            HumanMessage(content=content) if role == "user" else AIMessage(content=content)
+            for role, content in records
+        ])
+
+    @property
+    def resident_bytes(self) -> int:
+        """记忆消息常驻内存的估算字节数"""
+        return sum(sys.getsizeof(msg.content) + MESSAGE_OBJECT_BYTES for msg in self.get_history())
+
     def clear(self):
         """清除记忆"""
         self.memory.clear()
@@ -1,4 +1,4 @@
-from typing import Dict, Any, Optional, List, Generator, Union, Callable
+from typing import Dict, Any, Optional, List, Generator, Union, Callable, Tuple
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AIMessage
 from langchain_core.callbacks import BaseCallbackHandler
@@ -6,6 +6,7 @@ from langchain_core.outputs import LLMResult
 from datetime import datetime
 
 import os
+import sys
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,126 +14,311 @@ load_dotenv()
 from backend.config.settings import settings
 from backend.core.prompt_manager import PromptManager
 from backend.utils.logger import logger
+from backend.core.llm.token_counter import estimate_tokens, MESSAGE_OVERHEAD_TOKENS
+
+# 单个消息对象（不含文本）的大致常驻字节数
+MESSAGE_OBJECT_BYTES = 512
+
+
+class TurnSequence:
+    """
+    不可变的消息序列，按固定大小分块实现结构共享
+
+    追加、淘汰都返回新序列：追加只复制最后一个未满的块，淘汰只移动起始偏移（整块淘汰时丢弃该块），
+    已满的块在各个分叉之间共享，分叉、克隆对话不复制消息。
+    """
+
+    CHUNK_SIZE = 32
+    __slots__ = ("_chunks", "_start", "_len")
+
+    def __init__(self, chunks: Tuple[tuple, ...] = (), start: int = 0, length: int = 0):
+        self._chunks = chunks
+        self._start = start
+        self._len = length
+
+    @classmethod
+    def from_iterable(cls, items) -> "TurnSequence":
+        items = tuple(items)
+        chunks = tuple(items[i:i + cls.CHUNK_SIZE] for i in range(0, len(items), cls.CHUNK_SIZE))
+        return cls(chunks, 0, len(items))
+
+    def append(self, item) -> "TurnSequence":
+        chunks = self._chunks
+        if chunks and len(chunks[-1]) < self.CHUNK_SIZE:
+            chunks = chunks[:-1] + (chunks[-1] + (item,),)
+        else:
+            chunks = chunks + ((item,),)
+        return TurnSequence(chunks, self._start, self._len + 1)
+
+    def popleft(self) -> Tuple[Any, "TurnSequence"]:
+        """返回 (最老的元素, 去掉它之后的序列)"""
+        if not self._len:
+            raise IndexError("pop from an empty TurnSequence")
+        item = self._chunks[0][self._start]
+        if self._len == 1:
+            return item, TurnSequence()
+        if self._start + 1 == len(self._chunks[0]):
+            return item, TurnSequence(self._chunks[1:], 0, self._len - 1)
+        return item, TurnSequence(self._chunks, self._start + 1, self._len - 1)
+
+    def last(self, count: int) -> List[Any]:
+        """最后 count 个元素，按原顺序"""
+        result = []
+        for chunk in reversed(self._chunks):
+            result.extend(reversed(chunk))
+            if len(result) >= count:
+                break
+        result = result[:min(count, self._len)]
+        result.reverse()
+        return result
+
+    def __iter__(self):
+        for i, chunk in enumerate(self._chunks):
+            yield from (chunk[self._start:] if i == 0 else chunk)
+
+    def __len__(self) -> int:
+        return self._len
+
 
 class LLMConversationHistory:
-    """LLM 对话历史管理类"""
+    """
+    LLM 对话历史管理类
 
-    def __init__(self, session_id: str, max_messages: int = 50, max_tokens: int = 4000):
+    系统消息单独保存，其余消息按时间顺序存放在不可变的 TurnSequence 中，每条消息的 token 数在加入时计算一次，
+    并维护总 token 数，超出消息数或 token 限制时从最老的消息开始淘汰。
+    分叉（fork / adopt）与源历史共享消息序列，之后各自追加互不影响。
+    """
+
+    def __init__(self,
+                 session_id: str,
+                 max_messages: int = 50,
+                 max_tokens: int = 4000,
+                 count_tokens: Optional[Callable[[str], int]] = None):
         """
         初始化 LLM 对话历史
 
         Args:
             session_id: 会话唯一标识
-            max_messages: 最大消息数量
-            max_tokens: 最大token数量（粗略估算）
+            max_messages: 最大消息数量（含系统消息）
+            max_tokens: 最大token数量（含系统消息）
+            count_tokens: token 计数函数，默认按字符数估算
         """
         self.session_id = session_id
         self.max_messages = max_messages
         self.max_tokens = max_tokens
-        self.messages: List[BaseMessage] = []
+        self.count_tokens = count_tokens or estimate_tokens
+        self._system: Optional[SystemMessage] = None
+        self._system_tokens = 0
+        # (消息, token 数)
+        self._turns = TurnSequence()
+        self._turn_tokens = 0
+        self._turn_chars = 0
+        self._turn_bytes = 0
+        # 已加入的非系统消息总数，作为消息序号；已持久化到日志的序号上界
+        self._next_seq = 0
+        self.persisted_seq = 0
         self.created_at = datetime.now()
         self.updated_at = datetime.now()
         logger.info(f"为会话 {session_id} 创建 LLM 对话历史")
 
+    def _message_tokens(self, content: str) -> int:
+        return self.count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+    @staticmethod
+    def _message_bytes(msg: BaseMessage) -> int:
+        return sys.getsizeof(msg.content) + MESSAGE_OBJECT_BYTES
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        """全部消息（系统消息在最前）"""
+        head = [self._system] if self._system is not None else []
+        return head + [msg for msg, _ in self._turns]
+
+    @messages.setter
+    def messages(self, messages: List[BaseMessage]):
+        """整体替换消息，逐条重新计数"""
+        self._system, self._system_tokens = None, 0
+        self._turns = TurnSequence()
+        self._turn_tokens = self._turn_chars = self._turn_bytes = 0
+        for msg in messages:
+            if isinstance(msg, SystemMessage):
+                self._set_system(msg)
+            else:
+                self._append(msg)
+        self._cleanup_if_needed()
+
+    def adopt(self, source: "LLMConversationHistory"):
+        """
+        以结构共享的方式整体替换为 source 的消息（系统消息一并复制）
+
+        两边使用同一个 token 计数函数时直接共享消息序列；否则按本历史的分词器重新计数，消息对象仍然共享。
+        替换进来的消息按本历史的序号继续编号。
+        """
+        self._system = source._system
+        self._system_tokens = self._message_tokens(source._system.content) if source._system is not None else 0
+        if source.count_tokens is self.count_tokens:
+            self._system_tokens = source._system_tokens
+            self._turns = source._turns
+            self._turn_tokens = source._turn_tokens
+        else:
+            self._turns = TurnSequence.from_iterable(
+                (msg, self._message_tokens(msg.content)) for msg, _ in source._turns
+            )
+            self._turn_tokens = sum(tokens for _, tokens in self._turns)
+        self._turn_chars = source._turn_chars
+        self._turn_bytes = source._turn_bytes
+        self._next_seq += len(self._turns)
+        self._cleanup_if_needed()
+
+    def fork(self, session_id: Optional[str] = None) -> "LLMConversationHistory":
+        """分叉出一个共享现有消息的新历史，之后两边各自追加互不影响"""
+        forked = LLMConversationHistory(
+            session_id=session_id or self.session_id,
+            max_messages=self.max_messages,
+            max_tokens=self.max_tokens,
+            count_tokens=self.count_tokens
+        )
+        forked.adopt(self)
+        forked.created_at = self.created_at
+        return forked
+
+    def restore(self, messages: List[BaseMessage], next_seq: int):
+        """从持久化记录恢复消息，保留原有序号（messages 为序号连续、以 next_seq - 1 结尾的消息）"""
+        self._turns = TurnSequence()
+        self._turn_tokens = self._turn_chars = self._turn_bytes = 0
+        self._next_seq = next_seq - len(messages)
+        for msg in messages:
+            self._append(msg)
+        self.persisted_seq = next_seq
+        self._cleanup_if_needed()
+
+    @property
+    def first_seq(self) -> int:
+        """仍保留的最老消息的序号，更早的消息已被淘汰或清除"""
+        return self._next_seq - len(self._turns)
+
+    @property
+    def next_seq(self) -> int:
+        return self._next_seq
+
+    def turns_since(self, seq: int) -> List[Tuple[int, BaseMessage]]:
+        """序号不小于 seq 的消息 (序号, 消息)，只遍历新增部分"""
+        count = self._next_seq - max(seq, self.first_seq)
+        if count <= 0:
+            return []
+        first = self._next_seq - count
+        return [(first + i, msg) for i, (msg, _) in enumerate(self._turns.last(count))]
+
+    @property
+    def resident_bytes(self) -> int:
+        """消息对象常驻内存的估算字节数"""
+        system_bytes = self._message_bytes(self._system) if self._system is not None else 0
+        return system_bytes + self._turn_bytes
+
+    @property
+    def total_tokens(self) -> int:
+        """当前历史的 token 总数（含系统消息）"""
+        return self._system_tokens + self._turn_tokens
+
+    def _set_system(self, msg: SystemMessage):
+        self._system = msg
+        self._system_tokens = self._message_tokens(msg.content)
+
+    def _append(self, msg: BaseMessage):
+        tokens = self._message_tokens(msg.content)
+        self._turns = self._turns.append((msg, tokens))
+        self._next_seq += 1
+        self._turn_tokens += tokens
+        self._turn_chars += len(msg.content)
+        self._turn_bytes += self._message_bytes(msg)
+
+    def _evict_oldest(self):
+        (msg, tokens), self._turns = self._turns.popleft()
+        self._turn_tokens -= tokens
+        self._turn_chars -= len(msg.content)
+        self._turn_bytes -= self._message_bytes(msg)
+
     def add_user_message(self, content: str):
         """添加用户消息"""
-        self.messages.append(HumanMessage(content=content))
+        self._append(HumanMessage(content=content))
         self.updated_at = datetime.now()
         self._cleanup_if_needed()
         logger.debug(f"已添加用户消息到 LLM 会话 {self.session_id}")
 
     def add_ai_message(self, content: str):
         """添加AI消息"""
-        self.messages.append(AIMessage(content=content))
+        self._append(AIMessage(content=content))
         self.updated_at = datetime.now()
         self._cleanup_if_needed()
         logger.debug(f"已添加AI消息到 LLM 会话 {self.session_id}")
 
     def update_system_message(self, content: str):
         """更新或添加系统消息"""
-        # 检查是否已存在系统消息，如果存在则替换
-        for i, msg in enumerate(self.messages):
-            if isinstance(msg, SystemMessage):
-                self.messages[i] = SystemMessage(content=content)
-                logger.debug(f"已更新 LLM 系统消息在会话 {self.session_id}")
-                return
-
-        # 如果不存在，在开头插入
-        self.messages.insert(0, SystemMessage(content=content))
-        logger.debug(f"已添加 LLM 系统消息到会话 {self.session_id}")
+        existed = self._system is not None
+        self._set_system(SystemMessage(content=content))
+        if existed:
+            logger.debug(f"已更新 LLM 系统消息在会话 {self.session_id}")
+        else:
+            logger.debug(f"已添加 LLM 系统消息到会话 {self.session_id}")
 
     def get_messages(self) -> List[BaseMessage]:
         """获取所有消息"""
-        return self.messages.copy()
+        return self.messages
 
     def get_messages_without_system(self) -> List[BaseMessage]:
         """获取除系统消息外的所有消息"""
-        return [msg for msg in self.messages if not isinstance(msg, SystemMessage)]
+        return [msg for msg, _ in self._turns]
 
     def get_recent_messages(self, count: int) -> List[BaseMessage]:
         """获取最近的N条消息"""
-        return self.messages[-count:] if count < len(self.messages) else self.messages.copy()
+        messages = self.messages
+        return messages[-count:] if count < len(messages) else messages
 
     def clear_history(self, keep_system_message: bool = True):
         """清除历史记录"""
-        if keep_system_message:
-            system_messages = [msg for msg in self.messages if isinstance(msg, SystemMessage)]
-            self.messages = system_messages
-        else:
-            self.messages = []
+        self._turns = TurnSequence()
+        self._turn_tokens = self._turn_chars = self._turn_bytes = 0
+        if not keep_system_message:
+            self._system, self._system_tokens = None, 0
 
         self.updated_at = datetime.now()
         logger.info(f"已清除 LLM 会话 {self.session_id} 的历史记录")
 
     def _cleanup_if_needed(self):
-        """根据设定的限制清理历史记录"""
+        """根据设定的限制清理历史记录，从最老的非系统消息开始淘汰，最新一条消息始终保留"""
+        system_count = 1 if self._system is not None else 0
+        evicted = 0
+
         # 1. 限制消息数量
-        if len(self.messages) > self.max_messages:
-            # 保留系统消息和最近的消息
-            system_messages = [msg for msg in self.messages if isinstance(msg, SystemMessage)]
-            other_messages = [msg for msg in self.messages if not isinstance(msg, SystemMessage)]
-
-            # 保留最近的消息
-            recent_messages = other_messages[-(self.max_messages - len(system_messages)):]
-            self.messages = system_messages + recent_messages
-
-            logger.info(f"LLM 会话 {self.session_id} 历史记录已清理，保留 {len(self.messages)} 条消息")
-
-        # 2. 限制token数量（粗略估算：1个中文字符≈1.5个token）
-        total_chars = sum(len(msg.content) for msg in self.messages)
-        estimated_tokens = int(total_chars * 1.5)
-
-        if estimated_tokens > self.max_tokens:
-            # 从最老的非系统消息开始删除
-            while estimated_tokens > self.max_tokens and len(self.messages) > 1:
-                # 找到第一个非系统消息并删除
-                for i, msg in enumerate(self.messages):
-                    if not isinstance(msg, SystemMessage):
-                        removed_msg = self.messages.pop(i)
-                        estimated_tokens -= int(len(removed_msg.content) * 1.5)
-                        break
-                else:
-                    # 如果只剩系统消息，跳出循环
-                    break
-
-            logger.info(f"LLM 会话 {self.session_id} 因token限制清理历史，估算token数: {estimated_tokens}")
+        while len(self._turns) > 1 and len(self._turns) + system_count > self.max_messages:
+            self._evict_oldest()
+            evicted += 1
+
+        # 2. 限制token数量
+        while len(self._turns) > 1 and self.total_tokens > self.max_tokens:
+            self._evict_oldest()
+            evicted += 1
+
+        if evicted:
+            logger.info(
+                f"LLM 会话 {self.session_id} 历史记录已清理 {evicted} 条，"
+                f"保留 {len(self._turns) + system_count} 条消息，token 数: {self.total_tokens}"
+            )
 
     def get_stats(self) -> Dict[str, Any]:
         """获取对话统计信息"""
         message_types = {}
-        total_chars = 0
-
         for msg in self.messages:
             msg_type = type(msg).__name__
             message_types[msg_type] = message_types.get(msg_type, 0) + 1
-            total_chars += len(msg.content)
 
+        system_chars = len(self._system.content) if self._system is not None else 0
         return {
             "session_id": self.session_id,
-            "total_messages": len(self.messages),
+            "total_messages": len(self._turns) + (1 if self._system is not None else 0),
             "message_types": message_types,
-            "total_characters": total_chars,
-            "estimated_tokens": int(total_chars * 1.5),
+            "total_characters": self._turn_chars + system_chars,
+            "estimated_tokens": self.total_tokens,
             "created_at": self.created_at.isoformat(),
             "updated_at": self.updated_at.isoformat()
         }
@@ -140,33 +326,10 @@ class LLMConversationHistory:
     def to_serializable_dict(self) -> list:
         """将当前会话历史转为可序列化的role/content结构（不含系统消息）"""
         result = []
-        for msg in self.messages:
+        for msg, _ in self._turns:
             if isinstance(msg, HumanMessage):
                 result.append({"role": "user", "content": msg.content})
             elif isinstance(msg, AIMessage):
                 result.append({"role": "assistant", "content": msg.content})
             # 跳过SystemMessage
         return result
-
-    @staticmethod
-    def save_all_sessions_to_json(instances: dict, file_path: str):
-        """保存所有会话历史到指定json文件，路径由settings.CHAT_HISTORY_JSON_PATH写死传入。"""
-        import json
-        all_history = {}
-        for instance_id, instance in instances.items():
-            # 只保留session_id前缀（去除模型名）作为会话key
-            session_id = instance_id.split("_")[0]
-            if session_id not in all_history:
-                all_history[session_id] = []
-            all_history[session_id].extend(instance.conversation.to_serializable_dict())
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(all_history, f, ensure_ascii=False, indent=2)
-
-    @staticmethod
-    def load_all_sessions_from_json(file_path: str) -> dict:
-        """从json文件加载所有会话历史，返回dict结构。"""
-        import json
-        if not os.path.exists(file_path):
-            return {}
-        with open(file_path, "r", encoding="utf-8") as f:
-            return json.load(f)
\ No newline at end of file
@@ -8,7 +8,9 @@ from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AI
 from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.outputs import LLMResult
 from datetime import datetime
-import copy
+import asyncio
+import json
+import threading
 
 import os
 from dotenv import load_dotenv
@@ -19,7 +21,11 @@ from backend.config.settings import settings
 from backend.core.prompt_manager import PromptManager
 from backend.utils.logger import logger
 from backend.core.llm.llm_conversation_history import LLMConversationHistory
-from backend.core.RAG.rag_engine import RAGEngine
+from backend.core.llm.token_counter import get_token_counter
+from backend.core.llm.session_journal import SessionJournal, SessionRecord, to_message
+from backend.core.llm.persistence_queue import WriteBehindQueue
+from backend.core.llm.session_cache import SessionCache
+from backend.core.RAG.rag_manager import RAGManager
 
 # 原有的导入保持不变...
 from langchain_openai import ChatOpenAI
@@ -41,12 +47,18 @@ class LLMInstance:
                  model_name: str,
                  temperature: float = 0.7,
                  max_messages: int = 50,
-                 max_tokens: int = 4000):
+                 max_tokens: int = 4000,
+                 rag_collections: Optional[List[str]] = None,
+                 session_id: Optional[str] = None):
         self.instance_id = instance_id
+        # 实例所属的会话，默认从 "<session_id>_<model_name>" 格式的实例ID中解析
+        self.session_id = session_id or self._parse_session_id(instance_id, model_name)
         self.model_name = model_name
         self.temperature = temperature
         self.max_messages = max_messages
         self.max_tokens = max_tokens
+        # 会话检索的知识库集合，None 表示使用默认集合
+        self.rag_collections = rag_collections
         self.created_at = datetime.now()
         self.updated_at = datetime.now()
 
@@ -54,11 +66,17 @@ class LLMInstance:
         self.conversation = LLMConversationHistory(
             session_id=instance_id,
             max_messages=max_messages,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            count_tokens=get_token_counter(model_name)
         )
 
         logger.info(f"创建 LLM 实例: {instance_id} (模型: {model_name})")
 
+    @staticmethod
+    def _parse_session_id(instance_id: str, model_name: str) -> str:
+        suffix = f"_{model_name}"
+        return instance_id[:-len(suffix)] if instance_id.endswith(suffix) and len(instance_id) > len(suffix) else instance_id
+
     # 在 LLMInstance 类中添加 build_cot_prompt 静态方法
     @staticmethod
     def build_cot_prompt(user_input: str) -> str:
@@ -67,6 +85,39 @@ class LLMInstance:
         以下属于思考过程，请分步进行如下分析，并以一段话的形式返回思考过程：\n1. 用户想要达成什么目标？\n2. 用户是否提供了所有所需信息？\n3. 哪些部分需要假设或补充？\n
         以下属于回答过程，可以分点给出答案：根据以上问题和思考给出具体的回应建议。\n"""
         
+    def _rag_context_budget(self) -> int:
+        """当前模型的知识库上下文 token 预算"""
+        model_config = settings.AVAILABLE_LLMS.get(self.model_name, {})
+        return model_config.get("rag_context_tokens", settings.RAG_CONTEXT_TOKEN_BUDGET)
+
+    def _retrieve_rag_context(self, query_text: str, top_k: int = 3) -> str:
+        """从会话关联的知识库集合检索并按预算组装知识库内容"""
+        return RAGManager.build_context(
+            query_text, self.rag_collections, top_k=top_k, token_budget=self._rag_context_budget(), gated=True,
+            count_tokens=self.conversation.count_tokens
+        )
+
+    async def _aretrieve_rag_context(self, query_text: str, top_k: int = 3) -> str:
+        """异步检索知识库内容，检索在线程池中执行，不阻塞其他流式响应"""
+        return await RAGManager.abuild_context(
+            query_text, self.rag_collections, top_k=top_k, token_budget=self._rag_context_budget(), gated=True,
+            count_tokens=self.conversation.count_tokens
+        )
+
+    def _prepare_messages(self, user_message: str, system_prompt_name: str, rag_context_str: str) -> List[BaseMessage]:
+        """CoT 预处理、更新系统消息（附带知识库内容）并加入用户消息，返回本轮发送给模型的消息"""
+        # CoT 预处理
+        user_message = self.build_cot_prompt(user_message)
+        # 更新系统消息
+        system_content = LLMManager._get_system_prompt_content(system_prompt_name)
+        if system_content:
+            if rag_context_str:
+                system_content = f"【以下是知识库检索内容，可作为回答参考】\n{rag_context_str}\n\n{system_content}"
+            self.conversation.update_system_message(system_content)
+        # 添加用户消息
+        self.conversation.add_user_message(user_message)
+        return self.conversation.get_messages()
+
     def chat(self, user_message: str, system_prompt_name: str = "default") -> str:
         """
         进行对话（非流式）
@@ -78,26 +129,14 @@ class LLMInstance:
         Returns:
             str: AI 回复
         """
+        pinned = LLMManager.pin_instance(self.instance_id)
         try:
-            # CoT 预处理
-            user_message = self.build_cot_prompt(user_message)
-            # RAG 检索
-            rag_engine = RAGEngine()
-            rag_contexts = rag_engine.query(user_message, top_k=3)
-            rag_context_str = "\n\n".join(rag_contexts)
-            # 更新系统消息
-            system_content = LLMManager._get_system_prompt_content(system_prompt_name)
-            if system_content:
-                if rag_contexts:
-                    system_content = f"【以下是知识库检索内容，可作为回答参考】\n{rag_context_str}\n\n{system_content}"
-                self.conversation.update_system_message(system_content)
-            # 添加用户消息
-            self.conversation.add_user_message(user_message)
+            # RAG 检索（用原始问题检索，并经过检索门控）
+            rag_context_str = self._retrieve_rag_context(user_message)
+            messages = self._prepare_messages(user_message, system_prompt_name, rag_context_str)
 
             # 获取 LLM 并进行对话
             llm = LLMManager.get_llm(self.model_name, self.temperature, streaming=False)
-            messages = self.conversation.get_messages()
-
             response = llm.invoke(messages)
             ai_reply = response.content if isinstance(response.content, str) else str(response.content)
 
@@ -106,13 +145,54 @@ class LLMInstance:
             self.updated_at = datetime.now()
 
             logger.info(f"实例 {self.instance_id} 完成对话")
-            # 新增：保存所有会话历史到json
-            LLMManager.save_all_sessions_to_json()
+            # 只追加本轮新增的消息到会话日志
+            LLMManager.persist_instance(self)
             return ai_reply
 
         except Exception as e:
             logger.error(f"实例对话失败: {e}", exc_info=True)
             raise RuntimeError(f"实例对话失败: {e}")
+        finally:
+            if pinned:
+                LLMManager.unpin_instance(self.instance_id)
+
+    async def achat(self, user_message: str, system_prompt_name: str = "default") -> str:
+        """
+        进行对话（非流式，异步版本）
+
+        Args:
+            user_message: 用户消息
+            system_prompt_name: 系统提示词名称
+
+        Returns:
+            str: AI 回复
+        """
+        pinned = LLMManager.pin_instance(self.instance_id)
+        try:
+            # RAG 检索（用原始问题检索，并经过检索门控）
+            rag_context_str = await self._aretrieve_rag_context(user_message)
+            messages = self._prepare_messages(user_message, system_prompt_name, rag_context_str)
+
+            # 获取 LLM 并进行对话
+            llm = LLMManager.get_llm(self.model_name, self.temperature, streaming=False)
+            response = await llm.ainvoke(messages)
+            ai_reply = response.content if isinstance(response.content, str) else str(response.content)
+
+            # 添加AI回复
+            self.conversation.add_ai_message(ai_reply)
+            self.updated_at = datetime.now()
+
+            logger.info(f"实例 {self.instance_id} 完成对话")
+            # 只追加本轮新增的消息到会话日志
+            LLMManager.persist_instance(self)
+            return ai_reply
+
+        except Exception as e:
+            logger.error(f"实例对话失败: {e}", exc_info=True)
+            raise RuntimeError(f"实例对话失败: {e}")
+        finally:
+            if pinned:
+                LLMManager.unpin_instance(self.instance_id)
 
     # 位于您的 LLM 实例类中
     async def chat_stream(self, user_message: str, system_prompt_name: str = "default") -> AsyncGenerator[str, None]:
@@ -126,25 +206,14 @@ class LLMInstance:
         Yields:
             str: 每个内容块
         """
+        pinned = LLMManager.pin_instance(self.instance_id)
         try:
-            # CoT 预处理
-            user_message = self.build_cot_prompt(user_message)
-            # RAG 检索
-            rag_engine = RAGEngine()
-            rag_contexts = rag_engine.query(user_message, top_k=3)
-            rag_context_str = "\n\n".join(rag_contexts)
-            # 更新系统消息
-            system_content = LLMManager._get_system_prompt_content(system_prompt_name)
-            if system_content:
-                if rag_contexts:
-                    system_content = f"【以下是知识库检索内容，可作为回答参考】\n{rag_context_str}\n\n{system_content}"
-                self.conversation.update_system_message(system_content)
-            # 添加用户消息
-            self.conversation.add_user_message(user_message)
+            # RAG 检索（用原始问题检索，并经过检索门控）
+            rag_context_str = await self._aretrieve_rag_context(user_message)
+            messages = self._prepare_messages(user_message, system_prompt_name, rag_context_str)
 
             # 获取 LLM 并进行流式对话
             llm = LLMManager.get_llm(self.model_name, self.temperature, streaming=True)
-            messages = self.conversation.get_messages()
 
             # 创建一个列表来收集所有数据块
             full_content_parts = []
@@ -165,12 +234,15 @@ class LLMInstance:
             self.updated_at = datetime.now()
 
             logger.info(f"实例 {self.instance_id} 完成流式对话，共计 {len(full_content)} 字符")
-            # 新增：保存所有会话历史到json
-            LLMManager.save_all_sessions_to_json()
+            # 只追加本轮新增的消息到会话日志
+            LLMManager.persist_instance(self)
 
         except Exception as e:
             logger.error(f"实例流式对话失败: {e}", exc_info=True)
             raise RuntimeError(f"实例流式对话失败: {e}")
+        finally:
+            if pinned:
+                LLMManager.unpin_instance(self.instance_id)
 
     def get_conversation_history(self) -> List[BaseMessage]:
         """获取对话历史"""
@@ -180,6 +252,7 @@ class LLMInstance:
         """清除对话历史"""
         self.conversation.clear_history(keep_system_message)
         self.updated_at = datetime.now()
+        LLMManager.persist_instance(self)
         logger.info(f"实例 {self.instance_id} 清除对话历史")
 
     def copy_memory_from(self, source_instance: 'LLMInstance'):
@@ -189,21 +262,15 @@ class LLMInstance:
         Args:
             source_instance: 源实例
         """
-        # 深拷贝对话历史
         source_conversation = source_instance.conversation
 
-        # 重新初始化对话历史
-        self.conversation = LLMConversationHistory(
-            session_id=self.instance_id,
-            max_messages=self.max_messages,
-            max_tokens=self.max_tokens
-        )
-
-        # 复制所有消息
-        self.conversation.messages = copy.deepcopy(source_conversation.messages)
+        # 以结构共享的方式替换本实例的消息（不复制消息对象，分词器不同时重新计数），
+        # 沿用同一个对话历史对象，消息序号接着原有序号递增，日志中的旧消息随之失效
+        self.conversation.adopt(source_conversation)
         self.conversation.created_at = source_conversation.created_at
         self.conversation.updated_at = datetime.now()
         self.updated_at = datetime.now()
+        LLMManager.persist_instance(self)
 
         logger.info(f"实例 {self.instance_id} 从 {source_instance.instance_id} 复制记忆")
 
@@ -217,6 +284,11 @@ class LLMInstance:
         target_instance.copy_memory_from(self)
         logger.info(f"实例 {self.instance_id} 向 {target_instance.instance_id} 转移记忆")
 
+    @property
+    def resident_bytes(self) -> int:
+        """实例常驻内存的估算字节数（以对话历史为主）"""
+        return self.conversation.resident_bytes
+
     def get_stats(self) -> Dict[str, Any]:
         """获取实例统计信息"""
         conversation_stats = self.conversation.get_stats()
@@ -227,6 +299,7 @@ class LLMInstance:
             "temperature": self.temperature,
             "max_messages": self.max_messages,
             "max_tokens": self.max_tokens,
+            "rag_collections": self.rag_collections,
             "total_messages": conversation_stats["total_messages"],
             "message_types": conversation_stats["message_types"],
             "total_characters": conversation_stats["total_characters"],
@@ -253,8 +326,26 @@ class LLMManager:
     # 基础 LLM 实例缓存
     _llm_instances: Dict[str, BaseChatModel] = {}
 
-    # LLM 用户实例管理
-    _llm_user_instances: Dict[str, LLMInstance] = {}  # instance_id -> LLMInstance
+    # LLM 用户实例管理：instance_id -> LLMInstance 的有界缓存，淘汰的实例写入会话日志，下次访问时恢复
+    _llm_user_instances = SessionCache(
+        max_entries=settings.LLM_SESSION_CACHE_MAX_ENTRIES,
+        max_bytes=settings.LLM_SESSION_CACHE_MAX_BYTES,
+        idle_ttl=settings.LLM_SESSION_IDLE_TTL,
+        size_of=lambda instance: instance.resident_bytes,
+        on_evict=lambda instance_id, instance: LLMManager._on_evict(instance)
+    )
+
+    # 会话历史日志及其写回队列，首次持久化时打开
+    _journal: Optional[SessionJournal] = None
+    _persist_queue: Optional[WriteBehindQueue] = None
+    _journal_lock = threading.Lock()
+    _rehydrate_lock = threading.RLock()
+
+    # 会话二级索引：session_id -> {instance_id: 最近更新时间}，以及每个会话当前活跃的实例，
+    # 只保留有常驻实例的会话，其余会话在访问时从会话日志重建
+    _session_instances: Dict[str, Dict[str, str]] = {}
+    _active_instances: Dict[str, str] = {}
+    _index_lock = threading.RLock()
 
     @classmethod
     def get_llm(cls, model_name: str, temperature: float = 0.7, streaming: bool = False) -> BaseChatModel:
@@ -334,7 +425,9 @@ class LLMManager:
                         model_name: str,
                         temperature: float = 0.7,
                         max_messages: int = 50,
-                        max_tokens: int = 4000) -> LLMInstance:
+                        max_tokens: int = 4000,
+                        rag_collections: Optional[List[str]] = None,
+                        session_id: Optional[str] = None) -> LLMInstance:
         """
         创建 LLM 实例
 
@@ -344,11 +437,13 @@ class LLMManager:
             temperature: 温度参数
             max_messages: 最大消息数
             max_tokens: 最大token数
+            rag_collections: 检索的知识库集合，默认使用 settings.RAG_DEFAULT_COLLECTIONS
+            session_id: 所属会话ID，默认从实例ID中解析
 
         Returns:
             LLMInstance: 创建的实例
         """
-        if instance_id in cls._llm_user_instances:
+        if cls.get_instance(instance_id) is not None:
             raise ValueError(f"LLM 实例 '{instance_id}' 已存在")
 
         if model_name not in settings.AVAILABLE_LLMS:
@@ -359,30 +454,211 @@ class LLMManager:
             model_name=model_name,
             temperature=temperature,
             max_messages=max_messages,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            rag_collections=rag_collections,
+            session_id=session_id
         )
 
-        cls._llm_user_instances[instance_id] = instance
+        cls._llm_user_instances.put(instance_id, instance)
+        cls._index_instance(instance, active=True)
         logger.info(f"成功创建 LLM 实例: {instance_id}")
         return instance
 
+    @classmethod
+    async def acreate_instance(cls, *args, **kwargs) -> LLMInstance:
+        """异步版本的 create_instance（检查实例是否已存在可能读取会话日志），在线程中执行"""
+        return await asyncio.to_thread(cls.create_instance, *args, **kwargs)
+
     @classmethod
     def get_instance(cls, instance_id: str) -> Optional[LLMInstance]:
-        """获取 LLM 实例"""
-        return cls._llm_user_instances.get(instance_id)
+        """获取 LLM 实例，不在内存中时从会话日志恢复"""
+        instance = cls._llm_user_instances.get(instance_id)
+        if instance is None:
+            instance = cls._rehydrate_instance(instance_id)
+        return instance
+
+    @classmethod
+    async def aget_instance(cls, instance_id: str) -> Optional[LLMInstance]:
+        """异步获取 LLM 实例，需要从会话日志恢复时在线程中读取，不阻塞事件循环"""
+        instance = cls._llm_user_instances.get(instance_id)
+        if instance is None:
+            instance = await asyncio.to_thread(cls._rehydrate_instance, instance_id)
+        return instance
+
+    @classmethod
+    def _load_instance_state(cls, instance_id: str) -> Optional[tuple]:
+        """
+        实例的持久化状态 (元数据, [(序号, 角色, 内容)])，不存在或已删除时返回 None
+
+        在会话日志的基础上按顺序叠加写回队列中尚未写入的记录，不等待队列刷盘。
+        先取队列快照再读日志：快照之后才写入的记录已包含在快照中，重复叠加结果不变。
+        """
+        queue = cls._get_persist_queue()
+        pending = [record for pending_id, record in queue.pending_items() if pending_id == instance_id]
+        meta = cls._journal.load_session(instance_id)
+        messages = {}
+        if meta is not None:
+            messages = {seq: (seq, role, content) for seq, role, content in cls._journal.load_messages(instance_id)}
+        for record in pending:
+            if record is None:
+                meta, messages = None, {}
+                continue
+            if record.reset:
+                messages = {}
+            meta = {
+                "session_id": record.session_id,
+                "model_name": record.model_name,
+                "temperature": record.temperature,
+                "max_messages": record.max_messages,
+                "max_tokens": record.max_tokens,
+                "rag_collections": json.loads(record.rag_collections) if record.rag_collections else None,
+                "created_at": record.created_at,
+                "updated_at": record.updated_at,
+                "base_seq": record.base_seq,
+                "next_seq": record.next_seq
+            }
+            messages = {seq: item for seq, item in messages.items() if seq >= record.base_seq}
+            messages.update((item[0], item) for item in record.new_messages)
+        if meta is None:
+            return None
+        return meta, [messages[seq] for seq in sorted(messages)]
+
+    @classmethod
+    def _rehydrate_instance(cls, instance_id: str) -> Optional[LLMInstance]:
+        """按实例ID从会话日志重建实例及其对话历史，日志中不存在时返回 None"""
+        with cls._rehydrate_lock:
+            instance = cls._llm_user_instances.get(instance_id)
+            if instance is not None:
+                return instance
+
+            state = cls._load_instance_state(instance_id)
+            if state is None:
+                return None
+            meta, rows = state
+
+            instance = LLMInstance(
+                instance_id=instance_id,
+                model_name=meta["model_name"],
+                temperature=meta["temperature"],
+                max_messages=meta["max_messages"],
+                max_tokens=meta["max_tokens"],
+                rag_collections=meta["rag_collections"],
+                session_id=meta["session_id"]
+            )
+            messages = [to_message(role, content) for _, role, content in rows]
+            instance.conversation.restore(messages, meta["next_seq"])
+            instance.created_at = datetime.fromisoformat(meta["created_at"])
+            instance.updated_at = datetime.fromisoformat(meta["updated_at"])
+            instance.conversation.updated_at = instance.updated_at
+            cls._llm_user_instances.put(instance_id, instance)
+            cls._index_instance(instance, active=False)
+            logger.info(f"已从会话日志恢复 LLM 实例: {instance_id}（{len(messages)} 条消息）")
+            return instance
 
     @classmethod
     def delete_instance(cls, instance_id: str) -> bool:
         """删除 LLM 实例"""
-        if instance_id in cls._llm_user_instances:
-            del cls._llm_user_instances[instance_id]
-            logger.info(f"已删除 LLM 实例: {instance_id}")
-            return True
-        return False
+        queue = cls._get_persist_queue()
+        instance = cls._llm_user_instances.pop(instance_id)
+        if instance is not None:
+            session_id = instance.session_id
+        else:
+            state = cls._load_instance_state(instance_id)
+            if state is None:
+                return False
+            session_id = state[0]["session_id"]
+
+        queue.enqueue_delete(instance_id)
+        cls._unindex_instance(session_id, instance_id)
+        logger.info(f"已删除 LLM 实例: {instance_id}")
+        return True
+
+    @classmethod
+    async def adelete_instance(cls, instance_id: str) -> bool:
+        """异步版本的 delete_instance，实例不在内存中时在线程中读取会话日志"""
+        return await asyncio.to_thread(cls.delete_instance, instance_id)
+
+    # =============== 会话索引 ===============
+
+    @classmethod
+    def _load_session_entry(cls, session_id: str) -> Dict[str, str]:
+        """会话的索引项，不在索引中时由会话日志和写回队列中尚未写入的记录重建（持有索引锁时调用）"""
+        entry = cls._session_instances.get(session_id)
+        if entry is not None:
+            return entry
+
+        queue = cls._get_persist_queue()
+        entry = cls._journal.find_instances(session_id)
+        for instance_id, record in queue.pending_items():
+            if record is None:
+                entry.pop(instance_id, None)
+            elif record.session_id == session_id:
+                entry[instance_id] = record.updated_at
+        # 只缓存有常驻实例的会话，索引大小不随历史会话数增长
+        if any(instance_id in cls._llm_user_instances for instance_id in entry):
+            cls._session_instances[session_id] = entry
+            cls._active_instances[session_id] = max(entry, key=entry.get)
+        return entry
+
+    @classmethod
+    def _index_instance(cls, instance: LLMInstance, active: bool):
+        with cls._index_lock:
+            entry = cls._load_session_entry(instance.session_id)
+            entry[instance.instance_id] = instance.updated_at.isoformat()
+            cls._session_instances[instance.session_id] = entry
+            if active or instance.session_id not in cls._active_instances:
+                cls._active_instances[instance.session_id] = instance.instance_id
+
+    @classmethod
+    def _unindex_instance(cls, session_id: str, instance_id: str):
+        with cls._index_lock:
+            entry = cls._load_session_entry(session_id)
+            entry.pop(instance_id, None)
+            if session_id not in cls._session_instances:
+                return
+            if not any(other in cls._llm_user_instances for other in entry):
+                cls._session_instances.pop(session_id, None)
+                cls._active_instances.pop(session_id, None)
+            elif cls._active_instances.get(session_id) == instance_id:
+                cls._active_instances[session_id] = max(entry, key=entry.get)
+
+    @classmethod
+    def _on_evict(cls, instance: LLMInstance):
+        """实例被会话缓存淘汰：写出记录，会话已没有常驻实例时移出索引"""
+        cls._spill_instance(instance)
+        with cls._index_lock:
+            entry = cls._session_instances.get(instance.session_id)
+            if entry is not None and not any(instance_id in cls._llm_user_instances for instance_id in entry):
+                del cls._session_instances[instance.session_id]
+                cls._active_instances.pop(instance.session_id, None)
+
+    @classmethod
+    def get_session_instances(cls, session_id: str) -> Dict[str, str]:
+        """会话下的全部实例（含尚未恢复到内存的），instance_id -> 最近更新时间（ISO 格式）"""
+        with cls._index_lock:
+            return dict(cls._load_session_entry(session_id))
+
+    @classmethod
+    def get_active_instance_id(cls, session_id: str) -> Optional[str]:
+        """会话当前活跃（最近创建或对话）的实例ID，会话不存在时返回 None"""
+        active = cls._active_instances.get(session_id)
+        if active is not None:
+            return active
+        with cls._index_lock:
+            entry = cls._load_session_entry(session_id)
+            return cls._active_instances.get(session_id) or (max(entry, key=entry.get) if entry else None)
+
+    @classmethod
+    async def aget_active_instance_id(cls, session_id: str) -> Optional[str]:
+        """异步版本的 get_active_instance_id，会话不在索引中时在线程中读取会话日志"""
+        active = cls._active_instances.get(session_id)
+        if active is not None:
+            return active
+        return await asyncio.to_thread(cls.get_active_instance_id, session_id)
 
     @classmethod
     def list_instances(cls) -> Dict[str, Dict[str, Any]]:
-        """列出所有 LLM 实例"""
+        """列出内存中的 LLM 实例（尚未从会话日志恢复的实例不包含在内）"""
         return {
             instance_id: instance.get_stats()
             for instance_id, instance in cls._llm_user_instances.items()
@@ -483,7 +759,8 @@ class LLMManager:
             model_name=new_model_name,
             temperature=temperature,
             max_messages=source_instance.max_messages,
-            max_tokens=source_instance.max_tokens
+            max_tokens=source_instance.max_tokens,
+            rag_collections=source_instance.rag_collections
         )
 
         # 转移记忆
@@ -524,7 +801,8 @@ class LLMManager:
             model_name=model_name,
             temperature=temperature,
             max_messages=source_instance.max_messages,
-            max_tokens=source_instance.max_tokens
+            max_tokens=source_instance.max_tokens,
+            rag_collections=source_instance.rag_collections
         )
 
         # 复制记忆
@@ -551,11 +829,91 @@ class LLMManager:
         """获取可用的模型信息"""
         return settings.AVAILABLE_LLMS
 
+    # =============== 持久化方法 ===============
+
+    @classmethod
+    def _get_persist_queue(cls) -> WriteBehindQueue:
+        if cls._persist_queue is None:
+            with cls._journal_lock:
+                if cls._persist_queue is None:
+                    cls._journal = SessionJournal(settings.CHAT_JOURNAL_PATH, settings.CHAT_JOURNAL_COMPACT_INTERVAL)
+                    cls._persist_queue = WriteBehindQueue(
+                        cls._journal, settings.CHAT_PERSIST_FLUSH_INTERVAL, settings.CHAT_PERSIST_MAX_PENDING
+                    )
+        return cls._persist_queue
+
+    @classmethod
+    def persist_instance(cls, instance: LLMInstance):
+        """
+        登记实例自上次持久化以来新增的消息，由后台写回队列批量写入会话日志
+
+        只做内存操作，不等待磁盘写入；同时更新实例在会话缓存中的大小和访问时间，并设为所属会话的活跃实例。
+        """
+        cls._spill_instance(instance)
+        cls._llm_user_instances.touch(instance.instance_id)
+        cls._index_instance(instance, active=True)
+
+    @classmethod
+    def pin_instance(cls, instance_id: str) -> bool:
+        """处理请求期间 pin 住常驻实例，unpin_instance 之前不会被会话缓存淘汰；实例不在缓存中时返回 False"""
+        return cls._llm_user_instances.pin(instance_id)
+
+    @classmethod
+    def unpin_instance(cls, instance_id: str):
+        cls._llm_user_instances.unpin(instance_id)
+
+    @classmethod
+    def _spill_instance(cls, instance: LLMInstance):
+        try:
+            record = SessionRecord.from_instance(instance)
+            cls._get_persist_queue().enqueue(record)
+            instance.conversation.persisted_seq = record.next_seq
+        except Exception as e:
+            logger.error(f"登记实例 {instance.instance_id} 的会话历史失败: {e}", exc_info=True)
+
+    @classmethod
+    def get_persist_queue(cls) -> WriteBehindQueue:
+        """会话写回队列（未打开时打开）"""
+        return cls._get_persist_queue()
+
     @classmethod
-    def save_all_sessions_to_json(cls):
-        """保存所有会话历史到json文件，路径写死为settings.CHAT_HISTORY_JSON_PATH。"""
-        from backend.core.llm.llm_conversation_history import LLMConversationHistory
-        LLMConversationHistory.save_all_sessions_to_json(cls._llm_user_instances, settings.CHAT_HISTORY_JSON_PATH)
+    def get_journal(cls) -> SessionJournal:
+        """会话日志（未打开时打开）"""
+        cls._get_persist_queue()
+        return cls._journal
+
+    @classmethod
+    def export_sessions(cls) -> Dict[str, List[Dict[str, str]]]:
+        """按会话导出已持久化的全部对话历史（先写入队列中的记录）"""
+        queue = cls._get_persist_queue()
+        queue.flush()
+        return cls._journal.export()
+
+    @classmethod
+    def initialize(cls):
+        """打开会话日志；历史会话不在启动时加载，首次访问时按实例ID从日志恢复"""
+        cls._get_persist_queue()
+
+    @classmethod
+    def get_persistence_stats(cls) -> Dict[str, Any]:
+        """写回队列深度、合并次数与刷盘耗时"""
+        return cls._get_persist_queue().get_stats()
+
+    @classmethod
+    def get_cache_stats(cls) -> Dict[str, Any]:
+        """会话缓存的常驻实例数、估算常驻字节数、命中与淘汰计数"""
+        return cls._llm_user_instances.get_stats()
+
+    @classmethod
+    def shutdown(cls):
+        """写入队列中剩余的记录并关闭会话日志"""
+        with cls._journal_lock:
+            if cls._persist_queue is not None:
+                cls._persist_queue.close()
+                cls._persist_queue = None
+            if cls._journal is not None:
+                cls._journal.close()
+                cls._journal = None
 
     # =============== 便捷方法 ===============
 
@@ -565,7 +923,8 @@ class LLMManager:
                    user_message: str,
                    model_name: str = "deepseek-chat",
                    system_prompt_name: str = "default",
-                   create_if_not_exists: bool = True) -> str:
+                   create_if_not_exists: bool = True,
+                   rag_collections: Optional[List[str]] = None) -> str:
         """
         快速对话方法
 
@@ -575,6 +934,7 @@ class LLMManager:
             model_name: 模型名称（仅在创建新实例时使用）
             system_prompt_name: 系统提示词名称
             create_if_not_exists: 如果实例不存在是否自动创建
+            rag_collections: 检索的知识库集合，不传时保持实例原有设置
 
         Returns:
             str: AI 回复
@@ -583,19 +943,56 @@ class LLMManager:
 
         if not instance:
             if create_if_not_exists:
-                instance = cls.create_instance(instance_id, model_name)
+                instance = cls.create_instance(instance_id, model_name, rag_collections=rag_collections)
             else:
                 raise ValueError(f"实例 {instance_id} 不存在")
+        elif rag_collections is not None:
+            instance.rag_collections = rag_collections
 
         return instance.chat(user_message, system_prompt_name)
 
+    @classmethod
+    async def aquick_chat(cls,
+                          instance_id: str,
+                          user_message: str,
+                          model_name: str = "deepseek-chat",
+                          system_prompt_name: str = "default",
+                          create_if_not_exists: bool = True,
+                          rag_collections: Optional[List[str]] = None) -> str:
+        """
+        快速对话方法 (异步版本)
+
+        Args:
+            instance_id: 实例ID
+            user_message: 用户消息
+            model_name: 模型名称（仅在创建新实例时使用）
+            system_prompt_name: 系统提示词名称
+            create_if_not_exists: 如果实例不存在是否自动创建
+            rag_collections: 检索的知识库集合，不传时保持实例原有设置
+
+        Returns:
+            str: AI 回复
+        """
+        instance = await cls.aget_instance(instance_id)
+
+        if not instance:
+            if create_if_not_exists:
+                instance = await cls.acreate_instance(instance_id, model_name, rag_collections=rag_collections)
+            else:
+                raise ValueError(f"实例 {instance_id} 不存在")
+        elif rag_collections is not None:
+            instance.rag_collections = rag_collections
+
+        return await instance.achat(user_message, system_prompt_name)
+
     @classmethod
     async def quick_chat_stream(cls,
                         instance_id: str,
                         user_message: str,
                         model_name: str = "deepseek-chat",
                         system_prompt_name: str = "default",
-                        create_if_not_exists: bool = True) -> AsyncGenerator[str, None]:
+                        create_if_not_exists: bool = True,
+                        rag_collections: Optional[List[str]] = None) -> AsyncGenerator[str, None]:
         """
         快速流式对话 (异步版本)
 
@@ -605,20 +1002,24 @@ class LLMManager:
             model_name: 模型名称
             system_prompt_name: 系统提示词名称
             create_if_not_exists: 如果实例不存在是否创建
+            rag_collections: 检索的知识库集合，不传时保持实例原有设置
 
         Yields:
             str: 每个内容块
         """
         try:
             # 获取或创建实例
-            instance = cls.get_instance(instance_id)
+            instance = await cls.aget_instance(instance_id)
             if not instance and create_if_not_exists:
-                instance = cls.create_instance(
+                instance = await cls.acreate_instance(
                     instance_id=instance_id,
-                    model_name=model_name
+                    model_name=model_name,
+                    rag_collections=rag_collections
                 )
             elif not instance:
                 raise ValueError(f"实例不存在: {instance_id}")
+            elif rag_collections is not None:
+                instance.rag_collections = rag_collections
 
             # 使用实例进行流式对话
             async for chunk in instance.chat_stream(user_message, system_prompt_name):
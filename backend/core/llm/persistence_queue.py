@@ -0,0 +1,180 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.core.llm.session_journal import AgentMemoryRecord, SessionJournal, SessionRecord
+from backend.utils.logger import logger
+
+
+class WriteBehindQueue:
+    """
+    会话持久化写回队列
+
+    请求处理中只把实例的增量记录放入内存队列，不访问磁盘；
+    同一实例在一次刷盘前的多次更新合并为一条记录，
+    后台线程按时间间隔或待写实例数阈值批量写入会话日志，写入失败的记录放回队列下次重试。
+    被淘汰的 Agent 记忆以整体快照的形式同样经由本队列写出，同一记忆只保留最新的快照。
+    """
+
+    def __init__(self, journal: SessionJournal, flush_interval: float = 1.0, max_pending: int = 256):
+        self.journal = journal
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # instance_id -> 待写记录，None 表示待删除
+        self._pending: Dict[str, Optional[SessionRecord]] = {}
+        # 正在写入的批次
+        self._inflight: Dict[str, Optional[SessionRecord]] = {}
+        # memory_key -> 待写的 Agent 记忆快照，以及正在写入的批次
+        self._pending_memories: Dict[str, AgentMemoryRecord] = {}
+        self._inflight_memories: Dict[str, AgentMemoryRecord] = {}
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stopped = False
+
+        self.enqueued = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.flushed_records = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="session-write-behind", daemon=True)
+        self._thread.start()
+
+    def _put(self, instance_id: str, record: Optional[SessionRecord]):
+        if instance_id in self._pending:
+            self.coalesced += 1
+            existing = self._pending[instance_id]
+            if record is not None:
+                if existing is None:
+                    record.reset = True
+                else:
+                    record = existing.merge(record)
+        self._pending[instance_id] = record
+
+    def enqueue(self, record: SessionRecord):
+        """放入一条实例记录，立即返回"""
+        with self._cond:
+            self._put(record.instance_id, record)
+            self.enqueued += 1
+            if self._depth() >= self.max_pending:
+                self._cond.notify()
+
+    def enqueue_delete(self, instance_id: str):
+        """删除实例的持久化记录，排在该实例此前的写入之后执行"""
+        with self._cond:
+            self._put(instance_id, None)
+            self.enqueued += 1
+
+    def enqueue_agent_memory(self, record: AgentMemoryRecord):
+        """放入一个 Agent 记忆快照（替换该记忆尚未写入的快照），立即返回"""
+        with self._cond:
+            if record.memory_key in self._pending_memories:
+                self.coalesced += 1
+            self._pending_memories[record.memory_key] = record
+            self.enqueued += 1
+            if self._depth() >= self.max_pending:
+                self._cond.notify()
+
+    def pending_agent_memory(self, memory_key: str) -> Optional[AgentMemoryRecord]:
+        """Agent 记忆尚未写入会话日志的最新快照（含正在写入的批次），没有时返回 None"""
+        with self._cond:
+            return self._pending_memories.get(memory_key) or self._inflight_memories.get(memory_key)
+
+    def delete_agent_memories(self, session_id: str, agent_name: Optional[str] = None) -> int:
+        """
+        删除会话的 Agent 记忆，不指定 agent_name 时删除该会话的全部 Agent 记忆
+
+        丢弃队列中尚未写入的快照后删除日志中的记录；与刷盘互斥，删除后不会被正在写入的批次写回。
+        """
+        with self._flush_lock:
+            with self._cond:
+                for memory_key, record in list(self._pending_memories.items()):
+                    if record.session_id == session_id and (agent_name is None or record.agent_name == agent_name):
+                        del self._pending_memories[memory_key]
+            return self.journal.delete_agent_memories(session_id, agent_name)
+
+    def _depth(self) -> int:
+        return len(self._pending) + len(self._pending_memories)
+
+    def is_pending(self, instance_id: str) -> bool:
+        """实例是否有尚未写入会话日志的记录（含正在写入的批次）"""
+        with self._cond:
+            return instance_id in self._pending or instance_id in self._inflight
+
+    def pending_items(self) -> List[Tuple[str, Optional[SessionRecord]]]:
+        """尚未写入的记录 (instance_id, 记录或 None 表示待删除)，按写入先后排列"""
+        with self._cond:
+            return list(self._inflight.items()) + list(self._pending.items())
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopped or self._depth() >= self.max_pending,
+                                    timeout=self.flush_interval)
+                if self._stopped:
+                    return
+            self.flush()
+
+    def flush(self) -> int:
+        """把当前队列中的记录写入会话日志，返回写入的实例数与 Agent 记忆数之和"""
+        with self._flush_lock:
+            with self._cond:
+                batch, self._pending = self._pending, {}
+                memories, self._pending_memories = self._pending_memories, {}
+                self._inflight, self._inflight_memories = batch, memories
+            if not batch and not memories:
+                return 0
+
+            started = time.perf_counter()
+            records = [record for record in batch.values() if record is not None]
+            deletes = [instance_id for instance_id, record in batch.items() if record is None]
+            try:
+                self.journal.append(records)
+                for instance_id in deletes:
+                    self.journal.delete(instance_id)
+                self.journal.save_agent_memories(memories.values())
+            except Exception as e:
+                self.failed_flushes += 1
+                logger.error(f"会话历史写入失败，{len(batch) + len(memories)} 条记录将在下次重试: {e}", exc_info=True)
+                with self._cond:
+                    self._inflight, self._inflight_memories = {}, {}
+                    # 放回队列，刷盘期间的新写入合并在其后
+                    newer, self._pending = self._pending, batch
+                    for instance_id, record in newer.items():
+                        self._put(instance_id, record)
+                    self._pending_memories = {**memories, **self._pending_memories}
+                return 0
+
+            with self._cond:
+                self._inflight, self._inflight_memories = {}, {}
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.flushes += 1
+            self.flushed_records += len(batch) + len(memories)
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+            return len(batch) + len(memories)
+
+    def close(self):
+        """停止后台线程并写入剩余记录"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
+        self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self._depth(),
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+            "flushed_records": self.flushed_records,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 3)
+        }
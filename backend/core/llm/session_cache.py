@@ -0,0 +1,212 @@
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from backend.utils.logger import logger
+
+
+class SessionCache:
+    """
+    常驻会话对象的有界缓存（LRU + 空闲过期，线程安全）
+
+    同时限制条目数、估算的常驻字节数和空闲时间，超出时按最久未访问的顺序淘汰，
+    淘汰前调用 on_evict 把对象写出到持久化存储，之后由调用方在下次访问时重新加载。
+    正在使用的对象（如正在处理请求）由调用方 pin 住，unpin 之前不会被淘汰。
+    空闲过期在访问时检查，另由 start_sweeper 启动的后台线程定期清理，服务空闲时也会按时写出。
+    """
+
+    # 全部缓存实例，供后台清理线程遍历
+    _registry: "weakref.WeakSet[SessionCache]" = weakref.WeakSet()
+    _sweeper: Optional[threading.Thread] = None
+    _sweeper_stop = threading.Event()
+
+    def __init__(self,
+                 max_entries: int,
+                 max_bytes: int,
+                 idle_ttl: float,
+                 size_of: Callable[[Any], int],
+                 on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.size_of = size_of
+        self.on_evict = on_evict
+        # key -> (对象, 估算字节数, 最近访问时间)
+        self._data: "OrderedDict[Hashable, Tuple[Any, int, float]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {"lru": 0, "bytes": 0, "ttl": 0}
+        # key -> pin 计数，大于 0 时不淘汰
+        self._pins: Dict[Hashable, int] = {}
+        SessionCache._registry.add(self)
+
+    def get(self, key: Hashable, pin: bool = False) -> Optional[Any]:
+        """获取对象并刷新访问时间，pin 为 True 时命中的对象在 unpin 之前不会被淘汰"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._data[key] = (item[0], item[1], time.monotonic())
+            self._data.move_to_end(key)
+            if pin:
+                self._pins[key] = self._pins.get(key, 0) + 1
+            return item[0]
+
+    def put(self, key: Hashable, value: Any, pin: bool = False):
+        """放入对象（已存在时替换），随后按限制淘汰；pin 含义同 get"""
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.resident_bytes -= old[1]
+            size = self.size_of(value)
+            self._data[key] = (value, size, time.monotonic())
+            self.resident_bytes += size
+            if pin:
+                self._pins[key] = self._pins.get(key, 0) + 1
+            evicted = self._collect_evictions(keep=key)
+        self._spill(evicted)
+
+    def pin(self, key: Hashable) -> bool:
+        """pin 住已缓存的对象（不刷新访问时间），对象不在缓存中时返回 False，返回 True 时需调用 unpin"""
+        with self._lock:
+            if key not in self._data:
+                return False
+            self._pins[key] = self._pins.get(key, 0) + 1
+            return True
+
+    def unpin(self, key: Hashable):
+        """释放一次 pin，随后按限制淘汰（pin 期间超出的限制在此补做）"""
+        with self._lock:
+            count = self._pins.get(key, 0) - 1
+            if count > 0:
+                self._pins[key] = count
+                return
+            self._pins.pop(key, None)
+            evicted = self._collect_evictions()
+        self._spill(evicted)
+
+    def touch(self, key: Hashable):
+        """对象内容变化后重新估算大小、刷新访问时间，并按限制淘汰"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return
+            size = self.size_of(item[0])
+            self.resident_bytes += size - item[1]
+            self._data[key] = (item[0], size, time.monotonic())
+            self._data.move_to_end(key)
+            evicted = self._collect_evictions(keep=key)
+        self._spill(evicted)
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        """移除对象（不调用 on_evict）"""
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                return None
+            self.resident_bytes -= item[1]
+            return item[0]
+
+    def sweep(self) -> int:
+        """淘汰所有超过空闲时间的对象，返回淘汰数"""
+        with self._lock:
+            evicted = self._collect_evictions()
+        self._spill(evicted)
+        return len(evicted)
+
+    def _collect_evictions(self, keep: Optional[Hashable] = None) -> List[Tuple[Hashable, Any]]:
+        """从最久未访问的一端取出需要淘汰的对象，遇到第一个无需淘汰的对象即停止（持有锁时调用）"""
+        victims = []
+        now = time.monotonic()
+        entries, resident = len(self._data), self.resident_bytes
+        for key, (value, size, accessed_at) in self._data.items():
+            if self.idle_ttl > 0 and now - accessed_at > self.idle_ttl:
+                reason = "ttl"
+            elif entries > self.max_entries:
+                reason = "lru"
+            elif resident > self.max_bytes:
+                reason = "bytes"
+            else:
+                break
+            if key == keep or key in self._pins:
+                continue
+            victims.append((key, value, size, reason))
+            entries -= 1
+            resident -= size
+
+        for key, _, size, reason in victims:
+            del self._data[key]
+            self.resident_bytes -= size
+            self.evictions[reason] += 1
+        return [(key, value) for key, value, _, _ in victims]
+
+    @classmethod
+    def start_sweeper(cls, interval: float):
+        """启动后台线程，每 interval 秒清理一次所有缓存中空闲过期的对象（已启动时忽略）"""
+        if interval <= 0 or (cls._sweeper is not None and cls._sweeper.is_alive()):
+            return
+        cls._sweeper_stop.clear()
+        cls._sweeper = threading.Thread(target=cls._sweep_loop, args=(interval,), name="session-cache-sweep", daemon=True)
+        cls._sweeper.start()
+
+    @classmethod
+    def stop_sweeper(cls):
+        cls._sweeper_stop.set()
+        if cls._sweeper is not None:
+            cls._sweeper.join()
+            cls._sweeper = None
+
+    @classmethod
+    def _sweep_loop(cls, interval: float):
+        while not cls._sweeper_stop.wait(interval):
+            for cache in list(cls._registry):
+                try:
+                    cache.sweep()
+                except Exception as e:
+                    logger.error(f"会话缓存过期清理失败: {e}", exc_info=True)
+
+    def _spill(self, evicted: List[Tuple[Hashable, Any]]):
+        if self.on_evict is None:
+            return
+        for key, value in evicted:
+            self.on_evict(key, value)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def keys(self) -> List[Hashable]:
+        with self._lock:
+            return list(self._data.keys())
+
+    def items(self) -> Iterator[Tuple[Hashable, Any]]:
+        """当前常驻对象的快照（不刷新访问时间）"""
+        with self._lock:
+            return iter([(key, item[0]) for key, item in self._data.items()])
+
+    def values(self) -> List[Any]:
+        with self._lock:
+            return [item[0] for item in self._data.values()]
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "pinned": len(self._pins),
+            "max_entries": self.max_entries,
+            "resident_bytes": self.resident_bytes,
+            "max_bytes": self.max_bytes,
+            "idle_ttl": self.idle_ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": dict(self.evictions)
+        }
@@ -0,0 +1,298 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from backend.utils.logger import logger
+
+_ROLES = {HumanMessage: "user", AIMessage: "assistant"}
+
+_META_COLUMNS = ("instance_id", "session_id", "model_name", "temperature", "max_messages", "max_tokens",
+                 "rag_collections", "created_at", "updated_at", "base_seq")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    instance_id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    model_name TEXT NOT NULL,
+    temperature REAL NOT NULL,
+    max_messages INTEGER NOT NULL,
+    max_tokens INTEGER NOT NULL,
+    rag_collections TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    base_seq INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_session ON sessions (session_id);
+CREATE TABLE IF NOT EXISTS messages (
+    instance_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (instance_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS agent_memories (
+    memory_key TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    agent_name TEXT NOT NULL,
+    memory_window INTEGER NOT NULL,
+    messages TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_agent_memories_session ON agent_memories (session_id);
+"""
+
+
+class SessionRecord:
+    """一次持久化写入：实例元数据、仍保留的最老消息序号与新增消息"""
+
+    __slots__ = ("instance_id", "session_id", "model_name", "temperature", "max_messages", "max_tokens",
+                 "rag_collections", "created_at", "updated_at", "base_seq", "next_seq", "new_messages", "reset")
+
+    def __init__(self, instance, base_seq: int, next_seq: int, new_messages: List[Tuple[int, str, str]]):
+        self.instance_id = instance.instance_id
+        self.session_id = instance.session_id
+        self.model_name = instance.model_name
+        self.temperature = instance.temperature
+        self.max_messages = instance.max_messages
+        self.max_tokens = instance.max_tokens
+        self.rag_collections = json.dumps(instance.rag_collections) if instance.rag_collections is not None else None
+        self.created_at = instance.created_at.isoformat()
+        self.updated_at = instance.updated_at.isoformat()
+        self.base_seq = base_seq
+        self.next_seq = next_seq
+        # (序号, 角色, 内容)
+        self.new_messages = new_messages
+        # 写入前先删除该实例已有的消息（实例被删除后又以同一ID重建）
+        self.reset = False
+
+    @classmethod
+    def from_instance(cls, instance) -> "SessionRecord":
+        """取实例自上次持久化以来新增的消息（系统消息不持久化）"""
+        conversation = instance.conversation
+        new_messages = [
+            (seq, _ROLES[type(msg)], msg.content)
+            for seq, msg in conversation.turns_since(conversation.persisted_seq)
+            if type(msg) in _ROLES
+        ]
+        return cls(instance, conversation.first_seq, conversation.next_seq, new_messages)
+
+    def merge(self, newer: "SessionRecord") -> "SessionRecord":
+        """合并同一实例的两次写入：元数据取较新的一次，消息按序号合并并丢弃已失效的部分"""
+        messages = {seq: (seq, role, content) for seq, role, content in self.new_messages if seq >= newer.base_seq}
+        messages.update((item[0], item) for item in newer.new_messages)
+        newer.new_messages = [messages[seq] for seq in sorted(messages)]
+        newer.reset = newer.reset or self.reset
+        return newer
+
+
+class AgentMemoryRecord:
+    """一次 Agent 记忆写入：整个记忆的快照（role/content 列表）"""
+
+    __slots__ = ("memory_key", "session_id", "agent_name", "memory_window", "messages")
+
+    def __init__(self, memory_key: str, session_id: str, agent_name: str, memory_window: int,
+                 messages: List[Tuple[str, str]]):
+        self.memory_key = memory_key
+        self.session_id = session_id
+        self.agent_name = agent_name
+        self.memory_window = memory_window
+        self.messages = messages
+
+
+class SessionJournal:
+    """
+    会话历史日志（SQLite WAL 模式）
+
+    每轮对话只追加该实例新增的消息，不再整体重写全部会话；
+    清除、淘汰的消息通过 base_seq 标记失效，由后台压缩线程统一删除。
+    连接使用 synchronous=NORMAL，提交只写 WAL 不逐条 fsync，
+    压缩时执行 checkpoint 统一落盘，掉电最多丢失最近一个压缩周期内的写入，不会损坏数据库。
+    """
+
+    def __init__(self, path: str, compact_interval: float = 300):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.compact_interval = compact_interval
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+        self._stop = threading.Event()
+        self._compactor: Optional[threading.Thread] = None
+        if compact_interval > 0:
+            self._compactor = threading.Thread(target=self._compact_loop, name="session-journal-compact", daemon=True)
+            self._compactor.start()
+        logger.info(f"会话日志已打开: {path}")
+
+    def append(self, records: Iterable[SessionRecord]):
+        """在一个事务中写入多条记录"""
+        records = list(records)
+        if not records:
+            return
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "DELETE FROM messages WHERE instance_id = ?", [(r.instance_id,) for r in records if r.reset]
+                )
+                self._conn.executemany(
+                    """
+                    INSERT INTO sessions (instance_id, session_id, model_name, temperature, max_messages, max_tokens,
+                                          rag_collections, created_at, updated_at, base_seq)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (instance_id) DO UPDATE SET
+                        session_id = excluded.session_id, model_name = excluded.model_name,
+                        temperature = excluded.temperature, max_messages = excluded.max_messages,
+                        max_tokens = excluded.max_tokens, rag_collections = excluded.rag_collections,
+                        updated_at = excluded.updated_at, base_seq = excluded.base_seq
+                    """,
+                    [(r.instance_id, r.session_id, r.model_name, r.temperature, r.max_messages, r.max_tokens,
+                      r.rag_collections, r.created_at, r.updated_at, r.base_seq) for r in records]
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO messages (instance_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                    [(r.instance_id, seq, role, content) for r in records for seq, role, content in r.new_messages]
+                )
+
+    def delete(self, instance_id: str):
+        """删除实例的全部记录"""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM messages WHERE instance_id = ?", (instance_id,))
+                self._conn.execute("DELETE FROM sessions WHERE instance_id = ?", (instance_id,))
+
+    def load_session(self, instance_id: str) -> Optional[Dict[str, Any]]:
+        """实例的元数据与消息序号上界，不存在时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                f"""
+                SELECT {", ".join(_META_COLUMNS)},
+                       COALESCE((SELECT MAX(seq) + 1 FROM messages m WHERE m.instance_id = s.instance_id), s.base_seq)
+                FROM sessions s WHERE instance_id = ?
+                """,
+                (instance_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        meta = dict(zip(_META_COLUMNS, row))
+        meta["rag_collections"] = json.loads(meta["rag_collections"]) if meta["rag_collections"] else None
+        meta["next_seq"] = max(row[-1], meta["base_seq"])
+        return meta
+
+    def find_instances(self, session_id: str) -> Dict[str, str]:
+        """会话下已持久化的实例：instance_id -> updated_at（ISO 格式）"""
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT instance_id, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchall())
+
+    def load_messages(self, instance_id: str) -> List[Tuple[int, str, str]]:
+        """实例仍有效的消息 (序号, 角色, 内容)，按序号排列"""
+        with self._lock:
+            return self._conn.execute(
+                """
+                SELECT m.seq, m.role, m.content FROM messages m JOIN sessions s ON s.instance_id = m.instance_id
+                WHERE m.instance_id = ? AND m.seq >= s.base_seq ORDER BY m.seq
+                """,
+                (instance_id,)
+            ).fetchall()
+
+    def export(self) -> Dict[str, List[Dict[str, str]]]:
+        """按会话导出全部有效消息（role/content 结构），同一会话的多个实例按创建时间拼接"""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT s.session_id, m.role, m.content FROM sessions s
+                JOIN messages m ON m.instance_id = s.instance_id AND m.seq >= s.base_seq
+                ORDER BY s.session_id, s.created_at, s.instance_id, m.seq
+                """
+            ).fetchall()
+        result: Dict[str, List[Dict[str, str]]] = {}
+        for session_id, role, content in rows:
+            result.setdefault(session_id, []).append({"role": role, "content": content})
+        return result
+
+    def save_agent_memories(self, records: Iterable[AgentMemoryRecord]):
+        """在一个事务中整体写入多个 Agent 记忆"""
+        records = list(records)
+        if not records:
+            return
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    """
+                    INSERT OR REPLACE INTO agent_memories (memory_key, session_id, agent_name, memory_window, messages, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    [(r.memory_key, r.session_id, r.agent_name, r.memory_window,
+                      json.dumps(r.messages, ensure_ascii=False), now) for r in records]
+                )
+
+    def load_agent_memory(self, memory_key: str) -> Optional[Tuple[int, List[Tuple[str, str]]]]:
+        """读取 Agent 记忆，返回 (记忆窗口, role/content 列表)，不存在时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT memory_window, messages FROM agent_memories WHERE memory_key = ?", (memory_key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], [tuple(item) for item in json.loads(row[1])]
+
+    def delete_agent_memories(self, session_id: str, agent_name: Optional[str] = None) -> int:
+        """删除会话的 Agent 记忆，不指定 agent_name 时删除该会话的全部 Agent 记忆"""
+        with self._lock:
+            with self._conn:
+                if agent_name is None:
+                    cursor = self._conn.execute("DELETE FROM agent_memories WHERE session_id = ?", (session_id,))
+                else:
+                    cursor = self._conn.execute(
+                        "DELETE FROM agent_memories WHERE session_id = ? AND agent_name = ?", (session_id, agent_name)
+                    )
+                return cursor.rowcount
+
+    def compact(self) -> int:
+        """删除已失效的消息并执行 checkpoint，返回删除的消息数"""
+        with self._lock:
+            with self._conn:
+                deleted = self._conn.execute(
+                    """
+                    DELETE FROM messages WHERE seq < (
+                        SELECT base_seq FROM sessions WHERE sessions.instance_id = messages.instance_id
+                    ) OR instance_id NOT IN (SELECT instance_id FROM sessions)
+                    """
+                ).rowcount
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if deleted:
+            logger.info(f"会话日志压缩完成，删除 {deleted} 条失效消息")
+        return deleted
+
+    def _compact_loop(self):
+        while not self._stop.wait(self.compact_interval):
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error(f"会话日志压缩失败: {e}", exc_info=True)
+
+    def close(self):
+        """停止压缩线程，checkpoint 后关闭连接"""
+        self._stop.set()
+        if self._compactor is not None:
+            self._compactor.join()
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.close()
+        logger.info("会话日志已关闭。")
+
+
+def to_message(role: str, content: str) -> BaseMessage:
+    """日志中的 role/content 还原为消息对象"""
+    return HumanMessage(content=content) if role == "user" else AIMessage(content=content)
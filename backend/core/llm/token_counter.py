@@ -0,0 +1,96 @@
+import os
+import threading
+from typing import Callable, Dict
+
+from backend.config.settings import settings
+from backend.utils.logger import logger
+
+# 每条消息的角色、分隔符等固定开销（按 OpenAI chat 格式估算）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数（1个中文字符≈1.5个token），没有可用分词器时使用"""
+    return int(len(text) * 1.5)
+
+
+class TiktokenCounter:
+    """tiktoken 编码计数（OpenAI 系列模型）"""
+
+    def __init__(self, encoding_name: str):
+        import tiktoken
+        self.encoding = tiktoken.get_encoding(encoding_name)
+
+    def __call__(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+
+class LocalTokenizerCounter:
+    """本地词表计数，读取模型发布的 tokenizer.json（tokenizers 库）"""
+
+    def __init__(self, tokenizer_path: str):
+        from tokenizers import Tokenizer
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+
+    def __call__(self, text: str) -> int:
+        return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+_counters: Dict[str, Callable[[str], int]] = {}
+# 模型名 -> 实际使用的分词器配置
+_model_specs: Dict[str, str] = {}
+_lock = threading.Lock()
+
+
+def _create_counter(spec: str) -> Callable[[str], int]:
+    """
+    按分词器配置创建计数函数
+
+    spec 格式：
+        "tiktoken:<编码名>"，如 "tiktoken:o200k_base"；
+        "local:<目录名>"，读取 settings.LLM_TOKENIZER_DIR/<目录名>/tokenizer.json；
+        "estimate"，按字符数估算。
+    """
+    kind, _, name = spec.partition(":")
+    if kind == "tiktoken":
+        return TiktokenCounter(name)
+    if kind == "local":
+        return LocalTokenizerCounter(os.path.join(settings.LLM_TOKENIZER_DIR, name, "tokenizer.json"))
+    if kind == "estimate":
+        return estimate_tokens
+    raise ValueError(f"不支持的分词器配置: {spec}")
+
+
+def _resolve_spec(model_name: str) -> str:
+    """settings.LLM_TOKENIZER_DIR 下有 <模型名>/tokenizer.json 时使用本地词表，否则使用模型配置的 tokenizer"""
+    spec = _model_specs.get(model_name)
+    if spec is None:
+        if os.path.isfile(os.path.join(settings.LLM_TOKENIZER_DIR, model_name, "tokenizer.json")):
+            spec = f"local:{model_name}"
+        else:
+            spec = settings.AVAILABLE_LLMS.get(model_name, {}).get("tokenizer", "estimate")
+        _model_specs[model_name] = spec
+    return spec
+
+
+def get_token_counter(model_name: str) -> Callable[[str], int]:
+    """
+    获取模型的 token 计数函数（进程内按分词器配置复用）
+
+    优先使用 settings.LLM_TOKENIZER_DIR/<模型名>/tokenizer.json，其次是 settings.AVAILABLE_LLMS 中
+    模型的 tokenizer 字段；未配置或加载失败（缺少依赖、词表文件不存在）时退回字符数估算。
+    """
+    spec = _resolve_spec(model_name)
+    counter = _counters.get(spec)
+    if counter is not None:
+        return counter
+
+    with _lock:
+        if spec not in _counters:
+            try:
+                _counters[spec] = _create_counter(spec)
+                logger.info(f"已加载分词器 {spec}（模型 {model_name}）")
+            except Exception as e:
+                logger.warning(f"分词器 {spec} 加载失败，按字符数估算 token: {e}")
+                _counters[spec] = estimate_tokens
+        return _counters[spec]
@@ -0,0 +1,281 @@
+"""
+RAG 检索基准测试
+
+生成规模递增的合成语料（默认 1k → 1M 分块），用带种子的伪嵌入模型写入各个 RAGEngine 向量后端，
+统计建索引耗时、查询 p50/p99 延迟、相对精确检索的 recall@k 以及进程 RSS，结果保存为 JSON。
+每个配置在独立子进程中运行，RSS 互不干扰。
+
+用法（在项目根目录执行）：
+    python -m backend.test.mytest_rag_benchmark
+    python -m backend.test.mytest_rag_benchmark --sizes 1000,10000 --configs numpy:float32,numpy:int8
+    python -m backend.test.mytest_rag_benchmark --baseline backend/test/logs/rag_benchmark_xxx.json
+
+指定 --baseline 时与历史结果对比，recall 下降或 p99 变慢超过阈值时以非零状态码退出。
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+DEFAULT_CONFIGS = ["numpy:float32", "numpy:float16", "numpy:int8", "qdrant:float32"]
+# 本地 Qdrant 为 Python 实现，规模过大时耗时过长
+DEFAULT_QDRANT_MAX_SIZE = 100_000
+
+
+class SeededFakeEmbeddings(Embeddings):
+    """
+    带种子的伪嵌入模型
+
+    "doc:{i}" 映射为第 i 个语料向量：围绕 n_clusters 个簇中心加噪声生成，按 4096 条一块确定性生成；
+    "query:{j}" 映射为某个语料向量加扰动，保证查询有真实的近邻；其他文本按哈希生成随机向量。
+    """
+
+    BLOCK = 4096
+
+    def __init__(self, dim: int, seed: int = 0, n_clusters: int = 64, noise: float = 0.35, query_noise: float = 0.25):
+        self.dim = dim
+        self.seed = seed
+        self.noise = noise
+        self.query_noise = query_noise
+        self.centers = np.random.default_rng(seed).standard_normal((n_clusters, dim)).astype(np.float32)
+        self._block_cache: Dict[int, np.ndarray] = {}
+
+    def _block(self, block: int) -> np.ndarray:
+        if block not in self._block_cache:
+            if len(self._block_cache) > 4:
+                self._block_cache.clear()
+            rng = np.random.default_rng([self.seed, block])
+            ids = np.arange(block * self.BLOCK, (block + 1) * self.BLOCK)
+            vectors = self.centers[ids % len(self.centers)] + self.noise * rng.standard_normal((self.BLOCK, self.dim)).astype(np.float32)
+            self._block_cache[block] = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        return self._block_cache[block]
+
+    def doc_vectors(self, start: int, end: int) -> np.ndarray:
+        """第 [start, end) 个语料向量"""
+        blocks = [self._block(b) for b in range(start // self.BLOCK, (end - 1) // self.BLOCK + 1)]
+        offset = start % self.BLOCK
+        return np.concatenate(blocks)[offset:offset + end - start]
+
+    def query_vector(self, query_index: int, n_docs: int) -> np.ndarray:
+        rng = np.random.default_rng([self.seed, 1_000_003, query_index])
+        target = int(rng.integers(n_docs))
+        perturbation = rng.standard_normal(self.dim).astype(np.float32)
+        vector = self.doc_vectors(target, target + 1)[0] + self.query_noise * perturbation / np.linalg.norm(perturbation)
+        return vector / np.linalg.norm(vector)
+
+    def _embed(self, text: str) -> List[float]:
+        kind, _, value = text.partition(":")
+        if kind == "doc":
+            i = int(value)
+            return self.doc_vectors(i, i + 1)[0].tolist()
+        if kind == "query":
+            index, _, n_docs = value.partition("/")
+            return self.query_vector(int(index), int(n_docs)).tolist()
+        rng = np.random.default_rng([self.seed, zlib.crc32(text.encode("utf-8"))])
+        vector = rng.standard_normal(self.dim).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def current_rss_mb() -> float:
+    """当前进程常驻内存（MB），非 Linux 平台退回峰值 RSS"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def exact_top_k(embedder: SeededFakeEmbeddings, n_docs: int, queries: np.ndarray, k: int) -> np.ndarray:
+    """float32 分块暴力计算精确的 top-k（语料下标）"""
+    best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    best_ids = np.zeros((len(queries), 0), dtype=np.int64)
+    for start in range(0, n_docs, 65536):
+        end = min(start + 65536, n_docs)
+        scores = queries @ embedder.doc_vectors(start, end).T
+        best_scores = np.concatenate([best_scores, scores], axis=1)
+        best_ids = np.concatenate([best_ids, np.broadcast_to(np.arange(start, end), scores.shape)], axis=1)
+        keep = np.argsort(-best_scores, axis=1)[:, :k]
+        best_scores = np.take_along_axis(best_scores, keep, axis=1)
+        best_ids = np.take_along_axis(best_ids, keep, axis=1)
+    return best_ids
+
+
+def run_config(size: int, backend: str, dtype: str, dim: int, n_queries: int, top_k: int, seed: int,
+               batch_size: int) -> Dict[str, Any]:
+    """在子进程中运行单个配置"""
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    if project_root not in sys.path:
+        sys.path.insert(0, project_root)
+    from backend.core.RAG.rag_engine import RAGEngine
+    from backend.core.RAG.ingestion_manifest import chunk_id
+
+    work_dir = tempfile.mkdtemp(prefix="rag_benchmark_")
+    doc_dir = os.path.join(work_dir, "documents")
+    os.makedirs(doc_dir)
+    embedder = SeededFakeEmbeddings(dim, seed)
+    rss_before = current_rss_mb()
+    try:
+        engine = RAGEngine(
+            doc_dir=doc_dir,
+            collection_name="benchmark",
+            index_dir=os.path.join(work_dir, "index"),
+            use_embedding_cache=False,
+            vector_backend=backend,
+            vector_dtype=dtype,
+            vector_rescore=True,
+            retrieval_mode="dense",
+            embedding_model=embedder
+        )
+
+        # 建索引：按批生成向量并写入向量存储（与入库流水线的 upsert 阶段一致）
+        build_started = time.perf_counter()
+        for start in range(0, size, batch_size):
+            end = min(start + batch_size, size)
+            ids = [chunk_id("benchmark", str(i), 0) for i in range(start, end)]
+            texts = [f"doc:{i}" for i in range(start, end)]
+            engine.vectorstore.add(ids, embedder.doc_vectors(start, end), texts, [{"doc": i} for i in range(start, end)])
+        engine.vectorstore.persist()
+        build_seconds = time.perf_counter() - build_started
+        rss_after_build = current_rss_mb()
+
+        # 查询：每条查询都不同，不会命中结果缓存
+        query_texts = [f"query:{j}/{size}" for j in range(n_queries)]
+        engine.search(f"query:{n_queries}/{size}", top_k)  # 预热（不计入统计的额外查询）
+        latencies, retrieved = [], []
+        for text in query_texts:
+            started = time.perf_counter()
+            hits = engine.search(text, top_k)
+            latencies.append((time.perf_counter() - started) * 1000)
+            retrieved.append([hit.metadata["doc"] for hit in hits])
+
+        queries = np.stack([embedder.query_vector(j, size) for j in range(n_queries)])
+        exact = exact_top_k(embedder, size, queries, top_k)
+        recall = float(np.mean([len(set(r) & set(e.tolist())) / top_k for r, e in zip(retrieved, exact)]))
+        engine.close()
+
+        return {
+            "size": size,
+            "backend": backend,
+            "dtype": dtype,
+            "dim": dim,
+            "top_k": top_k,
+            "queries": n_queries,
+            "build_seconds": round(build_seconds, 3),
+            "build_chunks_per_second": round(size / build_seconds, 1) if build_seconds else None,
+            "query_p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "query_p99_ms": round(float(np.percentile(latencies, 99)), 3),
+            f"recall_at_{top_k}": round(recall, 4),
+            "rss_mb": round(current_rss_mb(), 1),
+            "index_rss_mb": round(rss_after_build - rss_before, 1)
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def compare_with_baseline(results: List[Dict[str, Any]], baseline_path: str,
+                          recall_tolerance: float, latency_tolerance: float) -> List[str]:
+    """与历史结果对比，返回退化项说明"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {(r["size"], r["backend"], r["dtype"], r["dim"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        old = previous.get((result["size"], result["backend"], result["dtype"], result["dim"]))
+        if not old or "error" in result or "error" in old:
+            continue
+        name = f"{result['backend']}:{result['dtype']} size={result['size']}"
+        recall_key = f"recall_at_{result['top_k']}"
+        if recall_key in old and result[recall_key] < old[recall_key] - recall_tolerance:
+            regressions.append(f"{name} recall {old[recall_key]} -> {result[recall_key]}")
+        if result["query_p99_ms"] > old["query_p99_ms"] * (1 + latency_tolerance):
+            regressions.append(f"{name} p99 {old['query_p99_ms']}ms -> {result['query_p99_ms']}ms")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="RAG 检索基准测试")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="语料规模（分块数），逗号分隔")
+    parser.add_argument("--configs", default=",".join(DEFAULT_CONFIGS), help="后端:精度，逗号分隔")
+    parser.add_argument("--dim", type=int, default=768, help="向量维度")
+    parser.add_argument("--queries", type=int, default=200, help="每个配置的查询数")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=4096, help="建索引时每批写入的分块数")
+    parser.add_argument("--qdrant-max-size", type=int, default=DEFAULT_QDRANT_MAX_SIZE, help="Qdrant 后端的最大测试规模")
+    parser.add_argument("--output", default=None, help="结果 JSON 路径，默认 backend/test/logs/rag_benchmark_<时间>.json")
+    parser.add_argument("--baseline", default=None, help="对比的历史结果 JSON")
+    parser.add_argument("--recall-tolerance", type=float, default=0.01)
+    parser.add_argument("--latency-tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    configs = [config.split(":") for config in args.configs.split(",") if config]
+    results = []
+    for size in sizes:
+        for backend, dtype in configs:
+            if backend == "qdrant" and size > args.qdrant_max_size:
+                print(f"跳过 {backend}:{dtype} size={size}（超过 --qdrant-max-size）")
+                continue
+            print(f"运行 {backend}:{dtype} size={size} dim={args.dim} ...", flush=True)
+            # spawn 子进程，每个配置的 RSS 独立统计
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                future = executor.submit(run_config, size, backend, dtype, args.dim, args.queries,
+                                         args.top_k, args.seed, args.batch_size)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"size": size, "backend": backend, "dtype": dtype, "dim": args.dim, "error": str(e)}
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+            results.append(result)
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "logs", f"rag_benchmark_{datetime.now():%Y%m%d_%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args)
+        },
+        "results": results
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到 {output}")
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.recall_tolerance, args.latency_tolerance)
+        for regression in regressions:
+            print(f"性能退化: {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
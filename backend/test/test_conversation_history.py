@@ -0,0 +1,92 @@
+# 对话历史：TurnSequence 结构共享、分叉互不影响、恢复与从最老消息开始淘汰
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from backend.core.llm.llm_conversation_history import LLMConversationHistory, TurnSequence
+from backend.core.llm.token_counter import MESSAGE_OVERHEAD_TOKENS
+
+
+def _contents(history: LLMConversationHistory):
+    return [msg.content for msg in history.get_messages()]
+
+
+def test_turn_sequence_append_and_popleft_across_chunks():
+    size = TurnSequence.CHUNK_SIZE
+    seq = TurnSequence.from_iterable(range(size + 5))
+    longer = seq.append("x")
+
+    # 追加返回新序列，原序列不变
+    assert len(seq) == size + 5 and list(seq) == list(range(size + 5))
+    assert list(longer)[-1] == "x" and len(longer) == size + 6
+
+    rest = longer
+    for expected in range(size + 1):
+        item, rest = rest.popleft()
+        assert item == expected
+    # 第一个块整块淘汰后从下一个块继续
+    assert list(rest) == list(range(size + 1, size + 5)) + ["x"]
+    assert rest.last(2) == [size + 4, "x"]
+    assert list(seq)[0] == 0
+
+
+def test_fork_and_source_do_not_alias_mutations():
+    source = LLMConversationHistory("s", max_messages=100, max_tokens=100000)
+    source.update_system_message("system")
+    source.add_user_message("q1")
+    source.add_ai_message("a1")
+
+    forked = source.fork("s-fork")
+    forked.add_user_message("fork only")
+    source.add_user_message("source only")
+    forked.update_system_message("forked system")
+
+    assert _contents(source) == ["system", "q1", "a1", "source only"]
+    assert _contents(forked) == ["forked system", "q1", "a1", "fork only"]
+
+    forked.clear_history()
+    assert _contents(source) == ["system", "q1", "a1", "source only"]
+
+
+def test_adopt_recounts_with_its_own_tokenizer_without_aliasing():
+    source = LLMConversationHistory("s", max_messages=100, max_tokens=100000)
+    source.add_user_message("一二三四")
+    source.add_ai_message("五六")
+
+    target = LLMConversationHistory("t", max_messages=100, max_tokens=100000, count_tokens=len)
+    target.adopt(source)
+    assert _contents(target) == ["一二三四", "五六"]
+    # 按 target 的分词器（字符数）计数，每条消息另加固定开销
+    assert target.total_tokens == 4 + 2 + 2 * MESSAGE_OVERHEAD_TOKENS
+
+    target.add_user_message("only in target")
+    assert _contents(source) == ["一二三四", "五六"]
+    assert target.turns_since(target.next_seq - 1)[0][1].content == "only in target"
+
+
+def test_eviction_drops_oldest_messages_and_keeps_sequence_numbers():
+    history = LLMConversationHistory("s", max_messages=3, max_tokens=100000)
+    for i in range(5):
+        history.add_user_message(f"q{i}")
+
+    assert _contents(history) == ["q2", "q3", "q4"]
+    assert history.first_seq == 2 and history.next_seq == 5
+    assert [seq for seq, _ in history.turns_since(0)] == [2, 3, 4]
+
+
+def test_restore_keeps_persisted_sequence_numbers():
+    history = LLMConversationHistory("s", max_messages=100, max_tokens=100000)
+    history.restore([HumanMessage(content="q7"), AIMessage(content="a7")], next_seq=9)
+
+    assert history.first_seq == 7 and history.persisted_seq == 9
+    assert history.turns_since(history.persisted_seq) == []
+    history.add_user_message("q9")
+    assert [(seq, msg.content) for seq, msg in history.turns_since(history.persisted_seq)] == [(9, "q9")]
+
+
+if __name__ == "__main__":
+    test_turn_sequence_append_and_popleft_across_chunks()
+    test_fork_and_source_do_not_alias_mutations()
+    test_adopt_recounts_with_its_own_tokenizer_without_aliasing()
+    test_eviction_drops_oldest_messages_and_keeps_sequence_numbers()
+    test_restore_keeps_persisted_sequence_numbers()
+    print("对话历史测试通过")
@@ -0,0 +1,92 @@
+# BM25 词法检索与 RRF 融合：分词、增删与持久化、融合排序
+
+import os
+import tempfile
+
+from backend.core.RAG.embedding_backends import HashingEmbeddings
+from backend.core.RAG.lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+from backend.core.RAG.rag_engine import RAGEngine
+
+CHUNKS = {
+    "tiantan": "天坛位于北京市东城区，是明清两代皇帝祭天的场所。",
+    "nanzhan": "北京南站位于丰台区，乘坐地铁4号线可直达。",
+    "gugong": "故宫是明清两代的皇家宫殿，周一闭馆。",
+}
+
+
+def test_tokenize_uses_bigrams_and_lowercase_words():
+    assert tokenize("北京南站") == ["北京", "京南", "南站"]
+    # 单个汉字的片段保留单字，字母数字按词切分并转小写
+    assert tokenize("坐 Line4 到站") == ["坐", "line4", "到站"]
+    assert tokenize("南站", unigrams=True) == ["南", "站", "南站"]
+
+
+def test_bm25_ranks_exact_terms_and_survives_reload():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "lexical", "test.json")
+        os.makedirs(os.path.dirname(path))
+        index = BM25Index(path)
+        index.add(list(CHUNKS), list(CHUNKS.values()))
+
+        results = index.search("北京南站怎么走", top_k=3)
+        assert results[0][0] == "nanzhan"
+        assert index.search("紫禁城", top_k=3) == []
+
+        index.delete(["nanzhan"])
+        assert len(index) == 2
+        assert all(id_ != "nanzhan" for id_, _ in index.search("北京南站", top_k=3))
+
+        index.persist()
+        reloaded = BM25Index(path)
+        assert len(reloaded) == 2
+        assert reloaded.search("明清两代", top_k=3) == index.search("明清两代", top_k=3)
+
+
+def test_reciprocal_rank_fusion_prefers_items_in_both_rankings():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d", "a"]])
+    ids = [id_ for id_, _ in fused]
+    # a 与 c 同时出现在两路结果中，排在只出现一次的 b、d 之前
+    assert ids[:2] == ["a", "c"]
+    assert set(ids[2:]) == {"b", "d"}
+    assert fused[0][1] == 1 / 61 + 1 / 63
+
+
+def test_hybrid_engine_search_fuses_dense_and_lexical_hits():
+    with tempfile.TemporaryDirectory() as tmp:
+        doc_dir = os.path.join(tmp, "docs")
+        os.makedirs(doc_dir)
+        for name, text in CHUNKS.items():
+            with open(os.path.join(doc_dir, f"{name}.txt"), "w", encoding="utf-8") as f:
+                f.write(text)
+
+        engine = RAGEngine(
+            doc_dir=doc_dir,
+            collection_name="hybrid_test",
+            index_dir=os.path.join(tmp, "index"),
+            chunk_size=200,
+            chunk_overlap=0,
+            embedding_model=HashingEmbeddings(dim=64),
+            embedding_backend="hashing",
+            vector_backend="numpy",
+            retrieval_mode="hybrid"
+        )
+        try:
+            assert len(engine.lexical_index) == engine.vectorstore.count() == 3
+            for mode in ("lexical", "hybrid"):
+                hits = engine.search("北京南站怎么走", top_k=3, mode=mode)
+                assert hits[0].metadata["source"] == "nanzhan.txt"
+            # 融合结果不重复，且覆盖词法召回的分块
+            hybrid = engine.search("明清两代", top_k=3)
+            assert len({hit.id for hit in hybrid}) == len(hybrid)
+            lexical_ids = {hit.id for hit in engine.search("明清两代", top_k=3, mode="lexical")}
+            assert lexical_ids <= {hit.id for hit in hybrid}
+        finally:
+            engine.close()
+
+
+if __name__ == "__main__":
+    test_tokenize_uses_bigrams_and_lowercase_words()
+    test_bm25_ranks_exact_terms_and_survives_reload()
+    test_reciprocal_rank_fusion_prefers_items_in_both_rankings()
+    test_hybrid_engine_search_fuses_dense_and_lexical_hits()
+    print("词法检索测试通过")
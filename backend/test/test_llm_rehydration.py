@@ -0,0 +1,119 @@
+# LLM 实例按需恢复：会话日志叠加写回队列中尚未写入的记录，不等待刷盘
+
+import os
+import tempfile
+
+from backend.config.settings import settings
+from backend.core.llm.llm_manager import LLMManager
+
+
+def _open_manager(tmp: str):
+    """使用临时会话日志；刷盘间隔足够长，测试中只由显式 flush 写入"""
+    LLMManager.shutdown()
+    settings.CHAT_JOURNAL_PATH = os.path.join(tmp, "sessions.db")
+    settings.CHAT_PERSIST_FLUSH_INTERVAL = 3600
+    settings.CHAT_PERSIST_MAX_PENDING = 10000
+    LLMManager.initialize()
+    return LLMManager.get_persist_queue()
+
+
+def _close_manager(original_settings):
+    LLMManager.shutdown()
+    for key in list(LLMManager._llm_user_instances.keys()):
+        LLMManager._llm_user_instances.pop(key)
+    LLMManager._session_instances.clear()
+    LLMManager._active_instances.clear()
+    for name, value in original_settings.items():
+        setattr(settings, name, value)
+
+
+def _saved_settings():
+    return {name: getattr(settings, name)
+            for name in ("CHAT_JOURNAL_PATH", "CHAT_PERSIST_FLUSH_INTERVAL", "CHAT_PERSIST_MAX_PENDING")}
+
+
+def _chat_turn(instance, question: str):
+    """模拟一轮对话后的持久化（不调用模型）"""
+    instance.conversation.add_user_message(question)
+    instance.conversation.add_ai_message(f"答：{question}")
+    LLMManager.persist_instance(instance)
+
+
+def _evict(instance_id: str):
+    """模拟会话缓存淘汰：写出记录并移出内存"""
+    instance = LLMManager._llm_user_instances.pop(instance_id)
+    LLMManager._on_evict(instance)
+
+
+def test_state_overlays_pending_records_on_the_journal():
+    original = _saved_settings()
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = _open_manager(tmp)
+        try:
+            instance = LLMManager.create_instance("s1_deepseek-chat", "deepseek-chat", rag_collections=["beijing"])
+            _chat_turn(instance, "天坛在哪里")
+            queue.flush()
+            _chat_turn(instance, "怎么去")
+
+            # 第二轮只在队列中，日志里只有第一轮
+            assert len(LLMManager.get_journal().load_messages("s1_deepseek-chat")) == 2
+            meta, rows = LLMManager._load_instance_state("s1_deepseek-chat")
+            assert [content for _, _, content in rows] == ["天坛在哪里", "答：天坛在哪里", "怎么去", "答：怎么去"]
+            assert [seq for seq, _, _ in rows] == [0, 1, 2, 3]
+            assert meta["next_seq"] == 4 and meta["rag_collections"] == ["beijing"]
+        finally:
+            _close_manager(original)
+
+
+def test_evicted_instance_is_rehydrated_without_flushing():
+    original = _saved_settings()
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = _open_manager(tmp)
+        try:
+            instance = LLMManager.create_instance("s1_deepseek-chat", "deepseek-chat")
+            _chat_turn(instance, "q0")
+            _evict("s1_deepseek-chat")
+            flushes = queue.get_stats()["flushes"]
+
+            restored = LLMManager.get_instance("s1_deepseek-chat")
+            assert restored is not instance
+            assert [msg.content for msg in restored.get_conversation_history()] == ["q0", "答：q0"]
+            assert queue.get_stats()["flushes"] == flushes
+            assert LLMManager.get_session_instances("s1").keys() == {"s1_deepseek-chat"}
+
+            # 恢复后继续对话，序号接着原有消息编号
+            _chat_turn(restored, "q1")
+            queue.flush()
+            rows = LLMManager.get_journal().load_messages("s1_deepseek-chat")
+            assert [(seq, content) for seq, _, content in rows][-2:] == [(2, "q1"), (3, "答：q1")]
+        finally:
+            _close_manager(original)
+
+
+def test_pending_delete_and_recreate_are_visible_before_flush():
+    original = _saved_settings()
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = _open_manager(tmp)
+        try:
+            instance = LLMManager.create_instance("s1_deepseek-chat", "deepseek-chat")
+            _chat_turn(instance, "old")
+            queue.flush()
+
+            assert LLMManager.delete_instance("s1_deepseek-chat")
+            assert LLMManager._load_instance_state("s1_deepseek-chat") is None
+            assert LLMManager.get_instance("s1_deepseek-chat") is None
+
+            recreated = LLMManager.create_instance("s1_deepseek-chat", "deepseek-chat")
+            _chat_turn(recreated, "new")
+            _evict("s1_deepseek-chat")
+            restored = LLMManager.get_instance("s1_deepseek-chat")
+            assert [msg.content for msg in restored.get_conversation_history()] == ["new", "答：new"]
+        finally:
+            _close_manager(original)
+
+
+if __name__ == "__main__":
+    test_state_overlays_pending_records_on_the_journal()
+    test_evicted_instance_is_rehydrated_without_flushing()
+    test_pending_delete_and_recreate_are_visible_before_flush()
+    print("实例恢复测试通过")
@@ -0,0 +1,133 @@
+# 会话写回队列：合并、失败批次放回重试、删除顺序与 Agent 记忆快照
+
+import os
+import tempfile
+
+from backend.core.llm.llm_manager import LLMInstance
+from backend.core.llm.persistence_queue import WriteBehindQueue
+from backend.core.llm.session_journal import AgentMemoryRecord, SessionJournal, SessionRecord
+
+
+def _record(instance: LLMInstance) -> SessionRecord:
+    record = SessionRecord.from_instance(instance)
+    instance.conversation.persisted_seq = record.next_seq
+    return record
+
+
+def _contents(journal: SessionJournal, instance_id: str):
+    return [content for _, _, content in journal.load_messages(instance_id)]
+
+
+def _open(tmp: str):
+    journal = SessionJournal(os.path.join(tmp, "sessions.db"), compact_interval=0)
+    # 刷盘间隔足够长，测试中只由显式 flush 写入
+    return journal, WriteBehindQueue(journal, flush_interval=3600)
+
+
+def test_updates_are_coalesced_into_one_record():
+    with tempfile.TemporaryDirectory() as tmp:
+        journal, queue = _open(tmp)
+        try:
+            instance = LLMInstance("s1_deepseek-chat", "deepseek-chat")
+            for i in range(3):
+                instance.conversation.add_user_message(f"q{i}")
+                queue.enqueue(_record(instance))
+
+            assert queue.is_pending("s1_deepseek-chat")
+            assert journal.load_session("s1_deepseek-chat") is None
+            assert queue.flush() == 1
+            assert _contents(journal, "s1_deepseek-chat") == ["q0", "q1", "q2"]
+            assert queue.get_stats()["coalesced"] == 2
+        finally:
+            queue.close()
+            journal.close()
+
+
+def test_failed_batch_is_requeued_before_newer_writes():
+    with tempfile.TemporaryDirectory() as tmp:
+        journal, queue = _open(tmp)
+        try:
+            instance = LLMInstance("s1_deepseek-chat", "deepseek-chat")
+            instance.conversation.add_user_message("q0")
+            queue.enqueue(_record(instance))
+
+            append = journal.append
+
+            def failing_append(records):
+                # 刷盘期间又有新的写入进入队列
+                instance.conversation.add_user_message("q1")
+                queue.enqueue(_record(instance))
+                raise RuntimeError("disk full")
+
+            journal.append = failing_append
+            assert queue.flush() == 0
+            assert queue.get_stats()["failed_flushes"] == 1
+            # 失败的批次放回队列，与刷盘期间的新写入合并，不丢消息
+            pending = dict(queue.pending_items())["s1_deepseek-chat"]
+            assert [content for _, _, content in pending.new_messages] == ["q0", "q1"]
+
+            journal.append = append
+            assert queue.flush() == 1
+            assert _contents(journal, "s1_deepseek-chat") == ["q0", "q1"]
+            assert not queue.is_pending("s1_deepseek-chat")
+        finally:
+            queue.close()
+            journal.close()
+
+
+def test_delete_then_recreate_keeps_order():
+    with tempfile.TemporaryDirectory() as tmp:
+        journal, queue = _open(tmp)
+        try:
+            old = LLMInstance("s1_deepseek-chat", "deepseek-chat")
+            old.conversation.add_user_message("old")
+            queue.enqueue(_record(old))
+            queue.flush()
+
+            queue.enqueue_delete("s1_deepseek-chat")
+            recreated = LLMInstance("s1_deepseek-chat", "deepseek-chat")
+            recreated.conversation.add_user_message("new")
+            queue.enqueue(_record(recreated))
+            queue.flush()
+
+            assert _contents(journal, "s1_deepseek-chat") == ["new"]
+        finally:
+            queue.close()
+            journal.close()
+
+
+def test_agent_memory_snapshots_are_requeued_and_deleted():
+    with tempfile.TemporaryDirectory() as tmp:
+        journal, queue = _open(tmp)
+        try:
+            queue.enqueue_agent_memory(AgentMemoryRecord("s1-map", "s1", "map", 5, [("user", "旧")]))
+            queue.enqueue_agent_memory(AgentMemoryRecord("s1-map", "s1", "map", 5, [("user", "新")]))
+            assert queue.pending_agent_memory("s1-map").messages == [("user", "新")]
+
+            def failing_save(records):
+                raise RuntimeError("disk full")
+
+            save = journal.save_agent_memories
+            journal.save_agent_memories = failing_save
+            assert queue.flush() == 0
+            assert queue.pending_agent_memory("s1-map") is not None
+            journal.save_agent_memories = save
+            assert queue.flush() == 1
+            assert journal.load_agent_memory("s1-map") == (5, [("user", "新")])
+
+            # 删除时丢弃尚未写入的快照，之后的刷盘不会把记忆写回
+            queue.enqueue_agent_memory(AgentMemoryRecord("s1-map", "s1", "map", 5, [("user", "更新")]))
+            assert queue.delete_agent_memories("s1", "map") == 1
+            queue.flush()
+            assert journal.load_agent_memory("s1-map") is None
+        finally:
+            queue.close()
+            journal.close()
+
+
+if __name__ == "__main__":
+    test_updates_are_coalesced_into_one_record()
+    test_failed_batch_is_requeued_before_newer_writes()
+    test_delete_then_recreate_keeps_order()
+    test_agent_memory_snapshots_are_requeued_and_deleted()
+    print("写回队列测试通过")
@@ -0,0 +1,149 @@
+# 向量量化存储：float16/int8 检索结果与 float32 精确检索一致，删除与重新加载后保持一致
+
+import os
+import tempfile
+import uuid
+
+import numpy as np
+
+from backend.core.RAG.rag_engine import RAGEngine
+from backend.core.RAG.vector_store import NumpyVectorStore, QdrantVectorStore
+from backend.test.test_rag_ingestion import CountingEmbeddings, _paragraphs, _write
+
+DIM = 64
+SIZE = 300
+# Qdrant 要求点 ID 为 UUID
+IDS = [str(uuid.uuid5(uuid.NAMESPACE_OID, f"chunk-{i}")) for i in range(SIZE)]
+QUANTIZED = [(dtype, rescore) for dtype in ("float16", "int8") for rescore in (True, False)]
+
+
+def _corpus():
+    rng = np.random.default_rng(7)
+    vectors = rng.standard_normal((SIZE, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    # 查询为语料向量加少量噪声，精确检索的第一名即对应的语料
+    queries = vectors[:20] + 0.05 * rng.standard_normal((20, DIM)).astype(np.float32)
+    texts = [f"文本{i}" for i in range(SIZE)]
+    metadatas = [{"source": f"{i % 7}.txt"} for i in range(SIZE)]
+    return IDS, vectors, texts, metadatas, queries.tolist()
+
+
+def _fill(store, deleted=()):
+    ids, vectors, texts, metadatas, _ = _corpus()
+    store.reset(DIM)
+    store.add(ids, vectors.tolist(), texts, metadatas)
+    store.delete(list(deleted))
+    store.persist()
+
+
+def _top_ids(store, queries, top_k=5):
+    return [[hit.id for hit in hits] for hits in store.search_batch(queries, top_k)]
+
+
+def _assert_matches_exact(results, expected):
+    for got, want in zip(results, expected):
+        assert got[0] == want[0]
+        assert len(set(got) & set(want)) >= 4
+
+
+def test_numpy_store_quantized_search_and_reload():
+    queries = _corpus()[4]
+    deleted = [IDS[3], IDS[150]]
+    with tempfile.TemporaryDirectory() as tmp:
+        exact = NumpyVectorStore("exact", tmp)
+        _fill(exact, deleted)
+        expected = _top_ids(exact, queries)
+        exact.close()
+
+        for dtype, rescore in QUANTIZED:
+            name = f"{dtype}_{rescore}"
+            store = NumpyVectorStore(name, tmp, dtype=dtype, rescore=rescore)
+            _fill(store, deleted)
+            assert store.count() == SIZE - len(deleted)
+            results = _top_ids(store, queries)
+            _assert_matches_exact(results, expected)
+            assert all(IDS[3] not in ids for ids in results)
+            store.close()
+
+            reloaded = NumpyVectorStore(name, tmp, dtype=dtype, rescore=rescore)
+            assert reloaded.count() == SIZE - len(deleted)
+            assert _top_ids(reloaded, queries) == results
+            hit = reloaded.get([IDS[10]])[0]
+            assert hit.text == "文本10" and hit.metadata == {"source": "3.txt"}
+            reloaded.close()
+
+
+def test_qdrant_store_quantized_search_and_reload():
+    queries = _corpus()[4]
+    with tempfile.TemporaryDirectory() as tmp:
+        exact = QdrantVectorStore("exact", path=os.path.join(tmp, "exact"))
+        _fill(exact, [IDS[3]])
+        expected = _top_ids(exact, queries)
+        exact.close()
+
+        for dtype, rescore in QUANTIZED:
+            path = os.path.join(tmp, f"{dtype}_{rescore}")
+            store = QdrantVectorStore("quantized", path=path, dtype=dtype, rescore=rescore)
+            _fill(store, [IDS[3]])
+            results = _top_ids(store, queries)
+            _assert_matches_exact(results, expected)
+            store.close()
+
+            reloaded = QdrantVectorStore("quantized", path=path, dtype=dtype, rescore=rescore)
+            assert reloaded.count() == SIZE - 1
+            _assert_matches_exact(_top_ids(reloaded, queries), expected)
+            reloaded.close()
+
+
+def test_engine_reloads_quantized_index_and_rebuilds_on_dtype_change():
+    with tempfile.TemporaryDirectory() as tmp:
+        doc_dir = os.path.join(tmp, "docs")
+        os.makedirs(doc_dir)
+        _write(doc_dir, "tiantan.txt", _paragraphs("天坛", 5))
+        _write(doc_dir, "gugong.txt", _paragraphs("故宫", 5) + "故宫珍宝馆需要另外购票。\n")
+
+        def open_engine(dtype, embeddings):
+            return RAGEngine(
+                doc_dir=doc_dir,
+                collection_name="quantized_test",
+                index_dir=os.path.join(tmp, "index"),
+                chunk_size=60,
+                chunk_overlap=0,
+                embedding_model=embeddings,
+                embedding_backend="hashing",
+                vector_backend="numpy",
+                vector_dtype=dtype,
+                retrieval_mode="dense"
+            )
+
+        engine = open_engine("int8", CountingEmbeddings())
+        try:
+            assert engine.vectorstore.count() == engine.manifest.total_chunks()
+            assert "珍宝馆" in engine.search("故宫珍宝馆需要另外购票", top_k=1)[0].text
+        finally:
+            engine.close()
+
+        # 相同精度重新加载不重新编码
+        embeddings = CountingEmbeddings()
+        engine = open_engine("int8", embeddings)
+        try:
+            assert embeddings.embedded == 0
+            assert "珍宝馆" in engine.search("故宫珍宝馆需要另外购票", top_k=1)[0].text
+        finally:
+            engine.close()
+
+        # 精度配置变化时重建索引
+        embeddings = CountingEmbeddings()
+        engine = open_engine("float16", embeddings)
+        try:
+            assert embeddings.embedded == engine.manifest.total_chunks() == engine.vectorstore.count()
+            assert "珍宝馆" in engine.search("故宫珍宝馆需要另外购票", top_k=1)[0].text
+        finally:
+            engine.close()
+
+
+if __name__ == "__main__":
+    test_numpy_store_quantized_search_and_reload()
+    test_qdrant_store_quantized_search_and_reload()
+    test_engine_reloads_quantized_index_and_rebuilds_on_dtype_change()
+    print("量化存储测试通过")
@@ -0,0 +1,155 @@
+# RAG 增量入库：修改、删除、重新加载时向量存储、BM25 索引与入库清单保持一致，未变化的分块不重新编码
+
+import os
+import tempfile
+
+from backend.core.RAG.embedding_backends import HashingEmbeddings
+from backend.core.RAG.rag_engine import RAGEngine
+
+VECTOR_BACKENDS = ("numpy", "qdrant")
+
+
+class CountingEmbeddings(HashingEmbeddings):
+    """记录编码过的分块数"""
+
+    def __init__(self):
+        super().__init__(dim=64)
+        self.embedded = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+def _write(doc_dir: str, name: str, text: str):
+    with open(os.path.join(doc_dir, name), "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def _paragraphs(topic: str, count: int) -> str:
+    return "".join(f"{topic}第{i}段：{topic}的开放时间、门票与交通信息，编号{i}。\n" for i in range(count))
+
+
+def _make_engine(tmp: str, vector_backend: str, embeddings: HashingEmbeddings, **kwargs) -> RAGEngine:
+    return RAGEngine(
+        doc_dir=os.path.join(tmp, "docs"),
+        collection_name="ingest_test",
+        index_dir=os.path.join(tmp, "index"),
+        chunk_size=60,
+        chunk_overlap=0,
+        embedding_model=embeddings,
+        embedding_backend="hashing",
+        vector_backend=vector_backend,
+        retrieval_mode="hybrid",
+        **kwargs
+    )
+
+
+def _assert_consistent(engine: RAGEngine):
+    chunks = engine.manifest.total_chunks()
+    assert chunks > 0
+    assert engine.vectorstore.count() == chunks
+    assert len(engine.lexical_index) == chunks
+
+
+def test_modify_delete_and_reload_without_reembedding():
+    for vector_backend in VECTOR_BACKENDS:
+        with tempfile.TemporaryDirectory() as tmp:
+            doc_dir = os.path.join(tmp, "docs")
+            os.makedirs(doc_dir)
+            _write(doc_dir, "tiantan.txt", _paragraphs("天坛", 10))
+            _write(doc_dir, "gugong.txt", _paragraphs("故宫", 10))
+            _write(doc_dir, "changcheng.txt", _paragraphs("长城", 10))
+
+            embeddings = CountingEmbeddings()
+            engine = _make_engine(tmp, vector_backend, embeddings)
+            try:
+                _assert_consistent(engine)
+                initial = embeddings.embedded
+                assert initial == engine.manifest.total_chunks()
+
+                # 修改：只编码新增的分块，失效分块被删除
+                _write(doc_dir, "tiantan.txt", _paragraphs("天坛", 10) + "天坛新增一段：祈年殿正在修缮。\n")
+                os.remove(os.path.join(doc_dir, "changcheng.txt"))
+                stats = engine.ingest()
+                assert stats["updated_files"] == 1 and stats["removed_files"] == 1
+                assert stats["unchanged_files"] == 1
+                assert 0 < embeddings.embedded - initial < initial / 3
+                _assert_consistent(engine)
+                assert "changcheng.txt" not in engine.manifest.files
+                assert all(hit.metadata["source"] != "changcheng.txt"
+                           for hit in engine.search("长城的开放时间", top_k=5))
+                assert "修缮" in engine.search("祈年殿修缮", top_k=1)[0].text
+                chunks = engine.manifest.total_chunks()
+            finally:
+                engine.close()
+
+            # 重新加载：清单与索引一致，不重新编码任何分块
+            embeddings = CountingEmbeddings()
+            engine = _make_engine(tmp, vector_backend, embeddings)
+            try:
+                assert embeddings.embedded == 0
+                assert engine.manifest.total_chunks() == chunks
+                _assert_consistent(engine)
+                assert "修缮" in engine.search("祈年殿修缮", top_k=1)[0].text
+            finally:
+                engine.close()
+
+
+def test_remove_source_keeps_indexes_consistent():
+    with tempfile.TemporaryDirectory() as tmp:
+        doc_dir = os.path.join(tmp, "docs")
+        os.makedirs(doc_dir)
+        _write(doc_dir, "tiantan.txt", _paragraphs("天坛", 5))
+        _write(doc_dir, "gugong.txt", _paragraphs("故宫", 5))
+
+        engine = _make_engine(tmp, "numpy", CountingEmbeddings())
+        try:
+            removed = engine.remove_source("gugong.txt")
+            assert removed > 0
+            assert not os.path.exists(os.path.join(doc_dir, "gugong.txt"))
+            _assert_consistent(engine)
+            assert engine.remove_source("gugong.txt") == -1
+        finally:
+            engine.close()
+
+
+def test_streamed_and_parallel_files_stay_consistent():
+    """大文件流式入库、小文件并行切分，分批编码后三份索引一致；更新流式文件时失效分块被删除"""
+    for vector_backend in VECTOR_BACKENDS:
+        with tempfile.TemporaryDirectory() as tmp:
+            doc_dir = os.path.join(tmp, "docs")
+            os.makedirs(doc_dir)
+            _write(doc_dir, "big.txt", _paragraphs("颐和园", 40))
+            _write(doc_dir, "small_a.txt", _paragraphs("天坛", 3))
+            _write(doc_dir, "small_b.txt", _paragraphs("故宫", 3))
+
+            embeddings = CountingEmbeddings()
+            engine = _make_engine(tmp, vector_backend, embeddings, ingest_workers=2, embed_batch_size=4,
+                                  auto_ingest=False)
+            try:
+                engine.streaming_threshold = os.path.getsize(os.path.join(doc_dir, "big.txt"))
+                stats = engine.ingest()
+                throughput = stats["throughput"]
+                assert stats["added_files"] == 3
+                assert throughput["files"] == 3 and throughput["streamed_files"] == 1
+                assert throughput["embedded_chunks"] == embeddings.embedded == engine.manifest.total_chunks()
+                _assert_consistent(engine)
+
+                # 文件变小后仍按流式处理：已有分块不重新编码，多出的旧分块被删除
+                _write(doc_dir, "big.txt", _paragraphs("颐和园", 20))
+                engine.streaming_threshold = 1
+                stats = engine.ingest()
+                assert stats["updated_files"] == 1 and stats["unchanged_files"] == 2
+                assert stats["throughput"]["streamed_files"] == 1
+                assert stats["deleted_chunks"] > 0 and stats["throughput"]["embedded_chunks"] == 0
+                _assert_consistent(engine)
+            finally:
+                engine.close()
+
+
+if __name__ == "__main__":
+    test_modify_delete_and_reload_without_reembedding()
+    test_remove_source_keeps_indexes_consistent()
+    test_streamed_and_parallel_files_stay_consistent()
+    print("增量入库测试通过")
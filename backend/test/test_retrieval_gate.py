@@ -0,0 +1,59 @@
+# 检索门控：混合检索下自然语言问句凭 BM25 命中通过门控
+
+import os
+import tempfile
+
+from backend.core.RAG.rag_engine import RAGEngine
+
+DOCUMENT = (
+    "天坛位于北京市东城区，是明清两代皇帝祭天、祈谷的场所，始建于明朝永乐十八年。\n"
+    "故宫又称紫禁城，是明清两代的皇家宫殿，开放时间为每日8:30至17:00，周一闭馆。\n"
+)
+
+
+def _make_engine(tmp: str) -> RAGEngine:
+    doc_dir = os.path.join(tmp, "docs")
+    os.makedirs(doc_dir)
+    with open(os.path.join(doc_dir, "beijing.txt"), "w", encoding="utf-8") as f:
+        f.write(DOCUMENT)
+    engine = RAGEngine(
+        doc_dir=doc_dir,
+        collection_name="gate_test",
+        index_dir=os.path.join(tmp, "index"),
+        embedding_cache_dir=os.path.join(tmp, "embedding_cache"),
+        embedding_backend="hashing",
+        vector_backend="numpy",
+        retrieval_mode="hybrid"
+    )
+    # 簇中心相似度不可能达到的阈值：能通过门控的只有 BM25 命中
+    engine.gate.threshold = 1.01
+    return engine
+
+
+def test_question_about_indexed_content_passes_gate():
+    """问句中的疑问词、虚词不计入命中比例，问到语料内容即通过"""
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = _make_engine(tmp)
+        try:
+            for question in ("天坛在哪里", "请介绍一下天坛的历史", "故宫的开放时间是什么"):
+                assert engine.should_retrieve(question), question
+            assert engine.search("天坛在哪里", top_k=1, gated=True)
+        finally:
+            engine.close()
+
+
+def test_unrelated_question_and_small_talk_are_skipped():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = _make_engine(tmp)
+        try:
+            assert not engine.should_retrieve("今天天气怎么样")
+            assert not engine.should_retrieve("你好")
+            assert engine.search("今天天气怎么样", top_k=1, gated=True) == []
+        finally:
+            engine.close()
+
+
+if __name__ == "__main__":
+    test_question_about_indexed_content_passes_gate()
+    test_unrelated_question_and_small_talk_are_skipped()
+    print("检索门控测试通过")
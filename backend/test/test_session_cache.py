@@ -0,0 +1,71 @@
+# 会话缓存：空闲过期的后台清理与 pin
+
+import time
+
+from backend.core.llm.session_cache import SessionCache
+
+
+def _make_cache(spilled, idle_ttl=0.05, max_entries=100):
+    return SessionCache(
+        max_entries=max_entries,
+        max_bytes=1 << 30,
+        idle_ttl=idle_ttl,
+        size_of=lambda value: 1,
+        on_evict=lambda key, value: spilled.append(key)
+    )
+
+
+def test_sweeper_expires_idle_entries_without_access():
+    """服务空闲（没有任何 get/put）时，后台线程也会写出并移出过期对象"""
+    spilled = []
+    cache = _make_cache(spilled)
+    cache.put("a", object())
+    cache.put("b", object())
+
+    SessionCache.start_sweeper(0.02)
+    try:
+        deadline = time.monotonic() + 2
+        while len(cache) and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        SessionCache.stop_sweeper()
+
+    assert len(cache) == 0
+    assert sorted(spilled) == ["a", "b"]
+    assert cache.get_stats()["evictions"]["ttl"] == 2
+
+
+def test_sweep_skips_pinned_entries_until_unpinned():
+    """pin 住的对象过期也不淘汰，unpin 后才写出"""
+    spilled = []
+    cache = _make_cache(spilled)
+    cache.put("a", object(), pin=True)
+    cache.put("b", object())
+    time.sleep(0.1)
+
+    assert cache.sweep() == 1
+    assert spilled == ["b"] and "a" in cache
+
+    cache.unpin("a")
+    assert spilled == ["b", "a"] and len(cache) == 0
+
+
+def test_pinned_entry_survives_lru_pressure():
+    """执行期间 pin 住的对象不会因条目数超限被淘汰"""
+    spilled = []
+    cache = _make_cache(spilled, idle_ttl=0, max_entries=1)
+    cache.put("a", object(), pin=True)
+    cache.put("b", object())
+
+    assert "a" in cache and "b" in cache
+    assert spilled == []
+
+    cache.unpin("a")
+    assert spilled == ["a"]
+
+
+if __name__ == "__main__":
+    test_sweeper_expires_idle_entries_without_access()
+    test_sweep_skips_pinned_entries_until_unpinned()
+    test_pinned_entry_survives_lru_pressure()
+    print("会话缓存测试通过")
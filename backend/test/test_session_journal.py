@@ -0,0 +1,113 @@
+# 会话日志：增量追加、淘汰后的 base_seq 失效、删除与 Agent 记忆
+
+import os
+import tempfile
+
+from backend.core.llm.llm_manager import LLMInstance
+from backend.core.llm.session_journal import AgentMemoryRecord, SessionJournal, SessionRecord
+
+
+def _persist(journal: SessionJournal, instance: LLMInstance):
+    """与 LLMManager 相同的增量写入：只写上次持久化以来的新消息"""
+    record = SessionRecord.from_instance(instance)
+    journal.append([record])
+    instance.conversation.persisted_seq = record.next_seq
+    return record
+
+
+def test_incremental_append_round_trip():
+    with tempfile.TemporaryDirectory() as tmp:
+        journal = SessionJournal(os.path.join(tmp, "sessions.db"), compact_interval=0)
+        try:
+            instance = LLMInstance("s1_deepseek-chat", "deepseek-chat", rag_collections=["beijing"])
+            instance.conversation.update_system_message("system")
+            instance.conversation.add_user_message("q0")
+            instance.conversation.add_ai_message("a0")
+            assert len(_persist(journal, instance).new_messages) == 2
+
+            instance.conversation.add_user_message("q1")
+            record = _persist(journal, instance)
+            # 系统消息不持久化，第二次只写新增的一条
+            assert [(seq, content) for seq, _, content in record.new_messages] == [(2, "q1")]
+
+            meta = journal.load_session("s1_deepseek-chat")
+            assert meta["session_id"] == "s1" and meta["model_name"] == "deepseek-chat"
+            assert meta["rag_collections"] == ["beijing"]
+            assert meta["base_seq"] == 0 and meta["next_seq"] == 3
+            assert journal.load_messages("s1_deepseek-chat") == [(0, "user", "q0"), (1, "assistant", "a0"), (2, "user", "q1")]
+            assert journal.find_instances("s1") == {"s1_deepseek-chat": meta["updated_at"]}
+        finally:
+            journal.close()
+
+
+def test_evicted_messages_are_hidden_then_compacted():
+    with tempfile.TemporaryDirectory() as tmp:
+        journal = SessionJournal(os.path.join(tmp, "sessions.db"), compact_interval=0)
+        try:
+            instance = LLMInstance("s1_deepseek-chat", "deepseek-chat", max_messages=2)
+            for i in range(2):
+                instance.conversation.add_user_message(f"q{i}")
+                _persist(journal, instance)
+            instance.conversation.add_user_message("q2")
+            _persist(journal, instance)
+
+            # q0 已被淘汰：记录里 base_seq 前移，读取时不再返回
+            assert journal.load_session("s1_deepseek-chat")["base_seq"] == 1
+            assert [content for _, _, content in journal.load_messages("s1_deepseek-chat")] == ["q1", "q2"]
+            assert journal.compact() == 1
+            assert [content for _, _, content in journal.load_messages("s1_deepseek-chat")] == ["q1", "q2"]
+        finally:
+            journal.close()
+
+
+def test_reopen_delete_and_reset():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sessions.db")
+        journal = SessionJournal(path, compact_interval=0)
+        instance = LLMInstance("s1_deepseek-chat", "deepseek-chat")
+        instance.conversation.add_user_message("old")
+        _persist(journal, instance)
+        journal.close()
+
+        journal = SessionJournal(path, compact_interval=0)
+        try:
+            assert journal.load_messages("s1_deepseek-chat") == [(0, "user", "old")]
+            journal.delete("s1_deepseek-chat")
+            assert journal.load_session("s1_deepseek-chat") is None
+            assert journal.load_messages("s1_deepseek-chat") == []
+
+            # 同一ID重建：reset 记录先删除旧消息
+            recreated = LLMInstance("s1_deepseek-chat", "deepseek-chat")
+            recreated.conversation.add_user_message("new")
+            record = SessionRecord.from_instance(recreated)
+            record.reset = True
+            journal.append([record])
+            assert journal.load_messages("s1_deepseek-chat") == [(0, "user", "new")]
+        finally:
+            journal.close()
+
+
+def test_agent_memory_round_trip():
+    with tempfile.TemporaryDirectory() as tmp:
+        journal = SessionJournal(os.path.join(tmp, "sessions.db"), compact_interval=0)
+        try:
+            journal.save_agent_memories([
+                AgentMemoryRecord("s1-map", "s1", "map", 5, [("user", "去天坛"), ("assistant", "好的")]),
+                AgentMemoryRecord("s1-weather", "s1", "weather", 3, [("user", "明天下雨吗")])
+            ])
+            assert journal.load_agent_memory("s1-map") == (5, [("user", "去天坛"), ("assistant", "好的")])
+
+            assert journal.delete_agent_memories("s1", "map") == 1
+            assert journal.load_agent_memory("s1-map") is None
+            assert journal.delete_agent_memories("s1") == 1
+            assert journal.load_agent_memory("s1-weather") is None
+        finally:
+            journal.close()
+
+
+if __name__ == "__main__":
+    test_incremental_append_round_trip()
+    test_evicted_messages_are_hidden_then_compacted()
+    test_reopen_delete_and_reset()
+    test_agent_memory_round_trip()
+    print("会话日志测试通过")
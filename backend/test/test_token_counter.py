@@ -0,0 +1,68 @@
+# 对话 token 计数：本地 tokenizer.json 词表的加载与计数
+
+import os
+import tempfile
+
+from tokenizers import Tokenizer
+from tokenizers.models import WordLevel
+from tokenizers.pre_tokenizers import Whitespace
+
+from backend.config.settings import settings
+from backend.core.llm import token_counter
+from backend.core.llm.token_counter import LocalTokenizerCounter, estimate_tokens, get_token_counter
+
+
+def _write_tokenizer(directory: str):
+    """生成一个小词表的 tokenizer.json（与模型发布的文件格式相同）"""
+    vocab = {"[UNK]": 0, "北京": 1, "南站": 2, "在": 3, "哪里": 4}
+    tokenizer = Tokenizer(WordLevel(vocab, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = Whitespace()
+    os.makedirs(directory, exist_ok=True)
+    tokenizer.save(os.path.join(directory, "tokenizer.json"))
+
+
+def _reset_caches():
+    token_counter._counters.clear()
+    token_counter._model_specs.clear()
+
+
+def test_local_tokenizer_is_loaded_from_model_directory():
+    """LLM_TOKENIZER_DIR/<模型名>/tokenizer.json 存在时使用本地词表计数"""
+    original_dir = settings.LLM_TOKENIZER_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        _write_tokenizer(os.path.join(tmp, "deepseek-chat"))
+        settings.LLM_TOKENIZER_DIR = tmp
+        _reset_caches()
+        try:
+            counter = get_token_counter("deepseek-chat")
+            assert isinstance(counter, LocalTokenizerCounter)
+            assert counter("北京 南站 在 哪里") == 4
+            # 同一模型复用同一个计数函数
+            assert get_token_counter("deepseek-chat") is counter
+            # 没有词表的模型使用配置的分词器（此处为字符数估算）
+            assert get_token_counter("Spark X1") is estimate_tokens
+        finally:
+            settings.LLM_TOKENIZER_DIR = original_dir
+            _reset_caches()
+
+
+def test_missing_local_tokenizer_falls_back_to_estimate():
+    """配置为 local: 但词表文件不存在时退回字符数估算"""
+    original_dir = settings.LLM_TOKENIZER_DIR
+    original_spec = settings.AVAILABLE_LLMS["qwen-max"]["tokenizer"]
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.LLM_TOKENIZER_DIR = tmp
+        settings.AVAILABLE_LLMS["qwen-max"]["tokenizer"] = "local:qwen"
+        _reset_caches()
+        try:
+            assert get_token_counter("qwen-max") is estimate_tokens
+        finally:
+            settings.LLM_TOKENIZER_DIR = original_dir
+            settings.AVAILABLE_LLMS["qwen-max"]["tokenizer"] = original_spec
+            _reset_caches()
+
+
+if __name__ == "__main__":
+    test_local_tokenizer_is_loaded_from_model_directory()
+    test_missing_local_tokenizer_falls_back_to_estimate()
+    print("token 计数测试通过")